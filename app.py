@@ -10,15 +10,21 @@ import time
 import uuid
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from project_manager import ProjectManager
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response
+from project_manager import get_project_manager
+from project_store import read_project_record
 from code_summarizer import CodeSummarizer
+from summary_cache import SummaryCache
+from job_runner import JobRunner
+from scan_journal import ScanJournal
+from file_watcher import watch_project
+from file_scanner import FileScanner, DEFAULT_MATCHER
 from query_handler import QueryHandler
 from modification_handler import ModificationHandler
 from project_config import ollama_client, openai_client, dsv3_client, claude_client, google_client
 
-from utils import format_time, load_json, extract_json
-from constants import DEFAULT_EXCLUDES, CODE_EXTENSIONS
+from utils import format_time, extract_json
+from constants import SYMBOL_SEARCH_LIMIT
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -34,6 +40,12 @@ clients_mapping = {
 
 DEFAULT_LOCAL_STORAGE = './projects'
 
+# Content-addressed file summary cache shared by every project and scan
+summary_cache = SummaryCache()
+
+# Background runner for long jobs such as project summarization
+job_runner = JobRunner()
+
 # --- Helper Functions (init_session, format_datetime, nl2br) ---
 # ... (Keep existing helper functions) ...
 def init_session():
@@ -87,11 +99,9 @@ def home():
     if local_storage_dir.exists():
         for sub in local_storage_dir.iterdir():
             if sub.is_dir():
-                record_file = sub / "project_record.json"
-                if record_file.exists():
+                if (sub / "project.db").exists() or (sub / "project_record.json").exists():
                     try:
-                        with open(record_file, 'r', encoding='utf-8') as f:
-                            record = json.load(f)
+                        record = read_project_record(sub)
                         # Ensure essential keys exist before adding
                         if "project_name" in record and "source_code_path" in record:
                              projects_list.append({
@@ -151,7 +161,7 @@ def create_project():
         print(f"Created local storage directory: {local_storage_path}")
 
         # Initialize ProjectManager - this will create the structure and empty files
-        pm = ProjectManager(str(source_code_path), str(local_storage_path), is_new=True)
+        pm = get_project_manager(str(source_code_path), str(local_storage_path), is_new=True)
         # pm.create_empty_project_structure() # Logic moved into __init__ and _init_project_record
 
         # Store project info in session
@@ -194,7 +204,7 @@ def select_project():
 
         # Load existing project
         try:
-            pm = ProjectManager(source_code_path, local_storage_path)
+            pm = get_project_manager(source_code_path, local_storage_path)
             project_info = pm.get_project_info()
             # Ensure paths are strings for session
             for key, value in project_info.items():
@@ -231,7 +241,7 @@ def select_project():
 
         # Initialize ProjectManager with the full project directory
         try:
-            project_manager = ProjectManager(str(source_path), str(project_dir))
+            project_manager = get_project_manager(str(source_path), str(project_dir))
             source_project_info = project_manager.get_project_info()
             # Ensure paths are strings for session
             for key, value in source_project_info.items():
@@ -251,7 +261,6 @@ def build_file_tree(processable_files):
     Strictly excludes any paths containing DEFAULT_EXCLUDES folders.
     """
     tree = {}
-    excluded_folders = set(DEFAULT_EXCLUDES)
 
     for file_info in processable_files:
         # Ensure relative_path is treated as a string
@@ -264,7 +273,7 @@ def build_file_tree(processable_files):
         parts = relative_path.split('/')
 
         # Skip if any part is in excluded folders
-        if any(part in excluded_folders for part in parts):
+        if DEFAULT_MATCHER.is_excluded_path(relative_path):
             continue
 
         current = tree
@@ -310,6 +319,31 @@ def build_file_tree(processable_files):
 
     return dict_to_list(tree)
 
+def _find_project(source_code_path):
+    """
+    (registered source path, storage dir) of the known project whose source is source_code_path:
+    the session's current project, else a project in the default storage. None if unknown.
+    """
+    resolved = Path(source_code_path).resolve()
+    current = session.get('current_source_project')
+    if current and Path(current.get('source_code_path', '')).resolve() == resolved:
+        return str(current['source_code_path']), str(current['local_storage_path'])
+    project_dir = Path(DEFAULT_LOCAL_STORAGE) / resolved.name
+    record = read_project_record(project_dir) if project_dir.is_dir() else {}
+    if record and Path(record.get("source_code_path", "")).resolve() == resolved:
+        return str(record["source_code_path"]), str(project_dir)
+    return None
+
+def _list_processable_files(source_code_path):
+    """
+    Relative paths of processable files under source_code_path. Uses the project's shared file
+    inventory when the path belongs to a known project, otherwise walks the tree once.
+    """
+    project = _find_project(source_code_path)
+    if project:
+        return get_project_manager(*project).inventory.refresh().paths()
+    return [entry.rel_path for entry in FileScanner(source_code_path).walk()]
+
 @app.route("/list_files", methods=["GET"])
 def list_files():
     source_code_path = request.args.get("source_code_path", "")
@@ -323,25 +357,11 @@ def list_files():
 
     files_list = []
     try:
-        for root, dirs, files in os.walk(source_code_path):
-            # Exclude specified directories
-            dirs[:] = [d for d in dirs if d not in DEFAULT_EXCLUDES]
-            # Filter root path itself if it contains excluded parts (less common, but possible)
-            rel_root = os.path.relpath(root, source_code_path)
-            if any(part in DEFAULT_EXCLUDES for part in Path(rel_root).parts if part != '.'): # Avoid checking '.' part
-                continue
-
-            for file in files:
-                ext = os.path.splitext(file)[1]
-                if ext in CODE_EXTENSIONS:
-                    full_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(full_path, source_code_path).replace('\\', '/')
-                    # Double-check exclusion based on relative path parts
-                    if not any(part in DEFAULT_EXCLUDES for part in Path(relative_path).parts):
-                        files_list.append({
-                            "webkitRelativePath": relative_path, # Use normalized path
-                            "name": file
-                        })
+        for relative_path in _list_processable_files(source_code_path):
+            files_list.append({
+                "webkitRelativePath": relative_path, # Use normalized path
+                "name": os.path.basename(relative_path)
+            })
     except Exception as e:
         print(f"Error walking directory {source_code_path}: {e}")
         return jsonify({"error": f"Error reading directory structure: {e}"}), 500
@@ -356,24 +376,12 @@ def project_files():
         flash("No source project selected", "error")
         return redirect(url_for("home"))
     source_code_path = current_source_project['source_code_path']
-    pm = ProjectManager(source_code_path, current_source_project['local_storage_path'])
+    pm = get_project_manager(source_code_path, current_source_project['local_storage_path'])
     project_record = pm.get_project_record() or {}
 
     # --- Determine which files are currently selected/checked ---
     # Option 1: Use saved file_selection tree if available
-    saved_file_tree = project_record.get("file_selection")
-    checked_files_from_record = set()
-    if isinstance(saved_file_tree, list):
-        def extract_checked(nodes):
-            checked = set()
-            for node in nodes:
-                if isinstance(node, dict):
-                    if node.get("type") == "file" and node.get("checked") and node.get("relative_path"):
-                        checked.add(str(node["relative_path"]).replace('\\', '/'))
-                    elif node.get("type") == "folder":
-                        checked.update(extract_checked(node.get("children", [])))
-            return checked
-        checked_files_from_record = extract_checked(saved_file_tree)
+    checked_files_from_record = pm.get_selected_files()
 
     # Option 2: Fallback or default - assume all non-excluded files are checked initially
     # Let's use the saved state primarily. If no saved state, default to checking all valid files.
@@ -386,25 +394,13 @@ def project_files():
          return redirect(url_for("project_dashboard"))
 
     try:
-        for root, dirs, files in os.walk(source_code_path):
-            dirs[:] = [d for d in dirs if d not in DEFAULT_EXCLUDES]
-            rel_root = os.path.relpath(root, source_code_path)
-            if any(part in DEFAULT_EXCLUDES for part in Path(rel_root).parts if part != '.'):
-                continue
-
-            for file in files:
-                ext = os.path.splitext(file)[1]
-                if ext in CODE_EXTENSIONS:
-                    full_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(full_path, source_code_path).replace('\\', '/')
-
-                    if not any(part in DEFAULT_EXCLUDES for part in Path(relative_path).parts):
-                        # Determine checked status: use saved record if available, else default to True
-                        is_checked = (relative_path in checked_files_from_record) if checked_files_from_record else True
-                        processable_files_info.append({
-                            "relative_path": relative_path,
-                            "checked": is_checked
-                        })
+        for relative_path in pm.inventory.refresh().paths():
+            # Determine checked status: use saved record if available, else default to True
+            is_checked = (relative_path in checked_files_from_record) if checked_files_from_record else True
+            processable_files_info.append({
+                "relative_path": relative_path,
+                "checked": is_checked
+            })
     except Exception as e:
          flash(f"Error reading project files: {e}", "error")
          # Render template with empty tree or redirect?
@@ -427,7 +423,7 @@ def update_file_selection():
          flash("No source project selected", "error")
          return redirect(url_for("home"))
 
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
     selected_files_paths = set(request.form.getlist("selected_files")) # Get paths of checked files
 
     # Regenerate the list of all potentially processable files to compare against
@@ -438,23 +434,12 @@ def update_file_selection():
          return redirect(url_for("project_dashboard"))
 
     try:
-        for root, dirs, files in os.walk(current_source_project['source_code_path']):
-            dirs[:] = [d for d in dirs if d not in DEFAULT_EXCLUDES]
-            rel_root = os.path.relpath(root, current_source_project['source_code_path'])
-            if any(part in DEFAULT_EXCLUDES for part in Path(rel_root).parts if part != '.'):
-                continue
-
-            for file in files:
-                ext = os.path.splitext(file)[1]
-                if ext in CODE_EXTENSIONS:
-                    full_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(full_path, current_source_project['source_code_path']).replace('\\', '/')
-                    if not any(part in DEFAULT_EXCLUDES for part in Path(relative_path).parts):
-                         all_processable_files.append({
-                             "relative_path": relative_path,
-                             # Mark as checked if it was submitted in the form
-                             "checked": (relative_path in selected_files_paths)
-                         })
+        for relative_path in pm.inventory.refresh().paths():
+            all_processable_files.append({
+                "relative_path": relative_path,
+                # Mark as checked if it was submitted in the form
+                "checked": (relative_path in selected_files_paths)
+            })
     except Exception as e:
         flash(f"Error reading project files during update: {e}", "error")
         return redirect(url_for("project_dashboard"))
@@ -485,7 +470,9 @@ def project_dashboard():
     try:
         source_code_path = str(current_source_project['source_code_path'])
         local_storage_path = str(current_source_project['local_storage_path'])
-        pm = ProjectManager(source_code_path, local_storage_path)
+        pm = get_project_manager(source_code_path, local_storage_path)
+        # Keep a dirty-file set for this project so status checks don't walk the whole tree
+        watch_project(source_code_path, pm.output_dir)
     except Exception as e:
         flash(f"Error initializing project: {e}", "error")
         session.pop('current_source_project', None)
@@ -495,6 +482,7 @@ def project_dashboard():
         # --- Handle Query Submission from Dashboard ---
         input_query = request.form.get("input_query", "").strip()
         client_type = request.form.get("client_type", "openai")
+        use_cache = not request.form.get("bypass_cache")  # Checkbox: always ask the model
 
         if not input_query:
             flash("Query cannot be empty.", "warning")
@@ -509,7 +497,7 @@ def project_dashboard():
 
         try:
             # process_query now returns (query_id, trigger_code_generation)
-            query_id, trigger_code_generation = qh.process_query(input_query, client_type)
+            query_id, trigger_code_generation = qh.process_query(input_query, client_type, use_cache=use_cache)
 
             if query_id and trigger_code_generation:
                 # New project structure defined, redirect to /modify route
@@ -540,13 +528,14 @@ def project_dashboard():
     # --- Handle GET Request (remains the same) ---
     summary_status = pm.get_summary_status()
     query_history = pm.load_query_history()
-    summary_data = {}
-    if pm.combined_json_path.exists():
-        summary_data = load_json(str(pm.combined_json_path)) or {}
+    summary_data = pm.load_combined_summary() or {}
+    recent_jobs = job_runner.jobs_for(local_storage_path)
+    latest_job = recent_jobs[0].to_dict() if recent_jobs else None
 
     return render_template("project_dashboard.html",
                            source_project=current_source_project,
                            summary_status=summary_status,
+                           latest_job=latest_job,
                            query_history=query_history,
                            summary=summary_data,
                            available_clients=list(clients_mapping.keys()))
@@ -562,7 +551,7 @@ def modify_files(query_id):
         flash("No source project selected", "error")
         return redirect(url_for("home"))
 
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
 
     # Determine client_type based on method
     if request.method == "POST":
@@ -627,8 +616,9 @@ def refresh_project():
     if not current_source_project:
          flash("No source project selected", "error")
          return redirect(url_for("home"))
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
-    modified_files = pm.get_modified_files()  # This updates file_hashes.json and returns list.
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    full_hash = request.form.get("full_hash", "false") == "true" # Re-hash every file instead of trusting stat
+    modified_files = pm.get_modified_files(full_hash=full_hash)  # This updates file_hashes.json and returns list.
     if modified_files:
          flash(f"{len(modified_files)} file(s) changed since last check. Consider updating summaries.", "info")
     else:
@@ -643,12 +633,12 @@ def combined_summary():
     if not current_source_project:
         flash("No source project selected", "error")
         return redirect(url_for("home")) # Redirect home if no project
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
     if not pm.combined_json_path.exists():
         flash("Combined summary file not found.", "warning")
         return redirect(url_for("project_dashboard")) # Redirect dashboard if no summary
     try:
-        summary_data = load_json(str(pm.combined_json_path))
+        summary_data = pm.load_combined_summary()
         if not summary_data:
              # Allow viewing empty summary for new projects
              summary_data = {"project_name": pm.project_name, "files": {}, "project_summary": "Project is empty or not summarized."}
@@ -680,20 +670,38 @@ def summarize_project():
         client = clients_mapping.get("openai") # Fallback explicitly
         client_type = "openai" # Update type for flashing message
 
-    # Initialize Summarizer with the selected client
-    summarizer = CodeSummarizer(api_key=None, # API key managed by client instances
-                                ollama_client=client # Pass the selected client
-                                # fallout_client=... # Define fallback if needed by Summarizer
-                               )
-    pm = ProjectManager(source_code_path, local_storage_path)
-
     # Check if source path exists before summarizing
     if not Path(source_code_path).is_dir():
         flash(f"Source code directory '{source_code_path}' not found. Cannot summarize.", "error")
         return redirect(url_for("project_dashboard"))
 
+    active = job_runner.active_job(local_storage_path)
+    if active:
+        flash(f"A summarization job is already running for this project (job {active.id[:8]}).", "warning")
+        return redirect(url_for("project_dashboard"))
+
+    # The scan runs in the background; the dashboard polls /jobs/<job_id> for progress.
+    job = job_runner.submit(
+        local_storage_path,
+        f"{'Update modified summaries' if only_modified else 'Full summarization'} using {client_type}",
+        lambda job: run_summarization(job, source_code_path, local_storage_path, client, client_type, only_modified)
+    )
+    flash(f"Summarization started in the background using {client_type} (job {job.id[:8]}).", "info")
+    return redirect(url_for("project_dashboard"))
+
+
+def run_summarization(job, source_code_path, local_storage_path, client, client_type, only_modified):
+    """Background job body for /summarize_project. Messages go to job.log instead of flash()."""
+    # Initialize Summarizer with the selected client
+    summarizer = CodeSummarizer(api_key=None, # API key managed by client instances
+                                ollama_client=client, # Pass the selected client
+                                # fallout_client=... # Define fallback if needed by Summarizer
+                                summary_cache=summary_cache
+                               )
+    pm = get_project_manager(source_code_path, local_storage_path)
+
     start_time = time.time()
-    flash(f"Starting source code summarization using {client_type} at {format_time(start_time)}...", "info")
+    job.log(f"Starting source code summarization using {client_type} at {format_time(start_time)}...")
     # Update project status immediately
     pm.update_project_record({"status": "summarizing", "last_summary_start": datetime.now().isoformat()})
 
@@ -709,9 +717,10 @@ def summarize_project():
                 status_category = "info"
                 pm.update_project_record({"status": "summarized"}) # Mark as summarized if no changes
             else:
-                flash(f"Updating summaries for {len(modified_files)} modified file(s)...", "info")
+                job.log(f"Updating summaries for {len(modified_files)} modified file(s)...")
                 # update_modified_summaries handles saving and project summary refresh
-                results = pm.update_modified_summaries(modified_files, summarizer)
+                results = pm.update_modified_summaries(modified_files, summarizer,
+                                                       progress_callback=job.advance, cancel_event=job.cancel_event)
                 if results is None: # Check if update failed internally
                      status_message = "Attempted to update summaries, but process failed or yielded no results. Check logs."
                      status_category = "error"
@@ -719,7 +728,9 @@ def summarize_project():
                 # else: results were generated, success message below
 
         else: # Full scan requested
-            flash("Performing full project summarization...", "info")
+            job.log("Performing full project summarization...")
+            # The journal lets a scan interrupted by a crash, deploy or cancel resume where it stopped
+            journal = ScanJournal(pm.scan_journal_path)
             project_record = pm.get_project_record() or {}
             selected_files = []
             # Extract selected files from project record's file_selection tree
@@ -742,24 +753,37 @@ def summarize_project():
             source_is_empty = not any(Path(source_code_path).iterdir())
             if not selected_files or source_is_empty:
                  if source_is_empty:
-                      flash("Source directory is empty. Generating empty summary.", "info")
+                      job.log("Source directory is empty. Generating empty summary.")
                  elif not selected_files:
-                      flash("No files explicitly selected in project settings. Summarizing all detected code files based on extensions/exclusions.", "warning")
+                      job.log("No files explicitly selected in project settings. Summarizing all detected code files based on extensions/exclusions.", "warning")
 
-                 # scan_project generates file summaries and project summary
-                 results = summarizer.scan_project(source_code_path, output_dir=pm.summaries_dir)
+                 # scan_project generates file summaries; the project summary is produced once by combine_summaries below
+                 results = summarizer.scan_project(source_code_path, output_dir=pm.summaries_dir, with_project_summary=False,
+                                                   progress_callback=job.advance, cancel_event=job.cancel_event,
+                                                   journal=journal)
             else:
-                 flash(f"Summarizing {len(selected_files)} selected files...", "info")
-                 # scan_specific_files generates file summaries and project summary for the selection
-                 results = summarizer.scan_specific_files(source_code_path, selected_files, output_dir=pm.summaries_dir)
+                 job.log(f"Summarizing {len(selected_files)} selected files...")
+                 # scan_specific_files generates file summaries for the selection; combine_summaries adds the project summary
+                 results = summarizer.scan_specific_files(source_code_path, selected_files, output_dir=pm.summaries_dir,
+                                                          with_project_summary=False,
+                                                          progress_callback=job.advance, cancel_event=job.cancel_event,
+                                                          journal=journal)
+
+            failed = (results or {}).get("failed") or []
+            for failure in failed:
+                job.log(f"Failed to summarize {failure['path']}: {failure['error']}", "error")
 
             # Save results from full scan or specific files scan
             # update_modified_summaries saves internally, so only save here for full/specific scans
             if results is not None and not only_modified:
                  # pm.save_results(results) # save_results updated hashes, combined summary, project record
                  # Refactored: scan methods now save individual summaries. Need to combine and update record.
+                 job.check_cancelled()
+                 job.log("Generating project-level summary...")
                  pm.combine_summaries(summarizer) # Pass summarizer to generate project summary during combine
                  pm.update_file_hashes() # Update hashes based on current files
+                 pm.record_summarized_commit() # Base of the next git-based change check
+                 journal.complete()
                  pm.update_project_record({ # Update record after successful full/specific scan
                      "status": "summarized",
                      "last_summary_end": datetime.now().isoformat(),
@@ -779,6 +803,10 @@ def summarize_project():
         if results is not None: # Covers both modified and full/specific scans that yielded results
             status_message = f"Source code summarization/update completed in {elapsed:.2f} seconds using {client_type}."
             status_category = "success"
+            failed = results.get("failed") or []
+            if failed:
+                status_message += f" {len(failed)} file(s) could not be summarized (see the errors above)."
+                status_category = "warning"
             # Project record update for 'summarized' status happens within update_modified_summaries or above for full scan
         elif status_category != "error" and not only_modified: # If full/specific scan yielded no results (and wasn't an error reported above)
             status_message = "Summarization process finished but did not produce results (perhaps no code files found or selected?)."
@@ -787,26 +815,106 @@ def summarize_project():
             pm.update_project_record({"status": "summarized", "file_count": 0, "total_lines": 0})
         elif status_category == "info": # Case where only_modified=True and no files were modified
              pass # Message already set
-        # else: # Catch-all if no message set yet (shouldn't happen ideally)
-        #      status_message = f"Summarization process finished in {elapsed:.2f} seconds, but outcome unclear."
-        #      status_category = "warning"
 
     except Exception as e:
         elapsed = time.time() - start_time
+        if job.cancel_event.is_set():
+            # Summaries finished before the cancel are kept in summaries_dir; the project just needs an update
+            pm.update_project_record({"status": "needs_update", "last_summary_end": datetime.now().isoformat()})
+            raise
         status_message = f"An error occurred during summarization after {elapsed:.2f} seconds: {str(e)}"
         status_category = "error"
         print(f"Summarization Error: {e}") # Log the full error
-        # import traceback; traceback.print_exc() # For detailed debugging
         # Update project record status to error
         try:
              pm.update_project_record({"status": "error", "last_summary_end": datetime.now().isoformat()})
         except Exception as update_err:
              print(f"Failed to update project record status after error: {update_err}")
 
-    flash(status_message, status_category)
+    job.log(status_message, status_category)
+    return {"status": status_category, "message": status_message}
+
+
+# --- Background job progress API ---
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    """Lists the current project's summarization jobs, newest first."""
+    current_source_project = session.get('current_source_project')
+    if not current_source_project:
+        return jsonify({"error": "No project selected"}), 400
+    jobs = job_runner.jobs_for(current_source_project['local_storage_path'])
+    return jsonify([job.to_dict() for job in jobs])
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_runner.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-sent events stream of job progress; closes once the job finishes."""
+    job = job_runner.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    def stream():
+        last_payload = None
+        while True:
+            payload = json.dumps(job.to_dict())
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+            if job.finished:
+                break
+            time.sleep(1)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    current_source_project = session.get('current_source_project')
+    # Only the current project's jobs can be cancelled from this session
+    cancelled = bool(current_source_project) and job_runner.cancel(job_id, current_source_project['local_storage_path'])
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({"success": cancelled}), 200 if cancelled else 404
+    flash("Cancellation requested." if cancelled else "Job not found or already finished.", "info" if cancelled else "warning")
     return redirect(url_for("project_dashboard"))
 
 
+# --- Symbol lookup API ---
+@app.route("/symbols", methods=["GET"])
+def symbols():
+    """
+    Definitions (and optionally usages) of a symbol in the current project, from the local symbol
+    index: ?q=<name or prefix>[&kind=function|class|method|type|constant|route|selector|id|block]
+    [&exact=1][&usages=1][&limit=N]. No LLM is involved.
+    """
+    current_source_project = session.get('current_source_project')
+    if not current_source_project:
+        return jsonify({"error": "No project selected"}), 400
+    name = request.args.get("q", "").strip()
+    if not name:
+        return jsonify({"error": "No symbol given (q parameter)"}), 400
+    kind = request.args.get("kind") or None
+    limit = request.args.get("limit", type=int) or SYMBOL_SEARCH_LIMIT
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    try:
+        index = pm.symbol_index.refresh()
+    except Exception as e:
+        return jsonify({"error": f"Error building the symbol index: {e}"}), 500
+    exact = request.args.get("exact") in ("1", "true")
+    definitions = index.definitions(name, kind, limit) if exact else index.search(name, kind, limit)
+    result = {"query": name, "definitions": definitions}
+    if request.args.get("usages") in ("1", "true"):
+        result["usages"] = index.usages(name.rsplit(".", 1)[-1].lstrip("#"), limit)
+    return jsonify(result)
+
+
 # --- Routes (query, query_detail, delete_query) ---
 # ... (Keep existing routes, assuming they are correct) ...
 @app.route("/query", methods=["GET", "POST"])
@@ -817,7 +925,7 @@ def query():
         flash("No source project selected", "error")
         return redirect(url_for("home"))
 
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
 
     # MODIFICATION: Allow querying even if no summary exists (for new projects)
     # if not pm.has_summary():
@@ -827,6 +935,7 @@ def query():
     if request.method == "POST":
         input_query = request.form.get("input_query", "")
         client_type = request.form.get("client_type", "openai")
+        use_cache = not request.form.get("bypass_cache")  # Checkbox: always ask the model
 
         if not input_query:
             flash("Query cannot be empty.", "warning")
@@ -838,7 +947,7 @@ def query():
 
         qh = QueryHandler(pm, clients_mapping)
         try:
-            query_id = qh.process_query(input_query, client_type)
+            query_id = qh.process_query(input_query, client_type, use_cache=use_cache)
             if query_id:
                 flash("Query processed. Review the details below.", "info")
                 return redirect(url_for("query_detail", query_id=query_id))
@@ -867,14 +976,13 @@ def query_detail(query_id):
         return redirect(url_for("home"))
 
     try:
-        pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+        pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
         history = pm.load_query_history() # Expecting a list of dictionaries
     except Exception as e:
         flash(f"Error loading project data: {e}", "error")
         return redirect(url_for("project_dashboard")) # Or url_for("home")
 
-    # Find the dictionary entry using .get() for safer key access
-    entry = next((item for item in history if item.get("id") == query_id), None)
+    entry = pm.get_query(query_id)
 
     if not entry:
         flash(f"Query with ID '{query_id}' not found in history.", "warning")
@@ -903,7 +1011,7 @@ def delete_query(query_id):
             return jsonify({"error": "No project selected"}), 400
         return redirect(url_for("home"))
 
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
     deleted = pm.delete_query(query_id) # Assume returns True if deleted, False otherwise
 
     if deleted:
@@ -938,8 +1046,8 @@ def generate_modifications(query_id):
         session.modified = True
         return redirect(url_for("query_detail", query_id=query_id))
     print("Here 3")
-    pm = ProjectManager(current_source_project['source_code_path'],
-                        current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'],
+                             current_source_project['local_storage_path'])
     mod_handler = ModificationHandler(pm, clients_mapping)
     print("Here 4")
     # Process modifications; this calls the LLM and generates a preview (with diffs for both old and new files)
@@ -957,6 +1065,7 @@ def generate_modifications(query_id):
     # Update session small data with LLM details
     small_session_data['llm_response'] = result.get('llm_response', '')
     small_session_data['llm_response_time'] = result.get('llm_response_time', 0)
+    small_session_data['llm_usage'] = result.get('llm_usage')
     session["modification_data"] = small_session_data  # Save back under the same key
     session.modified = True
     print("Here 7")
@@ -997,8 +1106,8 @@ def accept_modifications(query_id):
         return redirect(url_for("query_detail", query_id=query_id))
 
     # Instead of retrieving the modifications JSON from the form, load it from the stored file.
-    pm = ProjectManager(current_source_project['source_code_path'],
-                        current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'],
+                             current_source_project['local_storage_path'])
     proposed_modifications_dir = pm.output_dir / "proposed_modifications"
     proposed_modifications_file = proposed_modifications_dir / f"{query_id}.json"
     
@@ -1084,7 +1193,7 @@ def cancel_modification(query_id):
 
     if temp_id and current_source_project:
         try:
-            pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+            pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
             mod_handler = ModificationHandler(pm, clients_mapping)
 
             # Clean up temp prompt file associated with the session temp_id
@@ -1122,7 +1231,7 @@ def modifications_list():
     if not current_source_project:
         flash("No source project selected", "error")
         return redirect(url_for("home"))
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
     modifications = pm.load_modifications_history() # Expecting list sorted newest first?
     return render_template("modifications.html", modifications=modifications, source_project=current_source_project)
 
@@ -1133,9 +1242,8 @@ def modification_detail(modification_id):
     if not current_source_project:
         flash("No source project selected", "error")
         return redirect(url_for("home"))
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
-    modifications = pm.load_modifications_history()
-    modification = next((item for item in modifications if item.get("id") == modification_id), None)
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    modification = pm.get_modification(modification_id)
 
     if not modification:
         flash("Modification record not found", "error")
@@ -1145,8 +1253,7 @@ def modification_detail(modification_id):
     query = None
     query_id = modification.get("query_id")
     if query_id:
-        history = pm.load_query_history()
-        query = next((item for item in history if item.get("id") == query_id), None)
+        query = pm.get_query(query_id)
 
     # Enhancement: Load diffs for display if not stored directly
     # This might involve ModificationHandler having a method to regenerate diffs from backups
@@ -1175,7 +1282,7 @@ def revert_file(modification_id, file_path):
         flash("No source project selected", "error")
         return redirect(url_for("home"))
 
-    pm = ProjectManager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
+    pm = get_project_manager(current_source_project['source_code_path'], current_source_project['local_storage_path'])
     # Pass mappings if handler needs client info, though likely not for revert
     mod_handler = ModificationHandler(pm, clients_mapping)
     success = mod_handler.revert_file(modification_id, file_path)
@@ -0,0 +1,149 @@
+# bm25_index.py
+
+import re
+import math
+import hashlib
+import threading
+from collections import Counter
+from pathlib import Path
+from utils import load_json, save_json
+from constants import BM25_K1, BM25_B, BM25_MAX_SOURCE_BYTES
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in into is it its of on or that the this to was were
+will with which file files code function functions class classes module uses used use using
+""".split())
+
+# Field weights: each term occurrence counts this many times in the document
+_FIELD_WEIGHTS = (("path", 3), ("concise", 2), ("detailed", 1), ("identifiers", 1))
+_MAX_IDENTIFIER_COUNT = 3  # An identifier repeated all over a file still counts at most this often
+
+
+def _normalize(word):
+    word = word.lower()
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]  # Crude plural folding: 'files' ~ 'file'
+    return word
+
+
+def tokenize(text):
+    """Lowercased terms; snake_case and camelCase words also yield their parts."""
+    terms = []
+    for word in _WORD_RE.findall(text or ""):
+        parts = [p for p in re.split(r"_+", word) if p]
+        sub = [piece for part in parts for piece in _CAMEL_RE.findall(part)]
+        for term in ([word] if len(sub) > 1 else []) + sub:
+            term = _normalize(term)
+            if len(term) > 1 and term not in _STOPWORDS:
+                terms.append(term)
+    return terms
+
+
+class BM25Index:
+    """
+    Lexical (BM25) index over a project's summarized files, stored in bm25_index.json. Each file
+    is one document made of its path, concise and detailed summaries and the identifiers in its
+    source, weighted by field. Documents are re-tokenized only when their summaries or source
+    stat change. Postings are rebuilt in memory on load, so search() touches only the
+    documents containing a query term.
+    """
+
+    def __init__(self, output_dir, source_path):
+        self.path = Path(output_dir) / "bm25_index.json"
+        self.source_path = Path(source_path)
+        self._lock = threading.RLock()
+        self._docs = None  # rel_path -> {"key", "length", "tf": {term: count}}
+        self._version = None  # combined_code_summary.json version the index was built from
+        self._postings = {}  # term -> {rel_path: tf}
+        self._avg_length = 0.0
+
+    # --- Building ---
+    def _load(self):
+        if self._docs is None:
+            data = load_json(self.path) or {}
+            self._docs = data.get("docs", {}) if isinstance(data.get("docs"), dict) else {}
+            version = data.get("version")
+            self._version = tuple(version) if isinstance(version, list) else None
+            self._build_postings()
+
+    def _build_postings(self):
+        self._postings = {}
+        for rel, doc in self._docs.items():
+            for term, count in doc["tf"].items():
+                self._postings.setdefault(term, {})[rel] = count
+        self._avg_length = sum(doc["length"] for doc in self._docs.values()) / len(self._docs) if self._docs else 0.0
+
+    def _source_stat(self, rel):
+        try:
+            st = (self.source_path / rel).stat()
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def _identifiers(self, rel, stat):
+        if stat is None or stat[0] > BM25_MAX_SOURCE_BYTES:
+            return ""
+        try:
+            text = (self.source_path / rel).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return ""
+        counts = Counter(word for word in _WORD_RE.findall(text) if len(word) > 2 and not word.isdigit())
+        return " ".join(" ".join([word] * min(count, _MAX_IDENTIFIER_COUNT)) for word, count in counts.items())
+
+    def update(self, combined, version=None):
+        """Re-indexes the entries of a combined summary whose summaries or source changed."""
+        with self._lock:
+            self._load()
+            files = combined.get("files", {}) if isinstance(combined, dict) else {}
+            changed = False
+            for rel in [rel for rel in self._docs if rel not in files]:
+                del self._docs[rel]
+                changed = True
+            for rel, data in files.items():
+                data = data if isinstance(data, dict) else {}
+                stat = self._source_stat(rel)
+                fields = {"path": rel, "concise": data.get("concise_summary", ""),
+                          "detailed": data.get("detailed_summary", "")}
+                key = hashlib.sha1(repr((fields["concise"], fields["detailed"], stat)).encode("utf-8")).hexdigest()
+                if self._docs.get(rel, {}).get("key") == key:
+                    continue
+                fields["identifiers"] = self._identifiers(rel, stat)
+                tf = Counter()
+                for field, weight in _FIELD_WEIGHTS:
+                    for term in tokenize(fields[field]):
+                        tf[term] += weight
+                self._docs[rel] = {"key": key, "length": sum(tf.values()), "tf": dict(tf)}
+                changed = True
+            if changed:
+                self._build_postings()
+            if changed or version != self._version:
+                self._version = version
+                save_json({"version": list(version) if version else None, "docs": self._docs}, self.path)
+            return self
+
+    def ensure(self, combined, version):
+        """Updates the index only if it was built from another version of the combined summary."""
+        with self._lock:
+            self._load()
+            if version is None or version != self._version:
+                self.update(combined, version)
+            return self
+
+    # --- Searching ---
+    def search(self, query, limit=None):
+        """Returns [(rel_path, score)] of the documents matching the query, best first."""
+        with self._lock:
+            self._load()
+            total = len(self._docs)
+            scores = Counter()
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for rel, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[rel]["length"] / (self._avg_length or 1))
+                    scores[rel] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores.most_common(limit)
@@ -3,34 +3,89 @@
 import os
 import re
 import time
+import difflib
+import hashlib
+import posixpath
+import threading
 import concurrent.futures
 from datetime import datetime
 from pathlib import Path
-from constants import COMBINED_FILE_PROMPT, PROJECT_SUMMARY_PROMPT, AGGREGATED_SUMMARY_PROMPT, DEFAULT_EXCLUDES, CODE_EXTENSIONS
-from utils import format_time, safe_filename
+from constants import COMBINED_FILE_PROMPT, PROJECT_SUMMARY_PROMPT, AGGREGATED_SUMMARY_PROMPT, DEFAULT_EXCLUDES, \
+    SUMMARY_WORKERS, DEFAULT_SUMMARY_WORKERS, DIRECTORY_SUMMARY_PROMPT, HIERARCHICAL_SUMMARY_MIN_FILES, \
+    PROJECT_SUMMARY_TOKEN_BUDGET, DIRECTORY_ROLLUP_MIN_TOKENS, LLM_CALL_WORKERS, LLM_ABANDON_GRACE_SECONDS, \
+    INCREMENTAL_FILE_PROMPT, INCREMENTAL_SUMMARY_ENABLED, INCREMENTAL_SUMMARY_MIN_LINES, INCREMENTAL_SUMMARY_MAX_CHURN, \
+    INCREMENTAL_SUMMARY_CONTEXT_LINES
+from utils import format_time, safe_filename, load_json, save_json, estimate_tokens
+from scan_journal import content_hash
+from file_scanner import ExclusionMatcher, FileScanner
 import json
 
 
+class ScanCancelled(Exception):
+    """Raised when a scan's cancel_event is set."""
+
+
+# Long-lived pool for deadline-bounded LLM calls. When a call misses its deadline the caller
+# returns right away and the call is abandoned; its thread finishes in the background (bounded
+# by the request timeout passed to the client) and its eventual duration is recorded.
+_llm_executor = concurrent.futures.ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS, thread_name_prefix="llm-call")
+_abandoned_lock = threading.Lock()
+_abandoned_stats = {"abandoned": 0, "in_flight": 0, "finished": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+def _track_abandoned(future, started, deadline):
+    with _abandoned_lock:
+        _abandoned_stats["abandoned"] += 1
+        _abandoned_stats["in_flight"] += 1
+
+    def _on_done(_):
+        elapsed = time.monotonic() - started
+        with _abandoned_lock:
+            _abandoned_stats["in_flight"] -= 1
+            _abandoned_stats["finished"] += 1
+            _abandoned_stats["total_seconds"] += elapsed
+            _abandoned_stats["max_seconds"] = max(_abandoned_stats["max_seconds"], elapsed)
+        print(f"Abandoned LLM call finished after {elapsed:.1f}s (deadline was {deadline}s)")
+
+    future.add_done_callback(_on_done)
+
+
+def get_abandoned_call_stats():
+    """Returns counters for LLM calls abandoned at their deadline, including how long they really took."""
+    with _abandoned_lock:
+        stats = dict(_abandoned_stats)
+    stats["avg_seconds"] = round(stats["total_seconds"] / stats["finished"], 2) if stats["finished"] else 0.0
+    return stats
+
+
 class CodeSummarizer:
-    def __init__(self, api_key, exclude_dirs=None, max_file_size=1_000_000, ollama_client=None, fallout_client=None):
+    def __init__(self, api_key, exclude_dirs=None, max_file_size=1_000_000, ollama_client=None, fallout_client=None,
+                 max_workers=None, summary_cache=None, hierarchical=None):
         self.api_key = api_key
         self.exclude_dirs = exclude_dirs or DEFAULT_EXCLUDES
+        self.matcher = ExclusionMatcher(self.exclude_dirs) # Compiled once, shared by every directory check
         self.max_file_size = max_file_size
         self.ollama_client = ollama_client
         self.fallout_client = fallout_client
+        self.max_workers = max_workers  # None -> use SUMMARY_WORKERS for the client's service
+        self.summary_cache = summary_cache  # Optional SummaryCache shared across scans/projects
+        self.hierarchical = hierarchical  # True/False forces the project summary mode; None picks by size
+
+    def get_max_workers(self):
+        """Number of files to summarize concurrently for the configured client."""
+        if self.max_workers:
+            return max(1, int(self.max_workers))
+        service = getattr(self.ollama_client, "llm_service", None)
+        return SUMMARY_WORKERS.get(service, DEFAULT_SUMMARY_WORKERS)
 
     def should_skip_directory(self, dir_path):
-        dir_name = os.path.basename(dir_path)
-        return any(
-            re.match(pattern.replace("*", ".*"), dir_name) if "*" in pattern else dir_name == pattern
-            for pattern in self.exclude_dirs
-        )
-
-    def should_process_file(self, file_path):
-        if not any(file_path.endswith(ext) for ext in CODE_EXTENSIONS):
+        return self.matcher.is_excluded_name(os.path.basename(dir_path))
+
+    def should_process_file(self, file_path, size=None):
+        if not self.matcher.has_code_extension(file_path):
             return False
         try:
-            if os.path.getsize(file_path) > self.max_file_size:
+            if (size if size is not None else os.path.getsize(file_path)) > self.max_file_size:
                 print(f"Skipping {file_path} (too large)")
                 return False
         except OSError:
@@ -45,15 +100,30 @@ class CodeSummarizer:
             print(f"Error reading {file_path}: {e}")
             return None
 
+    @staticmethod
+    def call_with_deadline(client, prompt, timeout):
+        """
+        Runs client.get_response on the shared call pool and returns its result, raising
+        concurrent.futures.TimeoutError as soon as `timeout` seconds pass. The underlying
+        request is abandoned rather than waited for, and is also given a transport-level
+        timeout so its thread does not stay blocked forever.
+        """
+        started = time.monotonic()
+        future = _llm_executor.submit(client.get_response, prompt, timeout + LLM_ABANDON_GRACE_SECONDS)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            if not future.cancel():  # Already running; let it finish in the background
+                _track_abandoned(future, started, timeout)
+            raise
+
     def get_llm_response_with_timeout(self, prompt, timeout=120, max_retries=2):
         ollama_error = None
         for attempt in range(max_retries):
             try:
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(self.ollama_client.get_response, prompt)
-                    response = future.result(timeout=timeout)
-                    response = re.sub(r'<thought>.*?</thought>', '', response, flags=re.DOTALL)
-                    return response
+                response = self.call_with_deadline(self.ollama_client, prompt, timeout)
+                response = re.sub(r'<thought>.*?</thought>', '', response, flags=re.DOTALL)
+                return response
             except concurrent.futures.TimeoutError:
                 print(f"Response timed out on attempt {attempt+1}/{max_retries}")
                 ollama_error = "Timeout"
@@ -64,16 +134,18 @@ class CodeSummarizer:
                 time.sleep(2)
         print("Falling back to fallout_client.")
         try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(self.fallout_client.get_response, prompt)
-                response = future.result(timeout=timeout)
-                response = re.sub(r'<thought>.*?</thought>', '', response, flags=re.DOTALL)
-                return response
+            if self.fallout_client is None:
+                raise ValueError("No fallback client configured")
+            response = self.call_with_deadline(self.fallout_client, prompt, timeout)
+            response = re.sub(r'<thought>.*?</thought>', '', response, flags=re.DOTALL)
+            return response
         except Exception as e:
             print(f"Error calling fallout_client API: {e}")
         return f"Error: Failed to get response after multiple attempts. Last error: {ollama_error}"
 
     def parse_combined_summary(self, response):
+        if isinstance(response, str) and response.startswith("Error"):
+            return response, "Error summarizing file."  # Failed LLM call: keep its message
         detailed_pattern = r'<detailed>(.*?)</detailed>'
         concise_pattern = r'<concise>(.*?)</concise>'
         detailed_match = re.search(detailed_pattern, response, re.DOTALL)
@@ -82,173 +154,430 @@ class CodeSummarizer:
         concise_summary = concise_match.group(1).strip() if concise_match else "Error: No concise summary found"
         return detailed_summary, concise_summary
 
+    def get_model_name(self):
+        """Identifies the primary model, e.g. 'openai:gpt-4o-mini', for cache keys."""
+        client = self.ollama_client
+        return f"{getattr(client, 'llm_service', 'unknown')}:{getattr(client, 'model_name', 'unknown')}"
+
     def summarize_file_combined(self, code, file_path):
+        cache_key = None
+        if self.summary_cache is not None:
+            cache_key = self.summary_cache.make_key(code, file_path, self.get_model_name())
+            cached = self.summary_cache.get(cache_key)
+            if cached is not None:
+                print(f"Summary cache hit for {file_path}")
+                return cached
         prompt = COMBINED_FILE_PROMPT.format(file_path=file_path, file_type=os.path.splitext(file_path)[1], code=code)
         response = self.get_llm_response_with_timeout(prompt)
-        return self.parse_combined_summary(response)
+        detailed, concise = self.parse_combined_summary(response)
+        if cache_key is not None:
+            self.summary_cache.put(cache_key, detailed, concise, model_name=self.get_model_name())
+        return detailed, concise
+
+    def summarize_file_incremental(self, code, file_path, previous_code, previous_detailed, previous_concise):
+        """
+        Revises a file's previous summaries from a unified diff between previous_code (the content
+        they were made from) and code, with INCREMENTAL_FILE_PROMPT. Returns (detailed, concise), or
+        None when a full summarize_file_combined is needed instead: the file is small, more than
+        INCREMENTAL_SUMMARY_MAX_CHURN of its lines changed, or the model's answer is unusable.
+        """
+        if not INCREMENTAL_SUMMARY_ENABLED or previous_code is None:
+            return None
+        if not previous_detailed or not previous_concise or previous_concise.startswith("Error"):
+            return None
+        if code == previous_code:
+            return previous_detailed, previous_concise
+        cache_key = None
+        if self.summary_cache is not None:
+            # A full summary of this exact content is preferred over any revision
+            cached = self.summary_cache.get(self.summary_cache.make_key(code, file_path, self.get_model_name()))
+            if cached is None:
+                cache_key = self.summary_cache.make_key(
+                    code, file_path, self.get_model_name(),
+                    self.summary_cache.incremental_prompt_version(previous_detailed, previous_concise))
+                cached = self.summary_cache.get(cache_key)
+            if cached is not None:
+                print(f"Summary cache hit for {file_path}")
+                return cached
+        old_lines, new_lines = previous_code.splitlines(), code.splitlines()
+        if max(len(old_lines), len(new_lines)) < INCREMENTAL_SUMMARY_MIN_LINES:
+            return None
+        diff = list(difflib.unified_diff(old_lines, new_lines, "before", "after",
+                                         n=INCREMENTAL_SUMMARY_CONTEXT_LINES, lineterm=""))
+        # A replaced line counts once, not as a removal plus an addition
+        opcodes = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes()
+        changed = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in opcodes if tag != "equal")
+        churn = changed / max(len(old_lines), len(new_lines))
+        if churn > INCREMENTAL_SUMMARY_MAX_CHURN:
+            print(f"{file_path}: {churn:.0%} of lines changed, summarizing in full.")
+            return None
+        print(f"{file_path}: revising summary from diff ({churn:.1%} of lines changed).")
+        prompt = INCREMENTAL_FILE_PROMPT.format(file_path=file_path, file_type=os.path.splitext(file_path)[1],
+                                                detailed=previous_detailed, concise=previous_concise,
+                                                diff="\n".join(diff[2:]))
+        detailed, concise = self.parse_combined_summary(self.get_llm_response_with_timeout(prompt))
+        if detailed.startswith("Error") or concise.startswith("Error"):
+            return None
+        if cache_key is not None:
+            self.summary_cache.put(cache_key, detailed, concise, model_name=self.get_model_name())
+        return detailed, concise
+
+    def report_cache_stats(self):
+        """Prints and persists summary cache counters, if a cache is configured."""
+        if self.summary_cache is None:
+            return None
+        self.summary_cache.save_stats()
+        stats = self.summary_cache.stats()
+        print(f"Summary cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['entries']} entries, {stats['bytes']} bytes")
+        return stats
 
     def summarize_project(self, aggregated_summaries):
         prompt = PROJECT_SUMMARY_PROMPT.format(code=aggregated_summaries)
         return self.get_llm_response_with_timeout(prompt)
 
-    def scan_specific_files(self, project_path, file_paths, output_dir=None):
+    def _summarize_path(self, relative_path, file_path, output_dir=None, cancel_event=None, journal=None):
+        """
+        Reads and summarizes a single file. Returns the file summary dict, or None if the
+        file could not be read. Exceptions from the LLM call propagate to the caller.
+        With a ScanJournal, files already summarized at their current content hash during an
+        interrupted scan are loaded back from output_dir instead of being sent to the LLM.
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise ScanCancelled("Scan cancelled")
+        content = self.read_file_content(str(file_path))
+        if content is None:
+            return None
+        out_path = Path(output_dir) / (safe_filename(relative_path) + ".json") if output_dir else None
+        file_hash = content_hash(content) if journal is not None else None
+        if journal is not None and out_path is not None and journal.is_done(relative_path, file_hash):
+            previous = load_json(out_path)
+            if previous.get("path") == relative_path and "detailed_summary" in previous:
+                print(f"Skipping {relative_path} (already summarized before interruption)")
+                return previous
+        print(f"Summarizing {relative_path}...")
+        detailed, concise = self.summarize_file_combined(content, str(file_path))
+        line_count = len(content.splitlines())
+        try:
+            file_size = file_path.stat().st_size
+        except OSError:
+            file_size = 0
+        file_summary = {
+            "path": relative_path,
+            "detailed_summary": detailed,
+            "concise_summary": concise,
+            "lines": line_count,
+            "size": file_size
+        }
+        # Save individual summary as soon as the file is done if output_dir is provided
+        if out_path is not None:
+            try:
+                with open(out_path, "w", encoding="utf-8") as f:
+                    json.dump(file_summary, f, indent=4)
+                if INCREMENTAL_SUMMARY_ENABLED and not detailed.startswith("Error"):
+                    # Content the summary was made from: the base of later incremental updates
+                    with open(out_path.with_suffix(".src"), "w", encoding="utf-8") as f:
+                        f.write(content)
+                if journal is not None and not detailed.startswith("Error"):
+                    journal.record(relative_path, file_hash)
+            except Exception as e:
+                print(f"Error saving summary for {relative_path}: {e}")
+        return file_summary
+
+    def summarize_files(self, items, output_dir=None, progress_callback=None, cancel_event=None, journal=None):
+        """
+        Summarizes (relative_path, file_path) pairs using a bounded pool of workers.
+
+        Returns a list of (relative_path, file_summary, error) tuples in the same order as
+        `items`, so callers build exactly the same results as a sequential scan. file_summary
+        is None when the file could not be read or summarization raised; error then holds the
+        exception (or None for unreadable files).
+
+        progress_callback(done, total, relative_path) is called as each file finishes. If
+        cancel_event gets set, files not yet started are skipped and ScanCancelled is raised
+        once the running ones finish (their summaries are still saved). A ScanJournal records
+        each finished file so an interrupted scan can resume (see _summarize_path).
+        """
+        items = list(items)
+        outcomes = [None] * len(items)
+        workers = min(self.get_max_workers(), len(items)) or 1
+        print(f"Summarizing {len(items)} file(s) with {workers} worker(s)")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self._summarize_path, relative_path, file_path, output_dir, cancel_event, journal): index
+                for index, (relative_path, file_path) in enumerate(items)
+            }
+            for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                index = futures[future]
+                relative_path = items[index][0]
+                try:
+                    outcomes[index] = (relative_path, future.result(), None)
+                except ScanCancelled as e:
+                    outcomes[index] = (relative_path, None, e)
+                except Exception as e:
+                    print(f"Error summarizing {relative_path}: {e}")
+                    outcomes[index] = (relative_path, None, e)
+                if progress_callback:
+                    progress_callback(done, len(items), relative_path)
+        if cancel_event is not None and cancel_event.is_set():
+            raise ScanCancelled("Scan cancelled")
+        return outcomes
+
+    @staticmethod
+    def _summary_error(file_summary):
+        """
+        The error of a summary the LLM call failed to produce (get_llm_response_with_timeout
+        reports timeouts and provider errors as "Error: ..." text rather than raising), else None.
+        """
+        for key in ("detailed_summary", "concise_summary"):
+            text = file_summary.get(key) or ""
+            if text.startswith("Error"):
+                return text
+        return None
+
+    @staticmethod
+    def _valid_summaries(files, summary_key):
+        """Yields (path, summary) for file entries whose summary is usable as aggregation input."""
+        for path, data in files.items():
+            if isinstance(data, dict):
+                summary = data.get(summary_key)
+                if summary and not summary.startswith("Error"):
+                    yield path, summary
+
+    def generate_project_summary(self, files, rollup_cache_path=None, summary_key="concise_summary",
+                                 label="Concise Summary"):
+        """
+        Generates the project-level summary from per-file summaries.
+
+        Small projects use a single AGGREGATED_SUMMARY_PROMPT call. Large ones (or when
+        self.hierarchical is True) are summarized hierarchically: directory rollups run in
+        parallel, are cached in rollup_cache_path by input fingerprint so only directories
+        whose files changed are re-reduced, and are then reduced into the project summary
+        under PROJECT_SUMMARY_TOKEN_BUDGET.
+        Returns None if there are no usable file summaries.
+        """
+        entries = sorted(self._valid_summaries(files, summary_key))
+        if not entries:
+            return None
+        flat = "\n\n".join(f"File: {path}\n{label}: {summary}" for path, summary in entries)
+        hierarchical = self.hierarchical
+        if hierarchical is None:
+            hierarchical = (len(entries) > HIERARCHICAL_SUMMARY_MIN_FILES
+                            or estimate_tokens(flat) > PROJECT_SUMMARY_TOKEN_BUDGET)
+        if not hierarchical:
+            return self.get_llm_response_with_timeout(AGGREGATED_SUMMARY_PROMPT.format(aggregated=flat))
+        return self._summarize_hierarchically(entries, label, rollup_cache_path)
+
+    @staticmethod
+    def _fingerprint(sections):
+        hasher = hashlib.sha256()
+        for name, text in sections:
+            hasher.update(name.encode("utf-8"))
+            hasher.update(b"\0")
+            hasher.update(text.encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def _rollup(self, name, sections, cache, used_cache):
+        """
+        Summarizes (title, text) sections belonging to `name` with DIRECTORY_SUMMARY_PROMPT,
+        reusing the cached rollup when the inputs are unchanged. Small inputs are passed
+        through verbatim to avoid an LLM call.
+        """
+        aggregated = "\n\n".join(f"{title}\n{text}" for title, text in sections)
+        fingerprint = self._fingerprint(sections)
+        cached = cache.get(name)
+        if isinstance(cached, dict) and cached.get("fingerprint") == fingerprint:
+            used_cache[name] = cached
+            return cached["summary"], False
+        if estimate_tokens(aggregated) < DIRECTORY_ROLLUP_MIN_TOKENS:
+            summary = aggregated
+        else:
+            summary = self.get_llm_response_with_timeout(
+                DIRECTORY_SUMMARY_PROMPT.format(directory=name, aggregated=aggregated))
+        if not summary.startswith("Error"):
+            used_cache[name] = {"fingerprint": fingerprint, "summary": summary}
+        return summary, True
+
+    def _rollup_many(self, jobs, cache, used_cache):
+        """Runs {name: sections} rollups in parallel; returns ({name: summary}, number re-reduced)."""
+        results = {}
+        reduced = 0
+        workers = min(self.get_max_workers(), len(jobs)) or 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._rollup, name, sections, cache, used_cache): name
+                       for name, sections in jobs.items()}
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    summary, was_reduced = future.result()
+                except Exception as e:
+                    print(f"Error rolling up {name}: {e}")
+                    summary, was_reduced = f"Error: {e}", True
+                results[name] = summary
+                reduced += int(was_reduced)
+        return results, reduced
+
+    def _summarize_hierarchically(self, entries, label, rollup_cache_path=None):
+        cache = load_json(rollup_cache_path) if rollup_cache_path else {}
+        if not isinstance(cache, dict):
+            cache = {}
+        used_cache = {}
+
+        # Map: one rollup per directory, over the summaries of the files directly inside it
+        by_directory = {}
+        for path, summary in entries:
+            directory = posixpath.dirname(path.replace("\\", "/")) or "."
+            by_directory.setdefault(directory, []).append((f"File: {path}\n{label}:", summary))
+        rollups, reduced = self._rollup_many(by_directory, cache, used_cache)
+        print(f"Directory rollups: {len(rollups)} directories, {reduced} re-reduced, "
+              f"{len(rollups) - reduced} reused from cache.")
+
+        # Reduce: group rollups until the final prompt fits the token budget
+        sections = [(f"Directory: {name}", rollups[name]) for name in sorted(rollups)]
+        level = 0
+        while True:
+            aggregated = "\n\n".join(f"{title}\n{text}" for title, text in sections)
+            if estimate_tokens(aggregated) <= PROJECT_SUMMARY_TOKEN_BUDGET or len(sections) <= 1:
+                break
+            level += 1
+            groups = []
+            current, current_tokens = [], 0
+            for section in sections:
+                tokens = estimate_tokens(section[0]) + estimate_tokens(section[1])
+                if current and current_tokens + tokens > PROJECT_SUMMARY_TOKEN_BUDGET:
+                    groups.append(current)
+                    current, current_tokens = [], 0
+                current.append(section)
+                current_tokens += tokens
+            groups.append(current)
+            if len(groups) >= len(sections):
+                break  # Every section alone exceeds the budget; nothing more to merge
+            jobs = {}
+            for group in groups:
+                names = ", ".join(title.split(": ", 1)[-1] for title, _ in group)
+                jobs[f"level{level}: {names}"] = group
+            merged, _ = self._rollup_many(jobs, cache, used_cache)
+            sections = [(f"Section: {name.split(': ', 1)[1]}", merged[name]) for name in jobs]
+            print(f"Reduce level {level}: merged into {len(sections)} section(s).")
+
+        if rollup_cache_path:
+            save_json(used_cache, rollup_cache_path)  # Drop rollups of directories that no longer exist
+        return self.get_llm_response_with_timeout(AGGREGATED_SUMMARY_PROMPT.format(aggregated=aggregated))
+
+    def _aggregate_project_summary(self, results, no_summaries_message, rollup_cache_path=None):
+        try:
+            project_summary = self.generate_project_summary(
+                results["files"], rollup_cache_path=rollup_cache_path,
+                summary_key="detailed_summary", label="Summary")
+            if project_summary is None:
+                results["project_summary"] = no_summaries_message
+                return
+            results["project_summary"] = project_summary
+            print("Project-level summary generated.")
+        except Exception as e:
+            print(f"Error generating project summary: {e}")
+            results["project_summary"] = f"Error: {e}"
+
+    def scan_specific_files(self, project_path, file_paths, output_dir=None, with_project_summary=True,
+                            progress_callback=None, cancel_event=None, journal=None):
         results = {
             "project_name": Path(project_path).name,
             "files": {},
             "file_count": 0,
             "total_lines": 0,
+            "failed": [],  # {"path", "error"} of files whose summarization raised or returned an error
             "project_summary": ""
         }
         start_time = time.time()
         print(f"Starting scan for {len(file_paths)} specific files at {format_time(start_time)}")
         project_path_obj = Path(project_path)
+        to_summarize = []
         for relative_path in file_paths:
             file_path = project_path_obj / relative_path.replace("\\", "/")
             if not file_path.exists() or not self.should_process_file(str(file_path)):
                 print(f"Skipping {relative_path}")
                 continue
-            content = self.read_file_content(str(file_path))
-            if content is None:
+            to_summarize.append((relative_path, file_path))
+        if journal is not None:
+            journal.begin(self.get_model_name())
+        for relative_path, file_summary, error in self.summarize_files(to_summarize, output_dir,
+                                                                         progress_callback, cancel_event, journal):
+            if error is not None:
+                results["failed"].append({"path": relative_path, "error": str(error)})
                 continue
-            print(f"Summarizing {relative_path}...")
-            detailed, concise = self.summarize_file_combined(content, str(file_path))
-            line_count = len(content.splitlines())
-            try:
-                file_size = file_path.stat().st_size
-            except OSError:
-                file_size = 0
-            file_summary = {
-                "path": relative_path,
-                "detailed_summary": detailed,
-                "concise_summary": concise,
-                "lines": line_count,
-                "size": file_size
-            }
+            if file_summary is None:
+                continue
+            if self._summary_error(file_summary):
+                results["failed"].append({"path": relative_path, "error": self._summary_error(file_summary)})
             results["files"][relative_path] = file_summary
             results["file_count"] += 1
-            results["total_lines"] += line_count
-            # Save individual summary if output_dir is provided
-            if output_dir:
-                out_path = Path(output_dir) / (safe_filename(relative_path) + ".json")
-                try:
-                    with open(out_path, "w", encoding="utf-8") as f:
-                        json.dump(file_summary, f, indent=4)
-                except Exception as e:
-                    print(f"Error saving summary for {relative_path}: {e}")
-        if results["files"]:
+            results["total_lines"] += file_summary["lines"]
+        if results["files"] and not with_project_summary:
+            results["project_summary"] = "Project summary generation deferred."
+        elif results["files"]:
             print("Generating project-level summary for specific files...")
-            aggregated = "\n\n".join(
-                f"File: {path}\nSummary: {data.get('detailed_summary', 'N/A')}"
-                for path, data in results["files"].items()
-            )
-            if aggregated:
-                try:
-                    prompt_project = AGGREGATED_SUMMARY_PROMPT.format(aggregated=aggregated)
-                    project_summary = self.get_llm_response_with_timeout(prompt_project)
-                    results["project_summary"] = project_summary
-                    print("Project-level summary generated.")
-                except Exception as e:
-                    print(f"Error generating project summary: {e}")
-                    results["project_summary"] = f"Error: {e}"
-            else:
-                results["project_summary"] = "No file summaries available."
+            self._aggregate_project_summary(results, "No file summaries available.")
         else:
             results["project_summary"] = "No files were scanned."
+        self.report_cache_stats()
         print(f"Total scan time for specific files: {time.time() - start_time:.2f} seconds")
         return results
 
-    def scan_project(self, project_path, output_dir=None):
+    def scan_project(self, project_path, output_dir=None, with_project_summary=True,
+                     progress_callback=None, cancel_event=None, journal=None):
         project_path_obj = Path(project_path)
         if not project_path_obj.exists():
             raise ValueError(f"Project path does not exist: {project_path}")
-        processed_files = set()
         results = {
             "project_name": project_path_obj.name,
             "files": {},
             "file_count": 0,
             "total_lines": 0,
             "excluded_files": 0,
+            "failed": [],  # {"path", "error"} of files whose summarization raised or returned an error
             "project_summary": ""
         }
         start_time = time.time()
         print("*" * 80)
         print(f"Starting full project scan at {format_time(start_time)}")
-        for root, dirs, files in os.walk(str(project_path_obj)):
-            root_path = Path(root)
-            dirs[:] = [d for d in dirs if not self.should_skip_directory(str(root_path / d))]
-            for file in files:
-                file_path = root_path / file
-                try:
-                    if file_path.is_relative_to(project_path_obj):
-                        relative_path = str(file_path.relative_to(project_path_obj)).replace("\\", "/")
-                    else:
-                        print(f"Warning: {file_path} not relative to {project_path_obj}. Skipping.")
-                        continue
-                except ValueError as e:
-                    print(f"Warning: Could not compute relative path for {file_path}: {e}")
-                    continue
-                if relative_path in processed_files or not self.should_process_file(str(file_path)):
-                    results["excluded_files"] += 1
-                    continue
-                processed_files.add(relative_path)
-                content = self.read_file_content(str(file_path))
-                if content is None:
-                    results["excluded_files"] += 1
-                    continue
-                print(f"Summarizing {relative_path}...")
-                try:
-                    detailed, concise = self.summarize_file_combined(content, str(file_path))
-                    line_count = len(content.splitlines())
-                    try:
-                        file_size = file_path.stat().st_size
-                    except OSError:
-                        file_size = 0
-                    file_summary = {
-                        "path": relative_path,
-                        "detailed_summary": detailed,
-                        "concise_summary": concise,
-                        "lines": line_count,
-                        "size": file_size
-                    }
-                    results["files"][relative_path] = file_summary
-                    results["file_count"] += 1
-                    results["total_lines"] += line_count
-                    if output_dir:
-                        out_path = Path(output_dir) / (safe_filename(relative_path) + ".json")
-                        try:
-                            with open(out_path, "w", encoding="utf-8") as f:
-                                json.dump(file_summary, f, indent=4)
-                        except Exception as e:
-                            print(f"Error saving summary for {relative_path}: {e}")
-                except Exception as e:
-                    print(f"Error summarizing {relative_path}: {e}")
-                    results["files"][relative_path] = {
-                        "path": relative_path,
-                        "detailed_summary": f"Error: {e}",
-                        "concise_summary": "Error summarizing file.",
-                        "lines": 0,
-                        "size": 0
-                    }
-                    results["excluded_files"] += 1
-        if results["files"]:
+        to_summarize = []
+        for entry in FileScanner(project_path_obj, self.matcher).walk():
+            if not self.should_process_file(entry.path, entry.stat.st_size):
+                results["excluded_files"] += 1
+                continue
+            to_summarize.append((entry.rel_path, Path(entry.path)))
+        if journal is not None:
+            journal.begin(self.get_model_name())
+        for relative_path, file_summary, error in self.summarize_files(to_summarize, output_dir,
+                                                                         progress_callback, cancel_event, journal):
+            if error is not None:
+                results["failed"].append({"path": relative_path, "error": str(error)})
+                results["files"][relative_path] = {
+                    "path": relative_path,
+                    "detailed_summary": f"Error: {error}",
+                    "concise_summary": "Error summarizing file.",
+                    "lines": 0,
+                    "size": 0
+                }
+                results["excluded_files"] += 1
+                continue
+            if file_summary is None:
+                results["excluded_files"] += 1
+                continue
+            if self._summary_error(file_summary):
+                results["failed"].append({"path": relative_path, "error": self._summary_error(file_summary)})
+            results["files"][relative_path] = file_summary
+            results["file_count"] += 1
+            results["total_lines"] += file_summary["lines"]
+        if results["files"] and not with_project_summary:
+            results["project_summary"] = "Project summary generation deferred."
+        elif results["files"]:
             print("Generating project-level summary...")
-            aggregated = "\n\n".join(
-                f"File: {path}\nSummary: {data.get('detailed_summary', 'N/A')}"
-                for path, data in results["files"].items() if isinstance(data, dict)
-            )
-            if aggregated:
-                try:
-                    prompt_project = AGGREGATED_SUMMARY_PROMPT.format(aggregated=aggregated)
-                    project_summary = self.get_llm_response_with_timeout(prompt_project)
-                    results["project_summary"] = project_summary
-                    print("Project-level summary generated.")
-                except Exception as e:
-                    print(f"Error generating project summary: {e}")
-                    results["project_summary"] = f"Error: {e}"
-            else:
-                results["project_summary"] = "No valid file summaries available."
+            self._aggregate_project_summary(results, "No valid file summaries available.")
         else:
             results["project_summary"] = "No files were found or summarized."
+        self.report_cache_stats()
         print(f"Total processing time: {time.time() - start_time:.2f} seconds")
         print("*" * 80)
         return results
@@ -1,4 +1,5 @@
 # constants.py
+import os
 
 
 # Prompt for generating both detailed and concise summaries in one call
@@ -71,6 +72,51 @@ Your project summary should include:
 
 This summary should help a developer quickly understand the architecture and design decisions of the project. Keep the summary concise but thorough enough to provide a clear mental model of the codebase."""
 
+# Prompt for rolling up the file summaries of one directory (hierarchical project summaries)
+DIRECTORY_SUMMARY_PROMPT = """Below are summaries of the files and sub-sections in the `{directory}` part of a codebase:
+
+{aggregated}
+
+Write a concise overview of this part of the codebase covering:
+1. Its overall responsibility
+2. The key files or components and how they interact
+3. Important technologies, patterns and data structures
+4. How it depends on or is used by the rest of the codebase
+
+Keep it compact; it will be combined with overviews of the other directories into a project summary."""
+
+# Prompt for revising a file's existing summaries from a diff (incremental re-summarization)
+INCREMENTAL_FILE_PROMPT = """A code file changed. Below are its current summaries and a unified diff of the change
+(with surrounding context lines). Revise BOTH summaries so they describe the file after the change.
+
+File path: {file_path}
+File type: {file_type}
+
+<previous_detailed>
+{detailed}
+</previous_detailed>
+
+<previous_concise>
+{concise}
+</previous_concise>
+
+DIFF:
+```diff
+{diff}
+```
+
+Keep everything that is still accurate, update what the change affects and add anything it introduces.
+Format your response with the revised detailed summary wrapped in <detailed> tags and the revised concise
+summary wrapped in <concise> tags:
+
+<detailed>
+[Revised detailed summary here]
+</detailed>
+
+<concise>
+[Revised concise summary here]
+</concise>"""
+
 NEW_PROJECT_CREATION_PROMPT="""This is a request to create code for a brand new project. The user query is: {input_query}
 There are no existing files or summaries.
 Generate the necessary file(s) to fulfill the user's request.
@@ -142,5 +188,153 @@ CODE_EXTENSIONS = [
     ".swift", ".kt", ".sql", ".xml", ".sh", ".bash", ".ps1", ".dockerfile", ".vue"
 ]
 
+# Number of files summarized concurrently, per LLM service. Local Ollama instances
+# usually serve one or two generations at a time; hosted APIs handle far more.
+SUMMARY_WORKERS = {
+    "ollama": 2,
+    "openai": 8,
+    "anthropic": 4,
+    "deepseek": 4,
+    "google": 4,
+}
+DEFAULT_SUMMARY_WORKERS = 1
+
+# Persistent, content-addressed cache of file summaries shared by all projects
+SUMMARY_CACHE_DIR = "./projects/.summary_cache"
+SUMMARY_CACHE_MAX_BYTES = 200 * 1024 * 1024
+SUMMARY_CACHE_MAX_ENTRIES = 50_000
+
+# Hierarchical (map-reduce) project summaries: directory rollups are reduced into the
+# project summary so the final prompt stays under PROJECT_SUMMARY_TOKEN_BUDGET.
+HIERARCHICAL_SUMMARY_MIN_FILES = 40  # Auto mode switches to hierarchical above this many files
+PROJECT_SUMMARY_TOKEN_BUDGET = 24_000
+DIRECTORY_ROLLUP_MIN_TOKENS = 500  # Directories smaller than this are passed through without an LLM call
+
+# Project-summary refresh after incremental updates: the LLM regeneration is deferred until this
+# fraction of the files have new concise summaries, or the summary is this old; until then the
+# changed files are patched into a "recently updated" section of the existing summary.
+PROJECT_SUMMARY_REFRESH_FRACTION = 0.2
+PROJECT_SUMMARY_DEBOUNCE_SECONDS = 6 * 60 * 60
+
+# Incremental re-summarization: a modified file's summaries are revised from a diff against the
+# content they were made from (kept next to each summary as <name>.src) instead of re-sending the file.
+INCREMENTAL_SUMMARY_ENABLED = True
+INCREMENTAL_SUMMARY_MIN_LINES = 150  # Smaller files are simply re-summarized in full
+INCREMENTAL_SUMMARY_MAX_CHURN = 0.25  # Fraction of changed lines above which a full summary is made
+INCREMENTAL_SUMMARY_CONTEXT_LINES = 8  # Unchanged lines shown around each change
+
+# Project-local import graph (dependency_graph): orders stale summaries and picks query context
+DEPENDENCY_MAX_FILE_BYTES = 1_000_000  # Larger files are not parsed for imports
+DEPENDENCY_NEIGHBOUR_LIMIT = 8  # Related files added to a query's context
+
+# Project-local symbol index (symbol_index): definitions and identifier mentions per file
+SYMBOL_MAX_FILE_BYTES = 1_000_000  # Larger files are not parsed for symbols
+SYMBOL_SEARCH_LIMIT = 50  # Definitions returned per lookup
+SYMBOL_USAGE_LIMIT = 100  # Usage lines returned per lookup
+SYMBOL_PIN_LIMIT = 5  # Files defining symbols named in a query, pinned into its context
+
+# Deadline-bounded LLM calls: size of the shared call pool, and how long past its deadline
+# an abandoned request may keep running before the HTTP transport aborts it.
+LLM_CALL_WORKERS = 64
+LLM_ABANDON_GRACE_SECONDS = 30
+
+# Background jobs (e.g. summarization) run outside the HTTP request
+JOB_MAX_CONCURRENT = 4  # Projects that may summarize at the same time
+JOB_HISTORY_LIMIT = 50  # Finished jobs kept in memory for the progress API
+
+# Stat fast path for change detection: files modified within this window of the last
+# snapshot are re-hashed, since a second write in the same mtime tick is invisible to stat.
+STAT_RACY_WINDOW_NS = 2_000_000_000
+
+# File hashing engine used for change detection (file_hashes.json). Existing md5 hash
+# files are migrated to HASH_ALGORITHM on the next change check.
+HASH_ALGORITHM = "blake2b"
+HASH_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+HASH_BUFFER_SIZE = 1024 * 1024  # Read buffer; files at or below this size are read in one call
+HASH_MMAP_THRESHOLD = 16 * 1024 * 1024  # Files at or above this size are hashed through mmap
+
+# Optional file watcher keeping a per-project dirty-file set, so change checks only look at
+# files that changed. "auto" uses inotify on Linux and polling elsewhere; "off" disables it.
+# Watchers run only for projects held by the ProjectManager registry (PROJECT_REGISTRY_SIZE).
+FILE_WATCHER_MODE = "off"  # off, auto, inotify, poll
+FILE_WATCHER_POLL_INTERVAL = 5  # Seconds between scans of the polling fallback
+FILE_WATCHER_FLUSH_INTERVAL = 1  # Minimum seconds between writes of dirty_files.json
+
+# Source tree walks (file_scanner) also honour the project's .gitignore files
+USE_GITIGNORE = True
+
+# Per-project file inventory (file_inventory.json): without a file watcher, a tree walk is
+# reused by every route for this many seconds before the next request walks again.
+FILE_INVENTORY_MAX_AGE = 5
+
+# Storage of the project record, file hashes and query/modification history: "sqlite" keeps
+# them in <project>/project.db (WAL mode, existing JSON files are migrated on first open),
+# "json" keeps JSON files for the record and hashes and append-only JSONL logs for history.
+PROJECT_STORE_BACKEND = "sqlite"
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# Append-only JSONL query/modification history of the json project store (history_log)
+HISTORY_LOG_MAX_SEGMENT_BYTES = 8 * 1024 * 1024  # Start a new log segment past this size
+HISTORY_LOG_COMPACT_RATIO = 0.5  # Compact once this fraction of the log is deleted entries
+
+# Query context: BM25 index over paths, summaries and identifiers (bm25_index) picks the files
+# whose summaries go into a query prompt, best first, until QUERY_CONTEXT_TOKEN_BUDGET is used.
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_MAX_SOURCE_BYTES = 500_000  # Identifiers are not indexed for larger source files
+QUERY_CONTEXT_TOKEN_BUDGET = 12_000
+QUERY_MIN_FILES = 5  # Always included, even past the budget
+
+# Per-project cache of query answers (query_cache.json), keyed by normalized query text,
+# client and a fingerprint of the summary context in the prompt
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_TTL_SECONDS = 7 * 24 * 3600
+QUERY_CACHE_MAX_ENTRIES = 200
+
+# Token accounting (token_budget): context windows by model-name prefix (longest prefix wins),
+# and the output room reserved per service, so prompts are fitted before they are sent.
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128_000, "gpt-4.1": 1_047_576, "gpt-4-turbo": 128_000, "gpt-4": 8_192, "gpt-3.5": 16_385,
+    "o1": 200_000, "o3": 200_000, "o4": 200_000,
+    "claude": 200_000,
+    "gemini-1.5": 1_048_576, "gemini-2": 1_048_576,
+    "deepseek-chat": 65_536, "deepseek-reasoner": 65_536,
+    "gemma3": 131_072, "llama3.1": 131_072, "llama3.2": 131_072, "llama3": 8_192, "qwen2.5": 32_768,
+    "mistral": 32_768, "exaone": 32_768,
+}
+DEFAULT_CONTEXT_WINDOW = 8_192
+LLM_MAX_OUTPUT_TOKENS = {"anthropic": 15_000, "openai": 15_000, "deepseek": 8_192, "google": 15_192, "ollama": 4_096}
+# Opt-in: context size (tokens) requested from Ollama with every call, e.g. 16_384. None keeps
+# the server's/model's own num_ctx setting, which may truncate prompts longer than it.
+OLLAMA_NUM_CTX = None
+TOKEN_ESTIMATE_SAFETY_FACTOR = 1.2  # Applied to the 4-characters-per-token estimate when tiktoken cannot count
+PROMPT_BUDGET_MAX_REPORTED = 50  # Dropped items listed by name in the history (all are counted)
+
+# Provider prompt-prefix caching: prompts are sent as a stable project-context prefix plus the
+# per-request part. Anthropic gets a cache_control breakpoint after the prefix (it only caches
+# prefixes of at least ANTHROPIC_CACHE_MIN_TOKENS); OpenAI, DeepSeek and Gemini cache identical
+# prefixes automatically; Ollama keeps the model (and its prompt KV cache) loaded for OLLAMA_KEEP_ALIVE.
+PROMPT_CACHE_ENABLED = True
+ANTHROPIC_CACHE_MIN_TOKENS = 1024
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Vector index over file summaries (vector_index), fused with BM25 for query file selection.
+# Embeddings come from Ollama ("auto" uses it when it serves the model) or a local hashing vectorizer.
+VECTOR_INDEX_ENABLED = True
+VECTOR_EMBEDDING_BACKEND = "auto"  # auto, ollama, hashing
+VECTOR_OLLAMA_MODEL = "nomic-embed-text"
+VECTOR_OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+VECTOR_HASH_DIM = 512
+VECTOR_MAX_TEXT_CHARS = 4000  # Per file: path + concise + detailed summary, truncated
+VECTOR_SEARCH_LIMIT = 50  # Nearest files taken into the fused ranking
+VECTOR_IVF_MIN_ROWS = 5000  # From this many files (and with NumPy) search scans only the nearest clusters
+VECTOR_IVF_NPROBE = 8
+SEARCH_RRF_K = 60  # Reciprocal rank fusion constant
 
+# Change detection: "auto" lists changes with git (since the last summarized commit) for git
+# checkouts and hashes everything else; "hash" always uses the file inventory's hashes.
+CHANGE_DETECTION_BACKEND = "auto"
+GIT_TIMEOUT_SECONDS = 30
 
+# Process-wide registry of live ProjectManagers (project_manager.get_project_manager)
+PROJECT_REGISTRY_SIZE = 16  # Most recently used projects kept in memory
@@ -0,0 +1,324 @@
+# dependency_graph.py
+
+import ast
+import re
+import posixpath
+import threading
+from collections import deque
+from pathlib import Path
+from utils import load_json, save_json
+from constants import DEPENDENCY_MAX_FILE_BYTES, DEPENDENCY_NEIGHBOUR_LIMIT
+
+# --- Import extraction, per extension family. Each extractor returns (kind, spec) pairs:
+#   "rel"    path relative to the importing file's directory (extension optional)
+#   "path"   path relative to the project root, else matched as a path suffix
+#   "module" dotted module name (Python, Java, Kotlin), matched as a path suffix
+#   "dir"    package directory (Go), matched as a path suffix
+
+_JS_EXTS = [".js", ".jsx", ".ts", ".tsx", ".vue"]
+_STYLE_EXTS = [".css", ".scss", ".sass"]
+_C_EXTS = [".h", ".hpp", ".c", ".cpp"]
+
+_JS_RE = re.compile(r"""(?:\bimport\s+(?:[\w*{}\s,$]+\s+from\s+)?|\bexport\s+[\w*{}\s,$]+\s+from\s+|"""
+                    r"""\brequire\s*\(\s*|\bimport\s*\(\s*)['"]([^'"\n]+)['"]""")
+_STYLE_RE = re.compile(r"""@(?:import|use|forward)\s+(?:url\()?['"]?([^'")\s;]+)""")
+_HTML_RE = re.compile(r"""<(?:script|link|img|iframe)\b[^>]*?\b(?:src|href)\s*=\s*['"]([^'"#?]+)|"""
+                      r"""{%-?\s*(?:extends|include|import|from)\s+['"]([^'"]+)['"]""")
+_C_RE = re.compile(r"""^\s*#\s*include\s+"([^"]+)\"""", re.M)
+_PHP_RE = re.compile(r"""\b(?:require|include)(?:_once)?\s*\(?\s*(?:__DIR__\s*\.\s*)?['"]([^'"]+)['"]""")
+_RUBY_RE = re.compile(r"""^\s*(require_relative|require|load)\s*\(?\s*['"]([^'"]+)['"]""", re.M)
+_JVM_RE = re.compile(r"""^\s*import\s+(?:static\s+)?([\w.]+)""", re.M)
+_GO_BLOCK_RE = re.compile(r"""^\s*import\s*\((.*?)\)""", re.M | re.S)
+_GO_LINE_RE = re.compile(r"""^\s*import\s+(?:[\w.]+\s+)?"([^"]+)\"""", re.M)
+_GO_SPEC_RE = re.compile(r'"([^"]+)"')
+_RUST_MOD_RE = re.compile(r"""^\s*(?:pub(?:\([^)]*\))?\s+)?mod\s+(\w+)\s*;""", re.M)
+_RUST_USE_RE = re.compile(r"""^\s*(?:pub\s+)?use\s+crate::([\w:]+)""", re.M)
+_SHELL_RE = re.compile(r"""^\s*(?:source|\.)\s+['"]?([^\s'";]+)""", re.M)
+_PS_RE = re.compile(r"""^\s*(?:\.\s+|Import-Module\s+)['"]?([^\s'"]+\.ps[dm]?1)""", re.M | re.I)
+_VUE_SCRIPT_RE = re.compile(r"<script\b[^>]*>(.*?)</script>", re.S | re.I)
+
+
+def _python_imports(text):
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        # Partial/invalid source: fall back to line matching
+        specs = []
+        for match in re.finditer(r"^\s*from\s+(\.*[\w.]*)\s+import|^\s*import\s+([\w.]+)", text, re.M):
+            specs.append(("module", match.group(1) or match.group(2)))
+        return specs
+    specs = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            specs.extend(("module", alias.name) for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = "." * node.level + (node.module or "")
+            specs.append(("module", base))
+            # 'from pkg import mod' may name submodules
+            specs.extend(("module", f"{base}.{alias.name}" if node.module else base + alias.name)
+                         for alias in node.names if alias.name != "*")
+    return specs
+
+
+def _js_imports(text):
+    specs = []
+    for spec in _JS_RE.findall(text):
+        if spec.startswith("."):
+            specs.append(("rel", spec))
+        elif spec.startswith("@/") or spec.startswith("~/"):
+            specs.append(("path", "src/" + spec[2:]))  # Common bundler alias for src/
+    return specs
+
+
+def _extract(ext, text):
+    if ext == ".py":
+        return _python_imports(text)
+    if ext in (".js", ".jsx", ".ts", ".tsx"):
+        return _js_imports(text)
+    if ext == ".vue":
+        return [spec for block in _VUE_SCRIPT_RE.findall(text) for spec in _js_imports(block)] + \
+            [("rel", spec) for spec in _STYLE_RE.findall(text) if spec.startswith(".")]
+    if ext in _STYLE_EXTS:
+        return [("rel", spec) for spec in _STYLE_RE.findall(text) if "://" not in spec]
+    if ext == ".html":
+        specs = []
+        for src, template in _HTML_RE.findall(text):
+            if src and "://" not in src and not src.startswith("//") and "{" not in src:
+                specs.append(("path", src.lstrip("/")) if src.startswith("/") else ("rel", src))
+            elif template:
+                specs.append(("path", template))  # Jinja/Django templates are named from the template root
+        return specs
+    if ext in _C_EXTS:
+        return [("rel", spec) for spec in _C_RE.findall(text)]
+    if ext == ".php":
+        return [("rel", spec.lstrip("/")) for spec in _PHP_RE.findall(text)]
+    if ext == ".rb":
+        return [("rel", spec) if kind == "require_relative" or spec.startswith(".") else ("path", spec)
+                for kind, spec in _RUBY_RE.findall(text)]
+    if ext in (".java", ".kt"):
+        return [("module", spec.rstrip(".*")) for spec in _JVM_RE.findall(text)]
+    if ext == ".go":
+        specs = _GO_LINE_RE.findall(text)
+        for block in _GO_BLOCK_RE.findall(text):
+            specs.extend(_GO_SPEC_RE.findall(block))
+        return [("dir", spec) for spec in specs]
+    if ext == ".rs":
+        return [("rel", name) for name in _RUST_MOD_RE.findall(text)] + \
+            [("path", "/".join(spec.split("::")[:-1]) or spec) for spec in _RUST_USE_RE.findall(text)]
+    if ext in (".sh", ".bash"):
+        return [("rel", spec) for spec in _SHELL_RE.findall(text) if "$" not in spec]
+    if ext == ".ps1":
+        return [("rel", spec.replace("\\", "/").lstrip("./")) for spec in _PS_RE.findall(text)]
+    return []
+
+
+# Extensions tried, in order, when an import names a file without its extension
+_RESOLVE_EXTS = {
+    ".py": [".py", "/__init__.py"],
+    ".js": _JS_EXTS + ["/index" + e for e in _JS_EXTS], ".jsx": _JS_EXTS + ["/index" + e for e in _JS_EXTS],
+    ".ts": _JS_EXTS + ["/index" + e for e in _JS_EXTS], ".tsx": _JS_EXTS + ["/index" + e for e in _JS_EXTS],
+    ".vue": _JS_EXTS + ["/index" + e for e in _JS_EXTS] + _STYLE_EXTS,
+    ".css": [".css"], ".scss": [".scss", ".css"], ".sass": [".sass", ".scss", ".css"],
+    ".php": [".php"], ".rb": [".rb"], ".java": [".java"], ".kt": [".kt", ".java"],
+    ".rs": [".rs", "/mod.rs"], ".sh": [".sh", ".bash"], ".bash": [".bash", ".sh"],
+    ".c": _C_EXTS, ".cpp": _C_EXTS, ".h": _C_EXTS, ".hpp": _C_EXTS,
+}
+
+
+class DependencyGraph:
+    """
+    Project-local import graph (dependency_graph.json in the project output dir), built from the
+    files of a FileInventory. Imports are extracted per language (AST for Python, patterns for the
+    other CODE_EXTENSIONS) and stored per file with the stat they were read at, so refresh() only
+    re-reads files the inventory reports as changed, and skips the comparison entirely while the
+    inventory has not changed. refresh(rel_paths) updates just those files without refreshing the
+    inventory. Specs are resolved to project files in memory; imports of third-party packages
+    simply resolve to nothing.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.source_path = inventory.source_path
+        self.path = Path(inventory.output_dir) / "dependency_graph.json"
+        self._lock = threading.RLock()
+        self._files = None  # rel_path -> {"stat": [size, mtime_ns, ino], "imports": [[kind, spec], ...]}
+        self._deps = {}  # rel_path -> set of project files it imports
+        self._rdeps = {}  # rel_path -> set of project files importing it
+        self._synced_generation = None  # inventory.generation the graph was last compared with
+
+    # --- Building ---
+    def _load(self):
+        if self._files is None:
+            data = load_json(self.path) or {}
+            same_tree = data.get("source_path") == str(self.source_path)
+            self._files = data.get("files", {}) if same_tree and isinstance(data.get("files"), dict) else {}
+
+    def refresh(self, rel_paths=None):
+        """
+        Re-parses changed files and rebuilds the edges. Returns self. Without rel_paths the
+        inventory is refreshed and compared with the graph if it changed since the last call; with
+        rel_paths only those files are re-stat'ed, on top of the persisted graph.
+        """
+        with self._lock:
+            self._load()
+            if rel_paths is not None:
+                changed = self._update_paths(rel_paths)
+            else:
+                self.inventory.refresh()
+                changed = False
+                if self.inventory.generation != self._synced_generation:
+                    self._synced_generation = self.inventory.generation
+                    changed = self._sync(self.inventory.entries())
+            if changed or not self._deps and self._files:
+                self._resolve_all()
+            if changed:
+                save_json({"source_path": str(self.source_path), "files": self._files}, self.path)
+            return self
+
+    def _sync(self, inventory_files):
+        changed = False
+        for rel in [rel for rel in self._files if rel not in inventory_files]:
+            del self._files[rel]
+            changed = True
+        for rel, entry in inventory_files.items():
+            stat = [entry["size"], entry["mtime_ns"], entry["ino"]]
+            cached = self._files.get(rel)
+            if cached is not None and cached.get("stat") == stat:
+                continue
+            self._files[rel] = {"stat": stat, "imports": self._parse(rel, entry["size"])}
+            changed = True
+        return changed
+
+    def _update_paths(self, rel_paths):
+        changed = False
+        for rel in rel_paths:
+            try:
+                st = (self.source_path / rel).stat()
+            except OSError:
+                changed = self._files.pop(rel, None) is not None or changed  # Deleted
+                continue
+            stat = [st.st_size, st.st_mtime_ns, st.st_ino]
+            cached = self._files.get(rel)
+            if cached is None or cached.get("stat") != stat:
+                self._files[rel] = {"stat": stat, "imports": self._parse(rel, st.st_size)}
+                changed = True
+        return changed
+
+    def _parse(self, rel, size):
+        if size > DEPENDENCY_MAX_FILE_BYTES:
+            return []
+        try:
+            text = (self.source_path / rel).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return []
+        return [list(spec) for spec in dict.fromkeys(_extract(posixpath.splitext(rel)[1], text))]
+
+    def _resolve_all(self):
+        files = set(self._files)
+        by_name = {}  # basename -> paths, for suffix matches
+        for rel in files:
+            by_name.setdefault(posixpath.basename(rel), []).append(rel)
+        dirs = {}
+        for rel in files:
+            dirs.setdefault(posixpath.dirname(rel), []).append(rel)
+
+        def suffix_match(candidate):
+            matches = [rel for rel in by_name.get(posixpath.basename(candidate), ())
+                       if rel == candidate or rel.endswith("/" + candidate)]
+            return matches[0] if len(matches) == 1 else None  # Ambiguous names give no edge
+
+        def resolve(rel, kind, spec):
+            ext = posixpath.splitext(rel)[1]
+            base_dir = posixpath.dirname(rel)
+            if kind == "dir":
+                parts = spec.split("/")
+                for depth in range(len(parts)):
+                    suffix = "/".join(parts[depth:])
+                    found = [d for d in dirs if d == suffix or d.endswith("/" + suffix)]
+                    if len(found) == 1:
+                        return [f for f in dirs[found[0]] if f.endswith(".go")]
+                return []
+            if kind == "module":
+                level = len(spec) - len(spec.lstrip("."))
+                name = spec[level:].replace(".", "/")
+                if level:  # Python relative import
+                    anchor = base_dir
+                    for _ in range(level - 1):
+                        anchor = posixpath.dirname(anchor)
+                    candidates = [posixpath.join(anchor, name) if name else anchor]
+                    kind = "rel-resolved"
+                else:
+                    candidates = [name]
+            elif kind == "rel":
+                candidates = [posixpath.normpath(posixpath.join(base_dir, spec))]
+            else:
+                candidates = [posixpath.normpath(spec)]
+            exts = [""] + _RESOLVE_EXTS.get(ext, [ext])
+            for candidate in candidates:
+                if candidate.startswith(".."):
+                    continue
+                for suffix in exts:
+                    path = (candidate + suffix).lstrip("/")
+                    if path in files:
+                        return [path]
+                if kind in ("path", "module"):
+                    for suffix in exts:
+                        match = suffix_match(candidate + suffix)
+                        if match:
+                            return [match]
+            return []
+
+        self._deps = {}
+        self._rdeps = {}
+        for rel, data in self._files.items():
+            targets = set()
+            for kind, spec in data.get("imports", []):
+                targets.update(target for target in resolve(rel, kind, spec) if target != rel)
+            self._deps[rel] = targets
+            for target in targets:
+                self._rdeps.setdefault(target, set()).add(rel)
+
+    # --- Queries (call refresh() first) ---
+    def dependencies(self, rel_path):
+        """Project files imported by rel_path."""
+        return sorted(self._deps.get(rel_path, ()))
+
+    def dependents(self, rel_path):
+        """Project files importing rel_path."""
+        return sorted(self._rdeps.get(rel_path, ()))
+
+    def neighbours(self, rel_paths, depth=1, limit=DEPENDENCY_NEIGHBOUR_LIMIT):
+        """
+        Files within 'depth' import hops of rel_paths (either direction), nearest first and, at
+        equal distance, most depended-upon first. rel_paths themselves are not included.
+        """
+        seeds = set(rel_paths)
+        seen = set(seeds)
+        found = []
+        frontier = [rel for rel in rel_paths if rel in self._deps]
+        for _ in range(depth):
+            layer = set()
+            for rel in frontier:
+                layer.update(self._deps.get(rel, ()))
+                layer.update(self._rdeps.get(rel, ()))
+            layer -= seen
+            seen |= layer
+            found.extend(sorted(layer, key=lambda r: (-len(self._rdeps.get(r, ())), r)))
+            frontier = layer
+        return found[:limit] if limit else found
+
+    def impact(self, rel_path):
+        """Number of project files that depend on rel_path, directly or transitively."""
+        seen = set()
+        queue = deque([rel_path])
+        while queue:
+            for dependent in self._rdeps.get(queue.popleft(), ()):
+                if dependent not in seen and dependent != rel_path:
+                    seen.add(dependent)
+                    queue.append(dependent)
+        return len(seen)
+
+    def rank(self, rel_paths):
+        """rel_paths ordered by impact (most depended-upon first); ties keep their order."""
+        impact = {rel: self.impact(rel) for rel in rel_paths}
+        return sorted(rel_paths, key=lambda rel: -impact[rel])
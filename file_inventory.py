@@ -0,0 +1,187 @@
+# file_inventory.py
+
+import os
+import time
+import threading
+from pathlib import Path
+from utils import load_json, save_json
+from file_scanner import FileScanner
+from file_hasher import FileHasher
+from file_watcher import get_watcher
+from constants import FILE_INVENTORY_MAX_AGE, STAT_RACY_WINDOW_NS
+
+
+class FileInventory:
+    """
+    Persistent index of a project's processable source files (file_inventory.json in the project
+    output dir): size, mtime, inode, extension and content hash per relative path.
+
+    refresh() keeps it current. With a reconciled file watcher only the watcher's dirty paths are
+    re-stat'ed; otherwise the tree is re-walked with FileScanner, at most once per
+    FILE_INVENTORY_MAX_AGE seconds. Hashes are computed lazily by hashes() and reused for as
+    long as a file's stat is unchanged.
+    """
+
+    def __init__(self, source_path, output_dir, scanner=None, hasher=None):
+        self.source_path = Path(source_path).resolve()
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / "file_inventory.json"
+        self.scanner = scanner or FileScanner(self.source_path)
+        self.hasher = hasher or FileHasher()
+        self.files = None  # rel_path -> entry dict; loaded lazily
+        self.scanned_at = 0
+        self.last_hashed_count = 0  # Files hashed by the last hashes() call
+        self.generation = 0  # Bumped whenever a file is added, changed or removed (in this process)
+        self._dirty = False
+        self._lock = threading.RLock()  # One inventory may serve concurrent requests (shared ProjectManager)
+
+    # --- Persistence ---
+    def _load(self):
+        if self.files is not None:
+            return
+        data = load_json(self.path) or {}
+        files = data.get("files") if isinstance(data.get("files"), dict) else {}
+        if data.get("source_path") != str(self.source_path) or data.get("algorithm") != self.hasher.algorithm:
+            # Different tree or hash algorithm: stat data of the same tree stays usable, hashes do not
+            files = {} if data.get("source_path") != str(self.source_path) else \
+                {rel: dict(entry, hash=None) for rel, entry in files.items()}
+            data["scanned_at"] = 0
+        self.files = files
+        self.scanned_at = data.get("scanned_at", 0)
+
+    def save(self):
+        if not self._dirty:
+            return
+        save_json({
+            "source_path": str(self.source_path),
+            "algorithm": self.hasher.algorithm,
+            "scanned_at": self.scanned_at,
+            "files": self.files,
+        }, self.path)
+        self._dirty = False
+
+    # --- Entries ---
+    @staticmethod
+    def _stat_key(entry):
+        return entry["size"], entry["mtime_ns"], entry["ino"]
+
+    def _update_entry(self, rel_path, st):
+        """Records a file's stat; the hash survives only if size, mtime and inode are unchanged."""
+        entry = self.files.get(rel_path)
+        if entry is not None and self._stat_key(entry) == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return
+        self.files[rel_path] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "ino": st.st_ino,
+            "ext": os.path.splitext(rel_path)[1],
+            "hash": None,
+        }
+        self._dirty = True
+        self.generation += 1
+
+    def _remove_entry(self, rel_path):
+        if self.files.pop(rel_path, None) is not None:
+            self._dirty = True
+            self.generation += 1
+
+    # --- Refreshing ---
+    def refresh(self, force_walk=False):
+        """Brings the inventory up to date with the source tree and returns self."""
+        with self._lock:
+            self._load()
+            watcher = get_watcher(self.output_dir)
+            generation = None
+            if watcher:
+                dirty_paths, reconciled, generation = watcher.dirty.drain()
+                if reconciled and not force_walk and self.scanned_at:
+                    try:
+                        self._apply_dirty_paths(dirty_paths)
+                        self.save()
+                        return self
+                    except Exception as e:
+                        print(f"Error applying watcher dirty set, re-walking {self.source_path}: {e}")
+            elif not force_walk and time.time() - self.scanned_at < FILE_INVENTORY_MAX_AGE:
+                return self
+
+            self._walk()
+            self.save()
+            if watcher:
+                watcher.dirty.mark_reconciled(generation) # The inventory now matches the tree the watcher follows
+            return self
+
+    def _walk(self):
+        seen = set()
+        if self.source_path.is_dir():
+            for entry in self.scanner.walk():
+                seen.add(entry.rel_path)
+                self._update_entry(entry.rel_path, entry.stat)
+        for rel_path in [rel for rel in self.files if rel not in seen]:
+            self._remove_entry(rel_path)
+        self.scanned_at = time.time()
+        self._dirty = True
+
+    def _apply_dirty_paths(self, dirty_paths):
+        """Re-stats the paths reported by the watcher. Directory entries (ending in '/') cover their subtree."""
+        candidates = set()
+        for dirty in dirty_paths:
+            if not dirty.endswith("/"):
+                candidates.add(dirty)
+                continue
+            candidates.update(rel for rel in self.files if rel.startswith(dirty))
+            if (self.source_path / dirty).is_dir():
+                candidates.update(entry.rel_path for entry in self.scanner.walk(dirty))
+        for rel_path in candidates:
+            if not self.scanner.is_tracked(rel_path):
+                self._remove_entry(rel_path)
+                continue
+            try:
+                st = os.stat(self.source_path / rel_path)
+            except OSError:
+                self._remove_entry(rel_path) # Deleted (or moved away)
+                continue
+            self._update_entry(rel_path, st)
+        if candidates:
+            print(f"Inventory: applied {len(dirty_paths)} watcher change(s) for {self.source_path.name}.")
+
+    # --- Queries (call refresh() first) ---
+    def paths(self):
+        with self._lock:
+            self._load()
+            return sorted(self.files)
+
+    def entries(self):
+        """Copy of {rel_path: entry} (size, mtime_ns, ino, ext, hash)."""
+        with self._lock:
+            self._load()
+            return {rel: dict(entry) for rel, entry in self.files.items()}
+
+    def is_empty(self):
+        with self._lock:
+            self._load()
+            return not self.files
+
+    def hashes(self, rel_paths, rehash=False):
+        """
+        Returns {rel_path: hash} for the given inventory paths, hashing (in parallel) only files
+        with no hash yet. Files modified within STAT_RACY_WINDOW_NS of being hashed are flagged
+        'racy' and re-hashed next time, since a same-tick rewrite would not change their stat.
+        """
+        with self._lock:
+            self._load()
+            to_hash = [rel for rel in rel_paths if rel in self.files and
+                       (rehash or not self.files[rel].get("hash") or self.files[rel].get("racy"))]
+            hashed_at_ns = time.time_ns()
+            computed = self.hasher.hash_many(str(self.source_path / rel) for rel in to_hash)
+            for rel in to_hash:
+                entry = self.files[rel]
+                entry["hash"] = computed.get(str(self.source_path / rel))
+                entry["racy"] = entry["mtime_ns"] >= hashed_at_ns - STAT_RACY_WINDOW_NS
+                if entry["hash"] is None:
+                    print(f"Warning: Could not compute hash for {rel}, skipping.")
+            if to_hash:
+                self._dirty = True
+                self.save()
+            self.last_hashed_count = len(to_hash)
+            return {rel: self.files[rel]["hash"] for rel in rel_paths
+                    if rel in self.files and self.files[rel].get("hash")}
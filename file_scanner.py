@@ -0,0 +1,344 @@
+# file_scanner.py
+
+import os
+import re
+import fnmatch
+from collections import namedtuple
+from constants import DEFAULT_EXCLUDES, CODE_EXTENSIONS, USE_GITIGNORE
+
+# One file found by FileScanner: project-relative path (forward slashes), absolute path and stat result
+ScanEntry = namedtuple("ScanEntry", ["rel_path", "path", "stat"])
+
+
+class ExclusionMatcher:
+    """
+    DEFAULT_EXCLUDES-style rules compiled once: plain entries match a path component exactly,
+    entries with wildcards ('*.pyc', 'dump*') match it as a glob. A path is excluded when any
+    of its components matches. Code files are recognised by their extension.
+    """
+
+    def __init__(self, patterns=None, extensions=None):
+        patterns = DEFAULT_EXCLUDES if patterns is None else patterns
+        self.names = frozenset(p for p in patterns if not any(ch in p for ch in "*?["))
+        globs = [fnmatch.translate(p) for p in patterns if p not in self.names]
+        self._globs = re.compile("|".join(globs)) if globs else None
+        self.extensions = frozenset(CODE_EXTENSIONS if extensions is None else extensions)
+
+    def is_excluded_name(self, name):
+        return name in self.names or (self._globs is not None and self._globs.match(name) is not None)
+
+    def is_excluded_path(self, rel_path):
+        return any(self.is_excluded_name(part) for part in rel_path.replace("\\", "/").split("/") if part)
+
+    def has_code_extension(self, name):
+        return os.path.splitext(name)[1] in self.extensions
+
+    def is_code_file(self, rel_path):
+        return self.has_code_extension(rel_path) and not self.is_excluded_path(rel_path)
+
+
+DEFAULT_MATCHER = ExclusionMatcher()
+
+
+# POSIX character classes accepted inside gitignore brackets ('[[:digit:]]'), as regex class bodies
+_POSIX_CLASSES = {
+    "alnum": "a-zA-Z0-9", "alpha": "a-zA-Z", "blank": " \\t", "cntrl": "\\x00-\\x1f\\x7f",
+    "digit": "0-9", "graph": "!-~", "lower": "a-z", "print": " -~", "punct": "!-/:-@\\[-`{-~",
+    "space": " \\t\\n\\r\\f\\v", "upper": "A-Z", "xdigit": "0-9A-Fa-f",
+}
+
+
+def _translate_gitignore_class(pattern, i):
+    """
+    Translates the bracket expression starting at pattern[i] ('[') as git's wildmatch reads it.
+    Returns (regex, index after ']'), or None when it is malformed, which makes git's whole
+    pattern match nothing.
+    """
+    n = len(pattern)
+    i += 1
+    negate = i < n and pattern[i] in "!^"
+    if negate:
+        i += 1
+    body = []
+    first = True
+    while i < n and (pattern[i] != "]" or first):
+        first = False
+        if pattern.startswith("[:", i):
+            end = pattern.find(":]", i + 2)
+            if end == -1 or pattern[i + 2:end] not in _POSIX_CLASSES:
+                return None
+            body.append(_POSIX_CLASSES[pattern[i + 2:end]])
+            i = end + 2
+            continue
+        if pattern[i] == "\\":
+            i += 1
+            if i == n:
+                return None
+        low = pattern[i]
+        i += 1
+        if pattern.startswith("-", i) and i + 1 < n and pattern[i + 1] != "]":
+            i += 1
+            if pattern[i] == "\\":
+                i += 1
+                if i == n:
+                    return None
+            high = pattern[i]
+            # git compares the start on its own first, so a reversed range still matches it
+            body.append(re.escape(low) + ("-" + re.escape(high) if low <= high else ""))
+            i += 1
+        else:
+            body.append(re.escape(low))
+    if i == n:
+        return None  # Unterminated
+    # A bracket expression never matches '/'
+    if negate:
+        return "[^/" + "".join(body) + "]", i + 1
+    return "(?!/)[" + "".join(body) + "]", i + 1
+
+
+def _translate_gitignore_glob(pattern):
+    """
+    Translates a gitignore glob into a regex matched against a '/'-separated relative path,
+    or returns None if git would never match it (malformed bracket, trailing backslash).
+    """
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            i += 2
+            while pattern.startswith("*", i):
+                i += 1
+            # Only a trailing '**' crosses directories; elsewhere it is a plain '*'
+            out.append(".*" if i == n else "[^/]*")
+            continue
+        c = pattern[i]
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            translated = _translate_gitignore_class(pattern, i)
+            if translated is None:
+                return None
+            out.append(translated[0])
+            i = translated[1]
+            continue
+        elif c == "\\":
+            if i + 1 == n:
+                return None
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def _trim_trailing_spaces(line):
+    """Drops trailing spaces unless escaped with a backslash, like git."""
+    last_space = None
+    i = 0
+    while i < len(line):
+        if line[i] == " ":
+            if last_space is None:
+                last_space = i
+        else:
+            if line[i] == "\\":
+                i += 1
+            last_space = None
+        i += 1
+    return line if last_space is None else line[:last_space]
+
+
+class GitIgnore:
+    """Rules of one .gitignore file, matched against paths relative to the directory holding it."""
+
+    def __init__(self, lines):
+        self.rules = []  # (compiled regex, negate, dir_only)
+        for line in lines:
+            line = _trim_trailing_spaces(line.rstrip("\n").rstrip("\r"))
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line  # A slash anywhere but the end anchors the pattern to this directory
+            regex = _translate_gitignore_glob(line.lstrip("/"))
+            if regex is None:
+                continue
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z", re.DOTALL), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                ignore = cls(f.readlines())
+        except OSError:
+            return None
+        return ignore if ignore.rules else None
+
+    def match(self, rel_path, is_dir):
+        """True if ignored, False if re-included by a '!' rule, None if no rule matches."""
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+class FileScanner:
+    """
+    os.scandir-based walker over a project's source tree applying the exclusion matcher and,
+    optionally, the project's .gitignore files. walk() yields ScanEntry objects whose stat
+    comes from the directory scan, so callers need no extra stat calls.
+    """
+
+    def __init__(self, root, matcher=None, use_gitignore=USE_GITIGNORE, code_only=True):
+        self.root = os.path.abspath(root)
+        self.matcher = matcher or DEFAULT_MATCHER
+        self.use_gitignore = use_gitignore
+        self.code_only = code_only
+        self._gitignores = {}  # dir rel path -> (mtime_ns, GitIgnore or None)
+
+    # --- .gitignore handling ---
+    def _load_gitignore(self, dir_rel, stat=None):
+        if stat is None:
+            try:
+                stat = os.stat(os.path.join(self.root, dir_rel, ".gitignore"))
+            except OSError:
+                self._gitignores.pop(dir_rel, None)
+                return None
+        cached = self._gitignores.get(dir_rel)
+        if cached and cached[0] == stat.st_mtime_ns:
+            return cached[1]
+        ignore = GitIgnore.from_file(os.path.join(self.root, dir_rel, ".gitignore"))
+        self._gitignores[dir_rel] = (stat.st_mtime_ns, ignore)
+        return ignore
+
+    def _ignore_stack_for(self, dir_rel):
+        """GitIgnore rules applying inside dir_rel: its own and every ancestor's, root first."""
+        if not self.use_gitignore:
+            return ()
+        stack = []
+        parts = [p for p in dir_rel.split("/") if p]
+        for depth in range(len(parts) + 1):
+            base = "/".join(parts[:depth])
+            ignore = self._load_gitignore(base)
+            if ignore is not None:
+                stack.append((base, ignore))
+        return tuple(stack)
+
+    @staticmethod
+    def _is_ignored(rel_path, is_dir, ignore_stack):
+        ignored = False
+        for base, ignore in ignore_stack:
+            result = ignore.match(rel_path[len(base) + 1:] if base else rel_path, is_dir)
+            if result is not None:
+                ignored = result
+        return ignored
+
+    # --- Queries ---
+    def _has_ignored_ancestor(self, parts):
+        """Whether any directory formed by a proper prefix of parts is gitignored."""
+        for depth in range(1, len(parts)):
+            if self._is_ignored("/".join(parts[:depth]), True, self._ignore_stack_for("/".join(parts[:depth - 1]))):
+                return True
+        return False
+
+    def is_tracked(self, rel_path):
+        """Whether a single relative file path would be yielded by walk() (existence aside)."""
+        rel_path = rel_path.replace("\\", "/").strip("/")
+        if self.matcher.is_excluded_path(rel_path):
+            return False
+        if self.code_only and not self.matcher.has_code_extension(rel_path):
+            return False
+        if not self.use_gitignore:
+            return True
+        parts = rel_path.split("/")
+        # Files under an ignored directory cannot be re-included, as in git
+        if self._has_ignored_ancestor(parts):
+            return False
+        return not self._is_ignored(rel_path, False, self._ignore_stack_for("/".join(parts[:-1])))
+
+    def is_tracked_dir(self, dir_rel):
+        """Whether walk() would descend into the relative directory."""
+        dir_rel = dir_rel.replace("\\", "/").strip("/")
+        if not dir_rel:
+            return True
+        if self.matcher.is_excluded_path(dir_rel):
+            return False
+        return not (self.use_gitignore and self._has_ignored_ancestor(dir_rel.split("/") + [""]))
+
+    # --- Walking ---
+    def _scan(self, start_rel, want_dirs):
+        start_rel = start_rel.replace("\\", "/").strip("/")
+        if not self.is_tracked_dir(start_rel):
+            return
+        stack = [(start_rel, self._ignore_stack_for(start_rel[:start_rel.rfind("/")] if "/" in start_rel else "")
+                  if start_rel else ())]
+        while stack:
+            dir_rel, parent_ignores = stack.pop()
+            dir_abs = os.path.join(self.root, dir_rel) if dir_rel else self.root
+            try:
+                with os.scandir(dir_abs) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                print(f"Warning: Could not scan directory {dir_abs}: {e}")
+                continue
+
+            ignores = parent_ignores
+            if self.use_gitignore:
+                for entry in entries:
+                    if entry.name == ".gitignore":
+                        try:
+                            ignore = self._load_gitignore(dir_rel, entry.stat())
+                        except OSError:
+                            ignore = None
+                        if ignore is not None:
+                            ignores = parent_ignores + ((dir_rel, ignore),)
+                        break
+            if want_dirs:
+                yield ScanEntry(dir_rel, dir_abs, None)
+
+            subdirs = []
+            for entry in entries:
+                name = entry.name
+                if self.matcher.is_excluded_name(name):
+                    continue
+                rel_path = f"{dir_rel}/{name}" if dir_rel else name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self._is_ignored(rel_path, True, ignores):
+                            subdirs.append((rel_path, ignores))
+                        continue
+                    if want_dirs or (self.code_only and not self.matcher.has_code_extension(name)):
+                        continue
+                    if not entry.is_file() or self._is_ignored(rel_path, False, ignores):
+                        continue
+                    yield ScanEntry(rel_path, entry.path, entry.stat())
+                except OSError:
+                    continue  # Vanished or unreadable while scanning
+            stack.extend(reversed(subdirs))  # Depth-first, in name order
+
+    def walk(self, start_rel=""):
+        """Yields a ScanEntry for every (code) file under start_rel that is not excluded or ignored."""
+        return self._scan(start_rel, want_dirs=False)
+
+    def iter_dirs(self, start_rel=""):
+        """Yields a ScanEntry (stat=None) for start_rel and every non-excluded directory below it."""
+        return self._scan(start_rel, want_dirs=True)
@@ -0,0 +1,329 @@
+# file_watcher.py
+
+import os
+import sys
+import atexit
+import time
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from pathlib import Path
+from utils import load_json, save_json
+from file_scanner import FileScanner
+from constants import FILE_WATCHER_MODE, FILE_WATCHER_POLL_INTERVAL, FILE_WATCHER_FLUSH_INTERVAL
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _load_libc_inotify():
+    """Returns libc with the inotify functions, or None when inotify is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirtySet:
+    """
+    Thread-safe set of project-relative paths changed since the last drain, persisted to
+    dirty_files.json. Paths ending in '/' are directories whose whole subtree must be re-checked.
+    'generation' is bumped whenever events may have been lost, so a reconciliation walk that
+    started before the loss cannot mark the set as trustworthy again.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        persisted = load_json(self.path) or {}
+        self._paths = set(persisted.get("paths", []))
+        self._dirty_since_flush = bool(self._paths)
+        self.reconciled = False  # Events before the watcher started are unknown until a full walk
+        self.generation = 0
+
+    def add(self, rel_path):
+        with self._lock:
+            self._paths.add(rel_path)
+            self._dirty_since_flush = True
+
+    def invalidate(self):
+        """Marks the set untrustworthy (event overflow, watch failure, .gitignore change)."""
+        with self._lock:
+            self.reconciled = False
+            self.generation += 1
+
+    def drain(self):
+        """Returns (paths, reconciled, generation) and empties the set."""
+        with self._lock:
+            paths, self._paths = self._paths, set()
+            self._dirty_since_flush = True
+            return paths, self.reconciled, self.generation
+
+    def restore(self, paths):
+        """Puts drained paths back, e.g. when the check that drained them failed."""
+        with self._lock:
+            self._paths.update(paths)
+            self._dirty_since_flush = True
+
+    def mark_reconciled(self, generation):
+        """Called after a full walk; ignored if events were lost while it ran."""
+        with self._lock:
+            if generation == self.generation:
+                self.reconciled = True
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._paths)
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty_since_flush:
+                return
+            data = {"paths": sorted(self._paths), "updated_at": time.time()}
+            self._dirty_since_flush = False
+        save_json(data, self.path)
+
+
+class ProjectWatcher:
+    """
+    Background thread feeding a project's DirtySet. Uses inotify on Linux and falls back to
+    polling (size, mtime) of the code files every FILE_WATCHER_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, source_path, output_dir, mode=FILE_WATCHER_MODE):
+        self.source_path = Path(source_path).resolve()
+        self.scanner = FileScanner(self.source_path)
+        self.dirty = DirtySet(Path(output_dir) / "dirty_files.json")
+        self.mode = mode
+        self.backend = None  # "inotify" or "poll" once started
+        self._stop = threading.Event()
+        self._thread = None
+        self._fd = None
+        self._wd_paths = {}  # watch descriptor -> project-relative directory ("" for the root)
+        self._poll_snapshot = {}
+        self._last_flush = 0.0
+
+    # --- Path filtering (FileInventory re-checks .gitignore rules when it drains the set) ---
+    def _mark_file(self, rel_path):
+        if self.scanner.matcher.is_code_file(rel_path):
+            self.dirty.add(rel_path)
+
+    def _mark_dir(self, rel_path):
+        if rel_path and not self.scanner.matcher.is_excluded_path(rel_path):
+            self.dirty.add(rel_path.rstrip("/") + "/")
+
+    # --- Lifecycle ---
+    def start(self):
+        libc = _load_libc_inotify() if self.mode in ("auto", "inotify") else None
+        if libc is not None and self._start_inotify(libc):
+            self.backend = "inotify"
+            target = self._run_inotify
+        else:
+            if self.mode == "inotify":
+                print(f"Watcher: inotify unavailable for {self.source_path}, polling instead.")
+            self.backend = "poll"
+            self._poll_snapshot = self._take_poll_snapshot()
+            target = self._run_poll
+        self._thread = threading.Thread(target=target, name=f"watcher-{self.source_path.name}", daemon=True)
+        self._thread.start()
+        print(f"Watcher: watching {self.source_path} ({self.backend}).")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.dirty.flush()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _maybe_flush(self):
+        now = time.monotonic()
+        if now - self._last_flush >= FILE_WATCHER_FLUSH_INTERVAL:
+            self._last_flush = now
+            self.dirty.flush()
+
+    # --- inotify backend ---
+    def _start_inotify(self, libc):
+        self._libc = libc
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            print(f"Watcher: inotify_init1 failed ({os.strerror(ctypes.get_errno())}).")
+            return False
+        self._fd = fd
+        if not self._add_watches(""):
+            os.close(fd)
+            self._fd = None
+            self._wd_paths = {}
+            return False
+        return True
+
+    def _add_watches(self, top_rel):
+        """Watches 'top_rel' and every non-excluded directory below it. Returns False on failure."""
+        for entry in self.scanner.iter_dirs(top_rel):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(entry.path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    print("Watcher: inotify watch limit reached (fs.inotify.max_user_watches).")
+                    return False
+                continue  # Directory vanished or unreadable; the reconciliation walk covers it
+            self._wd_paths[wd] = entry.rel_path
+        return True
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._fd], [], [], 1.0)
+            except (OSError, ValueError):
+                break
+            if ready:
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    data = b""
+                except OSError as e:
+                    print(f"Watcher: inotify read failed: {e}")
+                    self.dirty.invalidate()
+                    break
+                self._handle_events(data)
+            self._maybe_flush()
+
+    def _handle_events(self, data):
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                print("Watcher: inotify queue overflowed; next check will do a full walk.")
+                self.dirty.invalidate()
+                continue
+            if mask & IN_IGNORED:
+                self._wd_paths.pop(wd, None)
+                continue
+            parent = self._wd_paths.get(wd)
+            if parent is None:
+                continue
+            if not name:  # Event on the watched directory itself (deleted or moved away)
+                if parent == "":
+                    self.dirty.invalidate()  # Project root moved/deleted
+                else:
+                    self._mark_dir(parent)
+                continue
+            rel_path = f"{parent}/{name}" if parent else name
+            if name == ".gitignore":
+                # The set of tracked files may have changed: re-walk next check and watch newly included dirs
+                self.dirty.invalidate()
+                self._add_watches(parent)
+                continue
+            if mask & IN_ISDIR:
+                if self.scanner.matcher.is_excluded_name(name):
+                    continue
+                self._mark_dir(rel_path)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # New subtree: watch it; files created before the watch landed are covered by the dir mark
+                    if not self._add_watches(rel_path):
+                        self.dirty.invalidate()
+            else:
+                self._mark_file(rel_path)
+
+    # --- Polling backend ---
+    def _take_poll_snapshot(self):
+        return {entry.rel_path: (entry.stat.st_size, entry.stat.st_mtime_ns) for entry in self.scanner.walk()}
+
+    def _run_poll(self):
+        while not self._stop.wait(FILE_WATCHER_POLL_INTERVAL):
+            try:
+                snapshot = self._take_poll_snapshot()
+            except Exception as e:
+                print(f"Watcher: polling {self.source_path} failed: {e}")
+                self.dirty.invalidate()
+                continue
+            for rel_path in snapshot.keys() | self._poll_snapshot.keys():
+                if snapshot.get(rel_path) != self._poll_snapshot.get(rel_path):
+                    self.dirty.add(rel_path)
+            self._poll_snapshot = snapshot
+            self._maybe_flush()
+
+
+# --- Process-wide registry, keyed by project output directory ---
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def watch_project(source_path, output_dir):
+    """Starts (once) a watcher for the project. Returns it, or None when watching is disabled."""
+    if FILE_WATCHER_MODE == "off" or not Path(source_path).is_dir():
+        return None
+    key = str(Path(output_dir).resolve())
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is not None and watcher.is_alive() and watcher.source_path == Path(source_path).resolve():
+            return watcher
+        if watcher is not None:
+            watcher.stop()
+        watcher = ProjectWatcher(source_path, output_dir)
+        try:
+            watcher.start()
+        except Exception as e:
+            print(f"Watcher: could not watch {source_path}: {e}")
+            return None
+        _watchers[key] = watcher
+        return watcher
+
+
+def unwatch_project(output_dir):
+    """Stops the project's watcher, if any (e.g. when its ProjectManager leaves the registry)."""
+    with _watchers_lock:
+        watcher = _watchers.pop(str(Path(output_dir).resolve()), None)
+    if watcher is not None:
+        watcher.stop()
+
+
+def get_watcher(output_dir):
+    """Returns the running watcher for a project output directory, or None."""
+    watcher = _watchers.get(str(Path(output_dir).resolve()))
+    return watcher if watcher is not None and watcher.is_alive() else None
+
+
+def stop_all():
+    with _watchers_lock:
+        watchers = list(_watchers.values())
+        _watchers.clear()
+    for watcher in watchers:
+        watcher.stop()
+
+
+atexit.register(stop_all)  # Flush dirty sets and close inotify descriptors at shutdown
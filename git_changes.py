@@ -0,0 +1,66 @@
+# git_changes.py
+
+import os
+import shutil
+import subprocess
+from constants import GIT_TIMEOUT_SECONDS
+
+
+class GitRepo:
+    """
+    Read-only view of the git work tree containing a project's source directory, used to list
+    the files changed since a commit without hashing the whole tree. Only the local repository
+    is read (HEAD, index and work tree); nothing is fetched. Paths are relative to the source
+    directory, which may be a subdirectory of the work tree.
+    """
+
+    def __init__(self, source_path):
+        self.source_path = str(source_path)
+
+    @classmethod
+    def open(cls, source_path):
+        """Returns a GitRepo when git is installed and source_path is inside a work tree, else None."""
+        if shutil.which("git") is None or not os.path.isdir(source_path):
+            return None
+        repo = cls(source_path)
+        out = repo._git("rev-parse", "--is-inside-work-tree")
+        return repo if out is not None and out.strip() == b"true" else None
+
+    def _git(self, *args):
+        """Runs git in the source directory; returns stdout bytes, or None if it failed."""
+        try:
+            result = subprocess.run(
+                ["git", "-C", self.source_path, *args],
+                capture_output=True, timeout=GIT_TIMEOUT_SECONDS,
+                env=dict(os.environ, GIT_OPTIONAL_LOCKS="0", LC_ALL="C"),  # Never take the index lock
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Git: 'git {args[0]}' failed in {self.source_path}: {e}")
+            return None
+        return result.stdout if result.returncode == 0 else None
+
+    def head_commit(self):
+        out = self._git("rev-parse", "--verify", "--quiet", "HEAD^{commit}")
+        return out.decode().strip() if out else None
+
+    def changes_since(self, commit):
+        """
+        Returns (changed, deleted): sets of paths added, modified or deleted between 'commit' and
+        the current work tree (committed, staged or not), untracked non-ignored files counting
+        as added. Returns None if git fails, e.g. when the commit no longer exists.
+        """
+        diff = self._git("diff", "--name-status", "-z", "--no-renames", "--no-ext-diff", "--relative",
+                         "--ignore-submodules", commit, "--")
+        if diff is None:
+            return None
+        untracked = self._git("ls-files", "--others", "--exclude-standard", "-z")
+        if untracked is None:
+            return None
+        changed, deleted = set(), set()
+        fields = diff.split(b"\0")
+        for status, path in zip(fields[0::2], fields[1::2]):
+            if not status:
+                continue
+            (deleted if status.startswith(b"D") else changed).add(os.fsdecode(path))
+        changed.update(os.fsdecode(path) for path in untracked.split(b"\0") if path)
+        return changed, deleted
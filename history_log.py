@@ -0,0 +1,268 @@
+# history_log.py
+
+import os
+import json
+import uuid
+import threading
+from pathlib import Path
+from utils import serialize_data
+from constants import HISTORY_LOG_MAX_SEGMENT_BYTES, HISTORY_LOG_COMPACT_RATIO
+
+_GENERATION_TAG = "#generation"
+
+
+class HistoryLog:
+    """
+    Append-only JSONL log of id-keyed entries (query or modification history).
+
+    Entries are appended to numbered segments (<name>.000001.jsonl, ...); a new segment is
+    started once the active one exceeds HISTORY_LOG_MAX_SEGMENT_BYTES. A sidecar index
+    (<name>.idx, also append-only) maps each id to (segment, offset, length) so get() is a
+    single seek. Deleting appends a tombstone; compact() rewrites only the live entries, and
+    runs automatically once more than HISTORY_LOG_COMPACT_RATIO of the bytes are dead.
+    The index starts with a generation line that changes whenever it is recreated, so other
+    processes notice a compaction regardless of the new index size.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = Path(base_path)
+        self.index_path = self.base_path.with_name(self.base_path.name + ".idx")
+        self._lock = threading.RLock()
+        self._index = {}  # id -> (segment, offset, length)
+        self._index_pos = 0  # Bytes of the index file already applied
+        self._generation = ""  # Generation of the index file those bytes came from
+        self._dead_bytes = 0
+        self._total_bytes = 0
+        self._loaded = False
+
+    # --- Files ---
+    def _segment_path(self, segment):
+        return self.base_path.with_name(f"{self.base_path.name}.{segment:06d}.jsonl")
+
+    def segments(self):
+        """Existing segment numbers, oldest first."""
+        prefix = self.base_path.name + "."
+        numbers = []
+        if self.base_path.parent.is_dir():
+            for path in self.base_path.parent.glob(f"{self.base_path.name}.*.jsonl"):
+                number = path.name[len(prefix):-len(".jsonl")]
+                if number.isdigit():
+                    numbers.append(int(number))
+        return sorted(numbers)
+
+    def files(self):
+        return [self._segment_path(s) for s in self.segments()] + \
+            ([self.index_path] if self.index_path.exists() else [])
+
+    def exists(self):
+        return bool(self.segments())
+
+    # --- Index ---
+    @staticmethod
+    def _header_generation(line):
+        parts = line.decode("utf-8", "replace").rstrip("\n").split("\t")
+        return parts[1] if len(parts) == 2 and parts[0] == _GENERATION_TAG else ""
+
+    def _reset_index(self):
+        self._index, self._index_pos, self._dead_bytes, self._total_bytes = {}, 0, 0, 0
+        self._generation = ""
+
+    def _apply_index_line(self, line):
+        parts = line.rstrip("\n").split("\t")
+        if len(parts) == 2 and parts[0] == _GENERATION_TAG:
+            self._generation = parts[1]
+        elif len(parts) == 2 and parts[1] == "-":
+            old = self._index.pop(parts[0], None)
+            if old:
+                self._dead_bytes += old[2]
+        elif len(parts) == 4:
+            old = self._index.get(parts[0])
+            if old:
+                self._dead_bytes += old[2]
+            self._index[parts[0]] = (int(parts[1]), int(parts[2]), int(parts[3]))
+            self._total_bytes += int(parts[3])
+
+    def _sync_index(self):
+        """Applies index lines appended since the last call (possibly by another process)."""
+        try:
+            f = open(self.index_path, "rb")
+        except FileNotFoundError:
+            if self._index_pos or self.exists():
+                self._rebuild_index()
+            return
+        with f:  # One handle, so the header and the new lines come from the same index file
+            if self._index_pos and self._header_generation(f.readline()) != self._generation:
+                self._reset_index()  # Index was recreated (compaction elsewhere)
+            f.seek(self._index_pos)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]  # Ignore a partially written last line
+        for line in complete.decode("utf-8").splitlines():
+            self._apply_index_line(line)
+        self._index_pos += len(complete)
+        self._loaded = True
+        self._recover_tail()
+
+    def _recover_tail(self):
+        """Indexes records appended to the active segment whose index line was never written (crash)."""
+        segments = self.segments()
+        if not segments:
+            return
+        active = segments[-1]
+        indexed_end = max((off + length for seg, off, length in self._index.values() if seg == active), default=0)
+        path = self._segment_path(active)
+        if path.stat().st_size <= indexed_end:
+            return
+        with open(path, "rb") as f:
+            f.seek(indexed_end)
+            offset = indexed_end
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                self._index_record(active, offset, raw)
+                offset += len(raw)
+
+    def _index_record(self, segment, offset, raw):
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            return
+        entry_id = entry.get("id")
+        if not entry_id:
+            return
+        line = f"{entry_id}\t-\n" if entry.get("_deleted") else f"{entry_id}\t{segment}\t{offset}\t{len(raw)}\n"
+        self._write_index_line(line)
+
+    def _write_index_line(self, line):
+        if not self.index_path.exists():  # New index file: start a new generation
+            line = f"{_GENERATION_TAG}\t{uuid.uuid4().hex}\n" + line
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(line)
+        for applied in line.splitlines(keepends=True):
+            self._apply_index_line(applied)
+        self._index_pos += len(line.encode("utf-8"))
+
+    def _rebuild_index(self):
+        """Recreates the index by scanning every segment."""
+        self._reset_index()
+        self._loaded = True
+        self.index_path.unlink(missing_ok=True)
+        for segment in self.segments():
+            offset = 0
+            with open(self._segment_path(segment), "rb") as f:
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break
+                    self._index_record(segment, offset, raw)
+                    offset += len(raw)
+
+    # --- Writes ---
+    def _append_raw(self, record):
+        raw = (json.dumps(serialize_data(record), ensure_ascii=False) + "\n").encode("utf-8")
+        segments = self.segments()
+        segment = segments[-1] if segments else 1
+        path = self._segment_path(segment)
+        if path.exists() and path.stat().st_size + len(raw) > HISTORY_LOG_MAX_SEGMENT_BYTES and path.stat().st_size:
+            segment += 1  # Rotate: start a new segment, older ones are never appended to again
+            path = self._segment_path(segment)
+        with open(path, "ab") as f:
+            offset = f.tell()
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        return segment, offset, raw
+
+    def append(self, entry):
+        """Appends (or supersedes, for an existing id) an entry. Constant time."""
+        with self._lock:
+            self._sync_index()
+            segment, offset, raw = self._append_raw(entry)
+            self._write_index_line(f"{entry['id']}\t{segment}\t{offset}\t{len(raw)}\n")
+
+    def delete(self, entry_id):
+        with self._lock:
+            self._sync_index()
+            if entry_id not in self._index:
+                return False
+            self._append_raw({"id": entry_id, "_deleted": True})
+            self._write_index_line(f"{entry_id}\t-\n")
+            if self._total_bytes and self._dead_bytes / self._total_bytes > HISTORY_LOG_COMPACT_RATIO:
+                self.compact()
+            return True
+
+    def compact(self, entries=None):
+        """
+        Rewrites the log with only the live entries (or with 'entries', replacing the content),
+        in insertion order and split at the rotation size, then swaps it in and rebuilds the index.
+        """
+        with self._lock:
+            if entries is None:
+                entries = self.list()
+            tmp_paths = []
+            out, size = None, 0
+            for entry in entries:
+                raw = (json.dumps(serialize_data(entry), ensure_ascii=False) + "\n").encode("utf-8")
+                if out is None or (size and size + len(raw) > HISTORY_LOG_MAX_SEGMENT_BYTES):
+                    if out:
+                        out.close()
+                    tmp_paths.append(self.base_path.with_name(f"{self.base_path.name}.compact{len(tmp_paths) + 1}.tmp"))
+                    out, size = open(tmp_paths[-1], "wb"), 0
+                out.write(raw)
+                size += len(raw)
+            if out:
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+            for path in self.files():
+                path.unlink(missing_ok=True)
+            for number, tmp_path in enumerate(tmp_paths, start=1):
+                tmp_path.replace(self._segment_path(number))
+            self._rebuild_index()
+
+    # --- Reads ---
+    def get(self, entry_id):
+        with self._lock:
+            self._sync_index()
+            location = self._index.get(entry_id)
+        if location is None:
+            return None
+        segment, offset, length = location
+        try:
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                return json.loads(f.read(length))
+        except (OSError, ValueError) as e:
+            print(f"Error reading {entry_id} from {self._segment_path(segment).name}: {e}")
+            return None
+
+    def list(self):
+        """All live entries in insertion order (a superseded id appears at its latest position)."""
+        with self._lock:
+            self._sync_index()
+            live = {(seg, off) for seg, off, _ in self._index.values()}
+        entries = []
+        for segment in self.segments():
+            offset = 0
+            with open(self._segment_path(segment), "rb") as f:
+                for raw in f:
+                    if (segment, offset) in live:
+                        entries.append(json.loads(raw))
+                    offset += len(raw)
+        return entries
+
+    def count(self):
+        with self._lock:
+            self._sync_index()
+            return len(self._index)
+
+
+# One HistoryLog per file per process, so the in-memory index is loaded once
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def open_history_log(base_path):
+    key = str(Path(base_path).resolve())
+    with _logs_lock:
+        if key not in _logs:
+            _logs[key] = HistoryLog(base_path)
+        return _logs[key]
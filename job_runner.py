@@ -0,0 +1,171 @@
+# job_runner.py
+
+import time
+import uuid
+import threading
+import concurrent.futures
+from datetime import datetime
+from pathlib import Path
+from constants import JOB_MAX_CONCURRENT, JOB_HISTORY_LIMIT
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when its cancellation has been requested."""
+
+
+class Job:
+    """State of one background job: progress counters, ETA, log and cancellation flag."""
+
+    def __init__(self, project_key, description):
+        self.id = str(uuid.uuid4())
+        self.project_key = project_key
+        self.description = description
+        self.status = "queued"  # queued, running, completed, failed, cancelled
+        self.total = 0
+        self.done = 0
+        self.current_file = None
+        self.messages = []  # (category, message) tuples, like flash()
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.progress_started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- Called from the job's thread ---
+    def log(self, message, category="info"):
+        with self._lock:
+            self.messages.append((category, message))
+        print(f"[job {self.id[:8]}] {message}")
+
+    def advance(self, done, total, current_file=None):
+        """Progress callback compatible with CodeSummarizer.summarize_files."""
+        with self._lock:
+            if self.progress_started_at is None:
+                self.progress_started_at = time.time()
+            self.total = total
+            self.done = done
+            self.current_file = current_file
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    # --- Called from request threads ---
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def eta_seconds(self):
+        if not self.progress_started_at or not self.done or self.done >= self.total:
+            return None
+        elapsed = time.time() - self.progress_started_at
+        return round(elapsed / self.done * (self.total - self.done), 1)
+
+    def to_dict(self):
+        with self._lock:
+            now = self.finished_at or time.time()
+            return {
+                "id": self.id,
+                "description": self.description,
+                "status": self.status,
+                "cancel_requested": self.cancel_event.is_set(),
+                "total": self.total,
+                "done": self.done,
+                "percent": round(100.0 * self.done / self.total, 1) if self.total else 0.0,
+                "current_file": self.current_file,
+                "eta_seconds": self.eta_seconds(),
+                "elapsed_seconds": round(now - self.started_at, 1) if self.started_at else 0.0,
+                "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+                "finished_at": datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+                "messages": [{"category": c, "message": m} for c, m in self.messages],
+            }
+
+
+def resolve_project_key(local_storage_path):
+    """Jobs are keyed by the resolved project storage path, however the caller spelled it."""
+    return str(Path(local_storage_path).resolve())
+
+
+class JobRunner:
+    """
+    Runs jobs on a bounded thread pool so long operations such as project summarization
+    don't tie up web workers. At most one unfinished job is allowed per project key.
+    """
+
+    def __init__(self, max_workers=JOB_MAX_CONCURRENT, history_limit=JOB_HISTORY_LIMIT):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.history_limit = history_limit
+
+    def submit(self, project_key, description, fn):
+        """
+        Schedules fn(job) and returns the Job. If the project already has an unfinished
+        job, that job is returned instead and nothing new is scheduled.
+        """
+        project_key = resolve_project_key(project_key)
+        with self._lock:
+            active = self.active_job(project_key, _locked=True)
+            if active:
+                return active
+            job = Job(project_key, description)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.check_cancelled()
+            job.result = fn(job)
+            # Work functions that report errors as a result ({"status": "error", ...}) rather than raising
+            failed = isinstance(job.result, dict) and job.result.get("status") == "error"
+            job.status = "failed" if failed else "completed"
+        except Exception as e:
+            # Work code may raise its own cancellation error (e.g. ScanCancelled) once the flag is set
+            if isinstance(e, JobCancelled) or job.cancel_event.is_set():
+                job.status = "cancelled"
+                job.log("Job cancelled.", "warning")
+            else:
+                job.status = "failed"
+                job.log(f"Job failed: {e}", "error")
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.created_at)
+        for job in finished[:max(0, len(finished) - self.history_limit)]:
+            self._jobs.pop(job.id, None)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_job(self, project_key, _locked=False):
+        """Returns the unfinished job for project_key, if any."""
+        if not _locked:
+            with self._lock:
+                return self.active_job(resolve_project_key(project_key), _locked=True)
+        return next((j for j in self._jobs.values() if j.project_key == project_key and not j.finished), None)
+
+    def jobs_for(self, project_key):
+        """Returns the project's jobs, newest first."""
+        project_key = resolve_project_key(project_key)
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.project_key == project_key]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id, project_key):
+        """Requests cancellation of an unfinished job of the given project; False otherwise."""
+        job = self.get(job_id)
+        if not job or job.finished or job.project_key != resolve_project_key(project_key):
+            return False
+        job.cancel()
+        return True
@@ -1,5 +1,11 @@
 
+import json
+import asyncio
+import weakref
+import contextvars
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 # Import API libraries (conditional imports to avoid hard dependencies)
 try:
     import anthropic
@@ -10,7 +16,71 @@ try:
     import openai
 except ImportError:
     openai = None
+
+try:
+    import httpx  # Installed alongside the openai/anthropic SDKs; used for async Ollama calls
+except ImportError:
+    httpx = None
 import google.generativeai as genai
+from token_budget import count_tokens, context_window as model_context_window
+from constants import LLM_MAX_OUTPUT_TOKENS, OLLAMA_NUM_CTX, PROMPT_CACHE_ENABLED, ANTHROPIC_CACHE_MIN_TOKENS, \
+    OLLAMA_KEEP_ALIVE
+
+# Keep-alive connection pool sizes shared by every client of a provider
+POOL_MAX_CONNECTIONS = 100
+POOL_MAX_KEEPALIVE = 20
+
+###############################################################################
+# Shared connection pools
+###############################################################################
+# Sync pools are keyed by (service, endpoint); async pools additionally by event loop,
+# because httpx/SDK async clients are bound to the loop they were first used on. The loop
+# objects themselves are weak keys, so a loop's clients go away with it (a closed loop's id
+# may be reused by a later one, which an id-keyed pool would confuse with the dead loop).
+_pool_lock = threading.Lock()
+_sync_sessions = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {key: client}
+
+
+def _get_sync_session(key):
+    """Returns a keep-alive requests.Session shared by all clients using `key`."""
+    with _pool_lock:
+        session = _sync_sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_MAX_KEEPALIVE, pool_maxsize=POOL_MAX_CONNECTIONS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sync_sessions[key] = session
+        return session
+
+
+def _get_async_client(key, factory):
+    """Returns the async client shared by `key` on the running event loop, creating it with factory()."""
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        # Drop pools of loops that were closed (e.g. by asyncio.run) but are still referenced elsewhere
+        for closed_loop in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[closed_loop]
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = factory()
+            clients[key] = client
+        return client
+
+
+async def close_async_pools():
+    """Closes the async clients created on the running event loop (call before the loop ends)."""
+    with _pool_lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if close:
+            try:
+                await close()
+            except Exception as e:
+                print(f"Error closing async LLM client: {e}")
 
 ###############################################################################
 # LLM_Client Class
@@ -18,13 +88,30 @@ import google.generativeai as genai
 class LLM_Client:
     """
     A generic LLM client class that supports 'claude', 'openai', or 'deepseek'.
-    It provides a get_response() method to return a response given a prompt.
+    It provides a get_response() method to return a response given a prompt, and
+    asyncio-native aget_response()/astream_response() counterparts. HTTP connections
+    are kept alive in pools shared by every client of the same provider.
+
+    context_window and max_output_tokens default to the model's entry in MODEL_CONTEXT_WINDOWS
+    and the service's LLM_MAX_OUTPUT_TOKENS; prompt_token_limit() is what remains for the prompt.
+
+    Prompts may be split into a stable 'prefix' (e.g. project context shared by many requests)
+    and the rest, so providers can serve the prefix from their prompt cache. After each
+    call, last_usage holds the token usage (cached tokens included) seen by the calling thread
+    or asyncio task.
     """
-    def __init__(self, llm_service: str, model_name: str, api_key: str,ollama_host: str = "http://localhost:11434"):
+    def __init__(self, llm_service: str, model_name: str, api_key: str,ollama_host: str = "http://localhost:11434",
+                 context_window: int = None, max_output_tokens: int = None):
         self.llm_service = llm_service.lower()
         self.model_name = model_name
         self.api_key = api_key
         self.ollama_host = ollama_host
+        # last_usage, per calling thread or asyncio task (clients are shared)
+        self._usage = contextvars.ContextVar(f"llm_usage_{id(self)}", default=None)
+        self.max_output_tokens = max_output_tokens or LLM_MAX_OUTPUT_TOKENS.get(self.llm_service, 4096)
+        self.context_window = context_window or model_context_window(model_name)
+        if self.llm_service == "ollama" and not context_window and OLLAMA_NUM_CTX:
+            self.context_window = min(self.context_window, OLLAMA_NUM_CTX)  # Sent as num_ctx
 
         
         if self.llm_service == "anthropic":
@@ -40,8 +127,8 @@ class LLM_Client:
                 raise Exception("Deepseek library not found. Install with: pip install deepseek")
             self.client = openai.OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
         elif self.llm_service == "ollama":
-            # No specific client initialization needed for Ollama; using requests directly.
-            pass
+            # No SDK for Ollama; requests go through a pooled session shared per host.
+            self.session = _get_sync_session(("ollama", self.ollama_host))
         elif self.llm_service == "google":
             if genai is None:
                 raise Exception("Google AI library not found. Install with: pip install google-generativeai")
@@ -52,67 +139,240 @@ class LLM_Client:
         else:
             raise ValueError(f"Unsupported LLM service: {self.llm_service}")
     
-    def get_response(self, prompt: str) -> str:
+    # --- Token accounting ---
+    def count_tokens(self, text):
+        return count_tokens(text, self.model_name)
+
+    def prompt_token_limit(self):
+        """Tokens a prompt may use: the context window minus the room kept for the response."""
+        return max(0, self.context_window - self.max_output_tokens)
+
+    # --- Usage reporting ---
+    @property
+    def last_usage(self):
+        """Token usage of the calling thread's or task's last call (None if the provider gave none)."""
+        return self._usage.get()
+
+    def _record_usage(self, input_tokens=None, output_tokens=None, cached_tokens=None, cache_write_tokens=None):
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                 "cached_tokens": cached_tokens, "cache_write_tokens": cache_write_tokens}
+        self._usage.set(usage)
+        if cached_tokens or cache_write_tokens:
+            print(f"Prompt cache ({self.llm_service}): {cached_tokens or 0} of {input_tokens} input tokens read "
+                  f"from cache, {cache_write_tokens or 0} written.")
+
+    def _record_response_usage(self, response):
+        usage = getattr(response, "usage", None) or getattr(response, "usage_metadata", None)
+        if usage is None:
+            self._usage.set(None)
+        elif self.llm_service == "anthropic":
+            cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+            cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+            # Anthropic's input_tokens excludes the cached and cache-written parts
+            self._record_usage(usage.input_tokens + cache_read + cache_write, usage.output_tokens, cache_read, cache_write)
+        elif self.llm_service in ("openai", "deepseek"):
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(usage, "prompt_cache_hit_tokens", None)  # DeepSeek
+            if cached is None and details is not None:
+                cached = getattr(details, "cached_tokens", None)  # OpenAI
+            self._record_usage(usage.prompt_tokens, usage.completion_tokens, cached)
+        elif self.llm_service == "google":
+            self._record_usage(getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None),
+                               getattr(usage, "cached_content_token_count", None))
+
+    # --- Request builders shared by the sync and async paths ---
+    def _anthropic_kwargs(self, prompt, prefix=""):
+        content = prefix + prompt
+        if prefix and PROMPT_CACHE_ENABLED and self.count_tokens(prefix) >= ANTHROPIC_CACHE_MIN_TOKENS:
+            # Cache breakpoint after the shared prefix; the system prompt before it is cached with it
+            content = [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                       {"type": "text", "text": prompt}]
+        return dict(
+            model=self.model_name,
+            max_tokens=self.max_output_tokens,
+            temperature=0.7,
+            system="You are a helpful assistant that specializes in explaining complex concepts simply.",
+            messages=[{"role": "user", "content": content}]
+        )
+
+    def _chat_kwargs(self, prompt, prefix=""):
+        # OpenAI and DeepSeek cache the longest previously seen prompt prefix automatically
+        return dict(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prefix + prompt}],
+            max_tokens=self.max_output_tokens
+        )
+
+    def _ollama_payload(self, prompt, stream=False, prefix=""):
+        # A loaded Ollama model reuses the KV cache of the previous prompt's common prefix,
+        # so keep it loaded between requests
+        payload = {
+            "model": self.model_name,
+            "prompt": prefix + prompt,
+            "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+        }
+        if OLLAMA_NUM_CTX:
+            payload["options"] = {"num_ctx": self.context_window}
+        return payload
+
+    def _google_generation_config(self):
+        return {
+            "temperature": 0.7,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+    @staticmethod
+    def _google_text(response):
+        if response.parts:
+            return response.text
+        elif response.prompt_feedback.block_reason:
+            return f"Blocked by Google API: {response.prompt_feedback.block_reason}"
+        else:
+            # Try accessing text directly, might work for simpler responses or older API versions
+            try:
+                return response.text
+            except AttributeError:
+                return f"Could not extract text from Google response. Full response: {response}"
+
+    def get_response(self, prompt: str, timeout: float = None, prefix: str = "") -> str:
+        """
+        Returns the model's response to prefix + prompt. If timeout (seconds) is given it is passed
+        down to the HTTP request, so a hung call is eventually torn down by the transport.
+        """
+        # SDKs treat an explicit timeout=None as "no timeout", so only pass it when set
+        sdk_timeout = {"timeout": timeout} if timeout is not None else {}
+        self._usage.set(None)
         try:
             if self.llm_service == "anthropic":
-                response = self.client.messages.create(
-                    model=self.model_name,
-                    max_tokens=15000,
-                    temperature=0.7,
-                    system="You are a helpful assistant that specializes in explaining complex concepts simply.",
-                    messages=[{"role": "user", "content": prompt}]
-                )
+                response = self.client.messages.create(**self._anthropic_kwargs(prompt, prefix), **sdk_timeout)
+                self._record_response_usage(response)
                 return response.content[0].text
-            elif self.llm_service == "openai":
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=15000
-                )
-                return response.choices[0].message.content
-            elif self.llm_service == "deepseek":
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=8192
-                )
+            elif self.llm_service in ("openai", "deepseek"):
+                response = self.client.chat.completions.create(**self._chat_kwargs(prompt, prefix), **sdk_timeout)
+                self._record_response_usage(response)
                 return response.choices[0].message.content
             elif self.llm_service == "ollama":
-                response = requests.post(
+                response = self.session.post(
                     f"{self.ollama_host}/api/generate",
-                    json={
-                        "model": self.model_name,
-                        "prompt": prompt,
-                        "stream": False
-                    }
+                    json=self._ollama_payload(prompt, prefix=prefix),
+                    timeout=timeout
                 )
                 response.raise_for_status()
-                return response.json().get("response", "No response from Ollama")
+                data = response.json()
+                # prompt_eval_count only counts the prompt tokens Ollama had to evaluate (not reused)
+                self._record_usage(data.get("prompt_eval_count"), data.get("eval_count"))
+                return data.get("response", "No response from Ollama")
             elif self.llm_service == "google":
-                generation_config = {
-                        "temperature": 0.7,
-                        "max_output_tokens": 15192,
-                    }
-
-                response  = self.client.generate_content(
-                        prompt,
-                        generation_config=generation_config  # Pass config here if needed
+                response = self.client.generate_content(
+                        prefix + prompt,
+                        generation_config=self._google_generation_config(),
+                        request_options=sdk_timeout or None
                     )
-                if response.parts:
-                    return response.text
-                elif response.prompt_feedback.block_reason:
-                    return f"Blocked by Google API: {response.prompt_feedback.block_reason}"
-                else:
-                    # Try accessing text directly, might work for simpler responses or older API versions
-                    try:
-                        return response.text
-                    except AttributeError:
-                        return f"Could not extract text from Google response. Full response: {response}"
-                # Optionally check if model exists or store model instance, but configuration is key
-                # self.client = genai.GenerativeModel(self.model_name) # Could instantiate here or in get_response
+                self._record_response_usage(response)
+                return self._google_text(response)
         except Exception as e:
             print(f"Error in LLM_Client.get_response: {e}")
             return f"Error generating summary: {str(e)}"
+
+    # --- Async API ---
+    def _async_client(self):
+        """Returns the pooled async client for this provider on the running event loop."""
+        if self.llm_service == "anthropic":
+            return _get_async_client(("anthropic", self.api_key),
+                                     lambda: anthropic.AsyncAnthropic(api_key=self.api_key))
+        elif self.llm_service == "openai":
+            return _get_async_client(("openai", self.api_key),
+                                     lambda: openai.AsyncOpenAI(api_key=self.api_key))
+        elif self.llm_service == "deepseek":
+            return _get_async_client(("deepseek", self.api_key),
+                                     lambda: openai.AsyncOpenAI(api_key=self.api_key, base_url="https://api.deepseek.com"))
+        elif self.llm_service == "ollama":
+            if httpx is None:
+                raise Exception("httpx library not found. Install with: pip install httpx")
+            return _get_async_client(("ollama", self.ollama_host), lambda: httpx.AsyncClient(
+                base_url=self.ollama_host,
+                timeout=None,
+                limits=httpx.Limits(max_connections=POOL_MAX_CONNECTIONS, max_keepalive_connections=POOL_MAX_KEEPALIVE)
+            ))
+        return None  # google: the GenerativeModel manages its own async transport
+
+    async def aget_response(self, prompt: str, prefix: str = "") -> str:
+        """Async counterpart of get_response(); many calls can be awaited concurrently."""
+        self._usage.set(None)
+        try:
+            if self.llm_service == "anthropic":
+                response = await self._async_client().messages.create(**self._anthropic_kwargs(prompt, prefix))
+                self._record_response_usage(response)
+                return response.content[0].text
+            elif self.llm_service in ("openai", "deepseek"):
+                response = await self._async_client().chat.completions.create(**self._chat_kwargs(prompt, prefix))
+                self._record_response_usage(response)
+                return response.choices[0].message.content
+            elif self.llm_service == "ollama":
+                response = await self._async_client().post("/api/generate", json=self._ollama_payload(prompt, prefix=prefix))
+                response.raise_for_status()
+                data = response.json()
+                self._record_usage(data.get("prompt_eval_count"), data.get("eval_count"))
+                return data.get("response", "No response from Ollama")
+            elif self.llm_service == "google":
+                response = await self.client.generate_content_async(
+                    prefix + prompt,
+                    generation_config=self._google_generation_config()
+                )
+                self._record_response_usage(response)
+                return self._google_text(response)
+        except Exception as e:
+            print(f"Error in LLM_Client.aget_response: {e}")
+            return f"Error generating summary: {str(e)}"
+
+    async def astream_response(self, prompt: str, prefix: str = ""):
+        """
+        Async generator yielding response text chunks as the provider streams them. Usage is
+        recorded in last_usage once the stream is exhausted.
+        """
+        self._usage.set(None)
+        try:
+            if self.llm_service == "anthropic":
+                async with self._async_client().messages.stream(**self._anthropic_kwargs(prompt, prefix)) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    self._record_response_usage(await stream.get_final_message())
+            elif self.llm_service in ("openai", "deepseek"):
+                stream = await self._async_client().chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **self._chat_kwargs(prompt, prefix))
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    if getattr(chunk, "usage", None):  # Final chunk, without choices
+                        self._record_response_usage(chunk)
+            elif self.llm_service == "ollama":
+                async with self._async_client().stream("POST", "/api/generate",
+                                                       json=self._ollama_payload(prompt, stream=True, prefix=prefix)) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        data = json.loads(line)
+                        if data.get("response"):
+                            yield data["response"]
+                        if data.get("done"):
+                            self._record_usage(data.get("prompt_eval_count"), data.get("eval_count"))
+                            break
+            elif self.llm_service == "google":
+                response = await self.client.generate_content_async(
+                    prefix + prompt,
+                    generation_config=self._google_generation_config(),
+                    stream=True
+                )
+                async for chunk in response:
+                    if chunk.parts:
+                        yield chunk.text
+                self._record_response_usage(response)
+        except Exception as e:
+            print(f"Error in LLM_Client.astream_response: {e}")
+            yield f"Error generating summary: {str(e)}"
+
 if __name__ == "__main__":
     from dotenv import load_dotenv
     import os
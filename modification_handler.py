@@ -7,6 +7,7 @@ import difflib
 from datetime import datetime
 from pathlib import Path # Use Path object
 from utils import read_file_content, write_file_content, backup_file, save_json, load_json # Ensure save/load_json are imported
+from token_budget import PromptBudget
 import re
 class ModificationHandler:
     def __init__(self, project_manager, clients_mapping):
@@ -21,8 +22,7 @@ class ModificationHandler:
         return self.temp_dir / f"{temp_id}.json"
 
     def prepare_modification_prompt(self, query_id, client_type):
-        history = self.pm.load_query_history()
-        query_entry = next((item for item in history if item.get("id") == query_id), None)
+        query_entry = self.pm.get_query(query_id)
 
         if not query_entry:
             print(f"Error: Query ID {query_id} not found.")
@@ -49,13 +49,14 @@ class ModificationHandler:
 
 
 
-        prompt = f"""
-You are a code modification expert. I need you to modify the following files according to this requirement:
-
-USER REQUIREMENT:
-{query_entry.get('input_query', '')}
+        # The instructions and project summary come first and are the same for every modification
+        # of the project, so providers can serve them from their prompt cache (LLM_Client prefix).
+        combined = self.pm.load_combined_summary() or {}
+        project_summary = combined.get("project_summary") if isinstance(combined, dict) else None
+        prefix = """
+You are a code modification expert. I need you to modify files of a project according to a user requirement.
 
-You will be given the current code and specific modification instructions for one or more files.
+You will be given the requirement, then the current code and specific modification instructions for one or more files.
 Carefully apply the instructions to the provided code.
 Respond ONLY with the complete, modified code for each file, enclosed in triple backticks, clearly indicating the file path before each block.
 
@@ -78,9 +79,23 @@ IMPORTANT:
 3. Include all imports and dependencies
 4. Do not omit any sections of the code
 5. Make only the changes needed to fulfill the requirements
+"""
+        if project_summary:
+            prefix += f"\nPROJECT SUMMARY (for context):\n{project_summary}\n"
+        prompt = f"""
+USER REQUIREMENT:
+{query_entry.get('input_query', '')}
 
 Here are the files to modify:
 """
+        # The response repeats every file in full, so the file bodies must fit the client's output
+        # room as well as its prompt limit. Files come in the query's order (most relevant first);
+        # one whose body does not fit is left out of this modification entirely.
+        client = self.clients_mapping.get(client_type)
+        budget = PromptBudget(getattr(client, "max_output_tokens", None),
+                              client.prompt_token_limit() if hasattr(client, "prompt_token_limit") else None,
+                              getattr(client, "model_name", None))
+        budget.reserve(prefix + prompt)
         file_contents = {}
         files_processed_count = 0
         project_base_path = Path(self.pm.project_path).resolve() # Use resolved Path
@@ -105,15 +120,21 @@ Here are the files to modify:
             content = read_file_content(str(full_path))
             instructions = file_info.get('instructions_to_modify', '').strip()
 
-            # Add file section to prompt regardless of whether content exists
-            prompt += f"\n=== FILE: {relative_path_for_prompt} ===\nINSTRUCTIONS: {instructions}\n"
+            section = f"\n=== FILE: {relative_path_for_prompt} ===\nINSTRUCTIONS: {instructions}\n"
             if content is not None:
-                prompt += f"CURRENT CODE:\n```{content}\n```\n"
+                section += f"CURRENT CODE:\n```{content}\n```\n"
+                if not budget.add(section, relative_path_for_prompt, required=files_processed_count == 0):
+                    print(f"Warning: '{relative_path_for_prompt}' does not fit the token budget of {client_type}; "
+                          f"left out of this modification.")
+                    continue
+                prompt += section
                 # Store actual content for diff later
                 file_contents[relative_path_for_prompt] = content
             else:
                 # Indicate it's a new file or couldn't be read
-                prompt += f"CURRENT CODE: (New File or Read Error)\n```\n```\n" # Empty code block
+                section += f"CURRENT CODE: (New File or Read Error)\n```\n```\n" # Empty code block
+                budget.reserve(section)
+                prompt += section
                 # Store empty string for diff later (treat as new)
                 file_contents[relative_path_for_prompt] = ""
                 print(f"Note: File '{relative_path_for_prompt}' not found or unreadable. Will treat as new file generation.")
@@ -123,10 +144,18 @@ Here are the files to modify:
         if files_processed_count == 0:
             print(f"Error: Could not prepare any files for modification/generation for query {query_id}.")
             return None, None, None
+        print(f"Modification prompt: ~{budget.used} tokens (model limit {budget.hard_limit}), "
+              f"{len(budget.dropped)} file(s) left out.")
+        if budget.over_limit:
+            print(f"Error: The modification prompt (~{budget.used} tokens) exceeds the prompt limit of "
+                  f"{budget.model_name} ({budget.hard_limit} tokens); not preparing it.")
+            return None, None, None
 
         temp_id = str(uuid.uuid4())
+        prompt = prefix + prompt
         large_data_to_save = {
             "modification_prompt": prompt,
+            "modification_prompt_prefix": prefix,  # Cacheable leading part of modification_prompt
             "original_file_contents": file_contents # Will contain "" for new files
         }
         temp_filepath = self._get_temp_filepath(temp_id)
@@ -140,7 +169,8 @@ Here are the files to modify:
         small_session_data = {
             "query_id": query_id,
             "modification_client_type": client_type,
-            "involved_files": list(file_contents.keys())
+            "involved_files": list(file_contents.keys()),
+            "prompt_budget": budget.report()  # Token estimate, and files left out to fit it
         }
 
         return temp_id, prompt, small_session_data
@@ -246,7 +276,8 @@ Here are the files to modify:
             return None
 
         prompt = large_data.get("modification_prompt")
-        print(f"Prompt in process_modifications:\n{prompt[:1000]}")
+        prefix = large_data.get("modification_prompt_prefix") or ""
+        print(f"Prompt in process_modifications:\n{prompt[:1000] if prompt else prompt}")
         original_contents = large_data.get("original_file_contents")
 
         if not prompt or not original_contents:
@@ -268,7 +299,10 @@ Here are the files to modify:
         try:
             # ... (LLM call logic remains the same) ...
             if hasattr(client, 'get_response'):
-                llm_response_raw = client.get_response(prompt)
+                if prefix and prompt.startswith(prefix):
+                    llm_response_raw = client.get_response(prompt[len(prefix):], prefix=prefix)
+                else:
+                    llm_response_raw = client.get_response(prompt)
             else:
                 raise NotImplementedError(f"LLM interaction method not defined for client type: {client_type}")
 
@@ -283,7 +317,8 @@ Here are the files to modify:
             # Prepare response details for return (will be saved to session by caller)
             llm_response_details = {
                 "llm_response": llm_response_raw if llm_response_raw else f"Error during LLM call: {llm_error}",
-                "llm_response_time": elapsed 
+                "llm_response_time": elapsed,
+                "llm_usage": getattr(client, "last_usage", None)
             }
 
 
@@ -469,7 +504,6 @@ Here are the files to modify:
             return None
 
         # Record the modifications in history
-        history = pm.load_modifications_history()
         modification_entry = {
             "id": str(uuid.uuid4()),
             "query_id": query_id,
@@ -477,10 +511,11 @@ Here are the files to modify:
             "files_modified": modification_results,
             "llm_response": llm_response,
             "response_time": llm_response_time,
-            "modification_client_type": client_type
+            "modification_client_type": client_type,
+            "prompt_budget": small_session_data.get("prompt_budget"),
+            "llm_usage": small_session_data.get("llm_usage")
         }
-        history.append(modification_entry)
-        pm.save_modifications_history(history)
+        pm.add_modification(modification_entry)
 
         # Clean up the temporary file
         temp_filepath = self._get_temp_filepath(temp_id)
@@ -496,7 +531,7 @@ Here are the files to modify:
         # ... (Revert logic remains largely the same) ...
         # Ensure it uses safe path joining and normalization
         pm = self.pm
-        record = next((mod for mod in pm.load_modifications_history() if mod.get("id") == modification_id), None)
+        record = pm.get_modification(modification_id)
         # ... (rest of revert logic) ...
         if not record:
             print(f"Error: Modification record {modification_id} not found.")
@@ -2,11 +2,25 @@
 
 import os
 import json
-import hashlib
+import threading
+from collections import OrderedDict, Counter
 from pathlib import Path
 from datetime import datetime
-from constants import  DEFAULT_EXCLUDES, AGGREGATED_SUMMARY_PROMPT, CODE_EXTENSIONS
 from utils import load_json, save_json, safe_filename  # (Define safe_filename below or in utils)
+from code_summarizer import ScanCancelled
+from file_hasher import FileHasher
+from file_scanner import FileScanner
+from file_inventory import FileInventory
+from file_watcher import unwatch_project
+from dependency_graph import DependencyGraph
+from symbol_index import SymbolIndex
+from git_changes import GitRepo
+from bm25_index import BM25Index
+from vector_index import VectorIndex
+from query_cache import QueryCache
+from project_store import open_store
+from constants import PROJECT_REGISTRY_SIZE, PROJECT_SUMMARY_REFRESH_FRACTION, PROJECT_SUMMARY_DEBOUNCE_SECONDS, \
+    CHANGE_DETECTION_BACKEND, VECTOR_INDEX_ENABLED, VECTOR_SEARCH_LIMIT, SEARCH_RRF_K
 
 
 def read_file_content(file_path):
@@ -35,6 +49,11 @@ class ProjectManager:
         self.project_path_obj = Path(project_path) # Keep Path object for operations
         self.output_dir = Path(output_dir)
         self.project_name = self.output_dir.name # Derive name from output dir
+        self.hasher = FileHasher() # Parallel file hashing for change detection
+        self.scanner = FileScanner(self.project_path_obj) # Shared exclusion/.gitignore-aware source walker
+        self.inventory = FileInventory(self.project_path_obj, self.output_dir, self.scanner, self.hasher)
+        self.dependency_graph = DependencyGraph(self.inventory) # Import graph, built lazily on first refresh()
+        self.symbol_index = SymbolIndex(self.inventory) # Definitions/usages lookup, also built on first refresh()
 
         # Ensure the main output directory exists
         self.output_dir.mkdir(parents=True, exist_ok=True)
@@ -47,10 +66,20 @@ class ProjectManager:
 
         self.combined_json_path = self.output_dir / 'combined_code_summary.json'
         self.combined_html_path = self.output_dir / 'combined_code_summary.html'
-        self.project_record_path = self.output_dir / 'project_record.json'
-        self.query_history_path = self.output_dir / 'query_history.json'
-        self.modifications_history_path = self.output_dir / 'modifications_history.json'
-        self.file_hashes_path = self.output_dir / 'file_hashes.json'
+        self.directory_summaries_path = self.output_dir / 'directory_summaries.json' # Cached directory rollups
+        self.scan_journal_path = self.output_dir / 'scan_journal.jsonl' # Checkpoints of the current/last full scan
+        # Record, hashes and histories live in the project store (project.db, or the JSON files above)
+        self.store = open_store(self.output_dir)
+        self.search_index = BM25Index(self.output_dir, self.project_path_obj) # Query-time file selection
+        self.vector_index = VectorIndex(self.output_dir) # Semantic counterpart of search_index
+        self.query_cache = QueryCache(self.output_dir) # Answers of repeated queries on unchanged summaries
+        # In-memory copies of the record, hashes and combined summary, each tagged with the file
+        # version (mtime, size) it was read at; a changed version means another writer, so re-read.
+        self._cache_lock = threading.RLock()
+        self._record_cache = None  # (version, record)
+        self._hashes_cache = None  # (version, hashes, algorithm)
+        self._summary_cache = None  # (version, combined summary)
+        self._git_repo = False  # GitRepo, or None for non-git sources; looked up on first use
 
         print(f"ProjectManager initialized:")
         print(f"  Source Path: {self.project_path}")
@@ -69,23 +98,11 @@ class ProjectManager:
         self.temp_dir.mkdir(exist_ok=True)
         self.proposed_modifications_dir.mkdir(exist_ok=True)
 
-        # Initialize project record if it doesn't exist
-        if not self.project_record_path.exists():
+        # Create the store (migrating existing JSON files) and the project record if it doesn't exist
+        self.store.initialize()
+        if not self.store.has_record():
             self._init_project_record(status="new" if is_new else "initialized")
 
-        # Initialize other JSON files if they don't exist
-        if not self.file_hashes_path.exists():
-            save_json({}, self.file_hashes_path)
-            print(f"  Created empty: {self.file_hashes_path.name}")
-
-        if not self.query_history_path.exists():
-            save_json([], self.query_history_path)
-            print(f"  Created empty: {self.query_history_path.name}")
-
-        if not self.modifications_history_path.exists():
-            save_json([], self.modifications_history_path)
-            print(f"  Created empty: {self.modifications_history_path.name}")
-
         # Create empty summary only for truly new projects or if missing
         if (is_new or not self.combined_json_path.exists()):
              # Check again to avoid race conditions? Unlikely here.
@@ -102,13 +119,14 @@ class ProjectManager:
 
 
     def _init_project_record(self, status="initialized"):
-        """Initializes the project_record.json file."""
+        """Initializes the project record in the project store."""
         record = {
             "project_name": self.project_name,
             "source_code_path": self.project_path, # Store string path
             "local_storage_path": str(self.output_dir),
             "created_at": datetime.now().isoformat(),
             "last_summarized": None,
+            "last_summarized_commit": None, # git HEAD at the last summarization (git change detection)
             "last_checked": None,
             "summary_count": 0, # Number of times summarization ran? Or files summarized? Let's say files.
             "query_count": 0,
@@ -118,8 +136,8 @@ class ProjectManager:
             "status": status, # e.g., 'initialized', 'new', 'summarized', 'needs_update', 'error'
             "file_selection": [] # Stores the tree structure from project_files.html selection
         }
-        save_json(record, self.project_record_path)
-        print(f"  Initialized project record: {self.project_record_path.name} with status '{status}'")
+        self.store.save_record(record)
+        print(f"  Initialized project record ({self.store.backend} store) with status '{status}'")
 
     def get_project_info(self):
         """Returns basic project information."""
@@ -134,28 +152,39 @@ class ProjectManager:
         }
 
     def get_project_record(self):
-        """Loads and returns the project record dictionary."""
-        if not self.project_record_path.exists():
+        """Returns (a copy of) the project record dictionary, re-reading it only when the store changed."""
+        with self._cache_lock:
+            version = self.store.record_version()
+            if self._record_cache and self._record_cache[0] == version:
+                return dict(self._record_cache[1])
+            record = self._read_project_record()
+            if record is not None:
+                self._record_cache = (version, record) # Stamp taken before reading: a racing write forces a re-read
+                return dict(record)
+            return None
+
+    def _read_project_record(self):
+        if not self.store.has_record():
             print(f"Warning: Project record file missing for {self.project_name}. Reinitializing.")
             # Attempt to reinitialize based on current state
             is_new_check = not any(self.project_path_obj.iterdir()) if self.project_path_obj.is_dir() else True
             self._ensure_project_structure(is_new=is_new_check)
             # Try loading again
-            if not self.project_record_path.exists():
+            if not self.store.has_record():
                 print(f"Error: Failed to create project record for {self.project_name}.")
                 return None # Return None if it still fails
-        return load_json(self.project_record_path)
+        return self.store.get_record()
 
     def update_project_record(self, data):
-        """Updates the project record with new data."""
-        record = self.get_project_record()
-        if record:
+        """Updates the project record with new data (only the given keys are written)."""
+        if self.get_project_record() is not None:
             # Convert datetime objects in data to isoformat strings before saving
             for key, value in data.items():
                  if isinstance(value, datetime):
                      data[key] = value.isoformat()
-            record.update(data)
-            save_json(record, self.project_record_path)
+            with self._cache_lock:
+                record = self.store.update_record(data)
+                self._record_cache = (self.store.record_version(), record) if record is not None else None
         else:
             print(f"Warning: Could not load project record for {self.project_name}. Update failed.")
 
@@ -164,9 +193,7 @@ class ProjectManager:
         Checks if a potentially meaningful summary exists.
         Returns True if the combined summary file exists and contains file entries.
         """
-        if not self.combined_json_path.exists():
-            return False
-        summary_data = load_json(self.combined_json_path)
+        summary_data = self.load_combined_summary()
         # Check if it's a dict and has a non-empty 'files' dictionary
         return isinstance(summary_data, dict) and bool(summary_data.get("files"))
 
@@ -187,34 +214,9 @@ class ProjectManager:
                 self.update_project_record(record)
             return True
 
-        # Walk the directory, looking for code files
-        for root, dirs, files in os.walk(self.project_path_obj, topdown=True):
-            # Prune excluded directories
-            dirs[:] = [d for d in dirs if d not in DEFAULT_EXCLUDES]
-
-            try:
-                rel_root = Path(root).relative_to(self.project_path_obj)
-                if any(part in DEFAULT_EXCLUDES for part in rel_root.parts):
-                    # Skip descending further into excluded directories
-                    dirs[:] = []
-                    continue
-            except ValueError:
-                # Should not happen if walk starts within project_path, but just in case
-                continue
-
-            for file in files:
-                ext = os.path.splitext(file)[1]
-                if ext in CODE_EXTENSIONS:
-                    # Check if file path itself is excluded
-                    try:
-                        full_path = Path(root) / file
-                        rel_file_path = full_path.relative_to(self.project_path_obj)
-                        if not any(part in DEFAULT_EXCLUDES for part in rel_file_path.parts):
-                            # Found at least one valid code file => Not empty
-                            return False
-                    except ValueError:
-                        # Should not happen, but skip if we can't compute a relative path
-                        continue
+        # Any processable code file means the project is not empty
+        if not self.inventory.refresh().is_empty():
+            return False
 
         # If we finish the loop, no code files were found. Update the record to reflect empty/new.
         record = self.get_project_record() or {}
@@ -254,7 +256,7 @@ class ProjectManager:
                       return {"status": "not_summarized", "message": "Project has not been summarized yet."}
 
 
-        summary_data = load_json(self.combined_json_path)
+        summary_data = self.load_combined_summary()
         if not summary_data:
             self.update_project_record({"status": "error_loading_summary"})
             return {"status": "error_loading_summary", "message": "Failed to load existing summary data."}
@@ -294,7 +296,7 @@ class ProjectManager:
             }
 
     def compute_file_hash(self, file_path):
-        """Computes MD5 hash for a given file path (can be relative or absolute)."""
+        """Computes the file hash (self.hasher's algorithm) for a given file path (can be relative or absolute)."""
         abs_file_path = Path(file_path)
         if not abs_file_path.is_absolute():
             # Assume relative to project source path
@@ -302,49 +304,166 @@ class ProjectManager:
         if not abs_file_path.is_file():
             # print(f"Warning: Path is not a file, cannot compute hash: {abs_file_path}")
             return None
+        return self.hasher.hash_file(abs_file_path)
+
+    def _load_file_hashes(self):
+        """Returns (hashes, algorithm); hashes saved before the algorithm was recorded report md5."""
+        with self._cache_lock:
+            version = self.store.hashes_version()
+            if not (self._hashes_cache and self._hashes_cache[0] == version):
+                hashes, algorithm = self.store.get_file_hashes()
+                self._hashes_cache = (version, hashes, algorithm)
+            return dict(self._hashes_cache[1]), self._hashes_cache[2]
+
+    def _save_file_hashes(self, hashes):
+        with self._cache_lock:
+            self.store.save_file_hashes(hashes, self.hasher.algorithm)
+            self._hashes_cache = (self.store.hashes_version(), dict(hashes), self.hasher.algorithm)
+
+    def combined_summary_version(self):
+        """(mtime_ns, size) of the combined summary, None if missing; changes whenever it is rewritten."""
         try:
-            hasher = hashlib.md5()
-            with open(abs_file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(4096)
-                    if not chunk:
-                        break
-                    hasher.update(chunk)
-            return hasher.hexdigest()
-        except Exception as e:
-            print(f"Error computing hash for {abs_file_path}: {e}")
+            st = self.combined_json_path.stat()
+        except OSError:
             return None
+        return st.st_mtime_ns, st.st_size
+
+    def save_combined_summary(self, combined):
+        """Writes combined_code_summary.json and brings the search indexes up to date with it."""
+        save_json(combined, self.combined_json_path)
+        version = self.combined_summary_version()
+        try:
+            self.search_index.update(combined, version)
+        except Exception as e:
+            print(f"Warning: Could not update the search index: {e}")
+        if VECTOR_INDEX_ENABLED:
+            try:
+                self.vector_index.update(combined, version) # Re-embeds only the rewritten entries
+            except Exception as e:
+                print(f"Warning: Could not update the vector index: {e}")
 
-    def get_modified_files(self):
+    def search_files(self, query, limit=None):
+        """
+        [(rel_path, score)] of summarized files matching the query, best first: the BM25 ranking
+        and (if VECTOR_INDEX_ENABLED) the VECTOR_SEARCH_LIMIT nearest files by embedding,
+        merged by reciprocal rank fusion.
+        """
+        combined = self.load_combined_summary()
+        if not combined:
+            return []
+        version = self.combined_summary_version()
+        rankings = [self.search_index.ensure(combined, version).search(query)]
+        if VECTOR_INDEX_ENABLED:
+            try:
+                rankings.append(self.vector_index.ensure(combined, version).search(query, VECTOR_SEARCH_LIMIT))
+            except Exception as e:
+                print(f"Warning: Vector search unavailable, using BM25 only: {e}")
+        fused = Counter()
+        for ranking in rankings:
+            for rank, (rel_path, _) in enumerate(ranking):
+                fused[rel_path] += 1.0 / (SEARCH_RRF_K + rank + 1)
+        return fused.most_common(limit)
+
+    def load_combined_summary(self):
+        """
+        Returns the combined summary (None if missing or invalid), re-reading the file only when
+        its mtime or size changed. The dict is shared between callers: treat it as read-only and
+        use load_json() to get a copy to modify.
+        """
+        with self._cache_lock:
+            version = self.combined_summary_version()
+            if version is None:
+                self._summary_cache = None
+                return None
+            if not (self._summary_cache and self._summary_cache[0] == version):
+                self._summary_cache = (version, load_json(self.combined_json_path))
+            return self._summary_cache[1]
+
+    def get_git_repo(self):
+        """The source's GitRepo, or None when change detection by git is off or unavailable."""
+        if self._git_repo is False:
+            self._git_repo = GitRepo.open(self.project_path) if CHANGE_DETECTION_BACKEND == "auto" else None
+        return self._git_repo
+
+    def record_summarized_commit(self):
+        """
+        Stores the source's git HEAD as last_summarized_commit, the base of the next git change
+        check, along with the files that already differed from it (their summaries describe the
+        work tree, not the commit).
+        """
+        repo = self.get_git_repo()
+        head = repo.head_commit() if repo else None
+        changes = repo.changes_since(head) if head else None
+        if changes is None:
+            return
+        dirty = sorted(rel for rel in changes[0] | changes[1] if self.scanner.is_tracked(rel))
+        self.update_project_record({"last_summarized_commit": head, "last_summarized_dirty": dirty})
+
+    def _rank_modified_files(self, modified_files):
+        # Most depended-upon files first, so the summaries that matter most are refreshed first.
+        # Only the modified files are re-parsed; the rest of the graph is taken as persisted.
+        if len(modified_files) < 2:
+            return modified_files
+        try:
+            return self.dependency_graph.refresh(modified_files).rank(modified_files)
+        except Exception as e:
+            print(f"Warning: Could not rank modified files by dependencies: {e}")
+            return modified_files
+
+    def _get_modified_files_git(self, current_hashes, selected_files):
+        """
+        Git backend of get_modified_files: only the files git reports as changed since
+        last_summarized_commit (plus those dirty at that time, and selected files never hashed)
+        are hashed; every other file is taken as unchanged. Returns None when git cannot answer,
+        e.g. for non-git sources or an unknown commit, so the caller hashes instead.
+        """
+        record = self.get_project_record() or {}
+        base = record.get("last_summarized_commit")
+        repo = self.get_git_repo()
+        if not base or repo is None:
+            return None
+        changes = repo.changes_since(base)
+        if changes is None:
+            print(f"Git change check unavailable for commit {base[:12]}, hashing instead.")
+            return None
+        changed, deleted = changes
+        candidates = {rel for rel in changed | set(record.get("last_summarized_dirty") or [])
+                      if self.scanner.is_tracked(rel) and (not selected_files or rel in selected_files)}
+        candidates |= {rel for rel in selected_files if rel not in current_hashes}
+
+        new_hashes = {rel: h for rel, h in current_hashes.items()
+                      if rel not in deleted and rel not in candidates and (not selected_files or rel in selected_files)}
+        paths = {rel: str(self.project_path_obj / rel) for rel in sorted(candidates) if (self.project_path_obj / rel).is_file()}
+        computed = self.hasher.hash_many(paths.values())
+        for rel, path in paths.items():
+            if computed.get(path):
+                new_hashes[rel] = computed[path] # Deleted or unreadable files drop out
+        modified_files = sorted(rel for rel in candidates if rel in new_hashes and current_hashes.get(rel) != new_hashes[rel])
+        print(f"Change check (git): {len(candidates)} candidate(s) since {base[:12]}, {len(modified_files)} modified.")
+
+        if new_hashes != current_hashes:
+            self._save_file_hashes(new_hashes)
+            self.update_project_record({"file_count": len(new_hashes)})
+        return self._rank_modified_files(modified_files)
+
+    def get_modified_files(self, full_hash=False):
         """
         Compares current file hashes in the source directory against stored hashes.
         Updates the stored hashes (file_hashes.json).
         Returns a list of relative paths of modified or new files relevant to the selection.
+
+        For git checkouts with a recorded last_summarized_commit, only the files git lists as
+        changed since that commit are hashed (see _get_modified_files_git). Otherwise current
+        hashes come from the file inventory, which only re-hashes files whose size, mtime or
+        inode changed. Pass full_hash=True to re-walk and re-hash every file regardless.
         """
-        current_hashes = load_json(self.file_hashes_path) or {}
-        new_hashes = {}
-        modified_files = []
-        found_files_in_source = set() # Track all processable files found
-        record = self.get_project_record()
-        selected_files_from_record = set() # Files marked as 'checked' in the record
-
-        # Extract selected files from the project record's file_selection tree
-        if record and isinstance(record.get("file_selection"), list):
-            def extract_checked(tree_nodes):
-                paths = set()
-                for node in tree_nodes:
-                    if isinstance(node, dict):
-                        if node.get("type") == "file" and node.get("checked"):
-                            rel = node.get("relative_path")
-                            if rel: paths.add(str(rel).replace("\\", "/"))
-                        elif node.get("type") == "folder":
-                            # Only add children if the folder itself is considered selected
-                            # How to determine if folder is selected? If it contains ANY checked file? Or explicit folder checkbox?
-                            # Current JS doesn't seem to have folder checkboxes, so rely on file checks.
-                             paths.update(extract_checked(node.get("children", []))) # Recursive check
-                return paths
-            selected_files_from_record = extract_checked(record["file_selection"])
-            # print(f"Debug: Selected files from record: {selected_files_from_record}")
+        current_hashes, stored_algorithm = self._load_file_hashes()
+        # Hashes stored with another algorithm (e.g. legacy md5) are migrated: each file is hashed
+        # with both, the old digest decides whether it changed and the new one is saved.
+        migrating = stored_algorithm != self.hasher.algorithm and bool(current_hashes)
+        if migrating:
+            print(f"Migrating file hashes from {stored_algorithm} to {self.hasher.algorithm}...")
+        selected_files_from_record = self.get_selected_files() # Files marked as 'checked' in the record
 
         # Check if source path exists
         if not self.project_path_obj.is_dir():
@@ -353,95 +472,79 @@ class ProjectManager:
             # Clear hashes and return empty list? Or list of removed files?
             # Let's clear hashes and return empty, assuming user needs to fix path or summarize.
             if current_hashes:
-                 save_json({}, self.file_hashes_path)
+                 self._save_file_hashes({})
             return []
 
-        # Walk the source directory
-        try:
-            for root, dirs, files in os.walk(self.project_path_obj, topdown=True):
-                # Prune excluded directories early
-                dirs[:] = [d for d in dirs if d not in DEFAULT_EXCLUDES]
-
-                # Check if the current directory itself should be excluded based on relative path
-                try:
-                    rel_root_path = Path(root).relative_to(self.project_path_obj)
-                    if any(part in DEFAULT_EXCLUDES for part in rel_root_path.parts):
-                        # print(f"Skipping excluded directory root: {rel_root_path}")
-                        dirs[:] = [] # Don't process files in this dir or descend further
-                        continue
-                except ValueError:
-                     print(f"Warning: Could not get relative path for {root}")
-                     continue # Skip this directory
-
-                for file in files:
-                    ext = os.path.splitext(file)[1]
-                    if ext in CODE_EXTENSIONS:
-                        full_path = Path(root) / file
-                        try:
-                            # Get relative path, normalized
-                            rel_path_str = str(full_path.relative_to(self.project_path_obj)).replace("\\", "/")
-
-                            # Final check if any part of the relative path is excluded
-                            if any(part in DEFAULT_EXCLUDES for part in Path(rel_path_str).parts):
-                                # print(f"Skipping excluded file path: {rel_path_str}")
-                                continue
-
-                            found_files_in_source.add(rel_path_str) # Track this file
-
-                            # Determine if this file should be checked for modification
-                            # Check if:
-                            # 1. No specific selection exists in record (check all found files) OR
-                            # 2. This file is in the set of selected files from the record
-                            is_relevant_for_check = not selected_files_from_record or rel_path_str in selected_files_from_record
-
-                            if is_relevant_for_check:
-                                new_hash = self.compute_file_hash(full_path)
-                                if new_hash is None:
-                                    print(f"Warning: Could not compute hash for {rel_path_str}, skipping.")
-                                    continue # Skip files we can't hash
-
-                                new_hashes[rel_path_str] = new_hash # Store the current hash
-
-                                # Check if modified compared to *stored* hash
-                                if rel_path_str not in current_hashes or current_hashes[rel_path_str] != new_hash:
-                                    modified_files.append(rel_path_str)
-                                    # print(f"Detected change/new file: {rel_path_str}")
-
-                        except ValueError:
-                            print(f"Warning: Could not compute relative path for {full_path}")
-                            continue
-                        except Exception as walk_err:
-                             print(f"Error processing file {full_path}: {walk_err}")
-                             continue # Skip problematic file
+        if not full_hash and not migrating:
+            modified_files = self._get_modified_files_git(current_hashes, selected_files_from_record)
+            if modified_files is not None:
+                return modified_files
 
+        try:
+            self.inventory.refresh(force_walk=full_hash or migrating)
         except Exception as e:
             print(f"Error walking directory {self.project_path}: {e}")
             # Return empty list or raise? Let's return empty for now.
             return []
 
-        # Update the stored hashes:
-        # Keep only hashes for files found AND relevant (i.e., selected or all if no selection)
-        final_hashes_to_save = {}
-        if not selected_files_from_record: # No selection, save hashes for all found processable files
-             final_hashes_to_save = {k: v for k, v in new_hashes.items() if k in found_files_in_source}
-        else: # Selection exists, save hashes only for selected files that were found
-             final_hashes_to_save = {k: v for k, v in new_hashes.items() if k in selected_files_from_record and k in found_files_in_source}
+        # Determine which files should be checked for modification:
+        # all found files if no selection exists, otherwise the selected files that were found
+        relevant_files = [rel for rel in self.inventory.paths()
+                          if not selected_files_from_record or rel in selected_files_from_record]
+        new_hashes = self.inventory.hashes(relevant_files, rehash=full_hash)
+        legacy_hashes = {}
+        if migrating:
+            legacy_hasher = FileHasher(stored_algorithm)
+            legacy_hashes = {rel: legacy_hasher.hash_file(self.project_path_obj / rel)
+                             for rel in new_hashes if rel in current_hashes}
 
+        modified_files = []
+        for rel_path_str, new_hash in new_hashes.items():
+            # Check if modified compared to *stored* hash (in the stored algorithm while migrating)
+            comparable_hash = legacy_hashes.get(rel_path_str) if migrating else new_hash
+            if rel_path_str not in current_hashes or current_hashes[rel_path_str] != comparable_hash:
+                modified_files.append(rel_path_str)
+
+        print(f"Change check: {len(new_hashes)} file(s) tracked, {self.inventory.last_hashed_count} re-hashed"
+              f"{' (full hash)' if full_hash else ''}.")
 
         # Only save if the hashes actually changed to avoid unnecessary writes
-        if final_hashes_to_save != current_hashes:
-             save_json(final_hashes_to_save, self.file_hashes_path)
-             # print(f"Updated file hashes saved. {len(final_hashes_to_save)} files tracked.")
+        if new_hashes != current_hashes or stored_algorithm != self.hasher.algorithm:
+             self._save_file_hashes(new_hashes)
              # Update file count in project record
-             self.update_project_record({"file_count": len(final_hashes_to_save)})
-
+             self.update_project_record({"file_count": len(new_hashes)})
 
         # Return the list of modified files that are relevant to the current selection
-        return modified_files
+        return self._rank_modified_files(modified_files)
 
-
-    def update_modified_summaries(self, modified_files, summarizer):
-        """Updates summaries only for the provided list of modified files."""
+    def get_selected_files(self):
+        """Relative paths checked in the project record's file_selection tree (empty set if no selection)."""
+        record = self.get_project_record()
+        if not record or not isinstance(record.get("file_selection"), list):
+            return set()
+        def extract_checked(tree_nodes):
+            paths = set()
+            for node in tree_nodes:
+                if isinstance(node, dict):
+                    if node.get("type") == "file" and node.get("checked"):
+                        rel = node.get("relative_path")
+                        if rel: paths.add(str(rel).replace("\\", "/"))
+                    elif node.get("type") == "folder":
+                        # Current JS doesn't have folder checkboxes, so rely on file checks.
+                        paths.update(extract_checked(node.get("children", []))) # Recursive check
+            return paths
+        return extract_checked(record["file_selection"])
+
+
+    def update_modified_summaries(self, modified_files, summarizer, progress_callback=None, cancel_event=None,
+                                  refresh_project_summary=None):
+        """
+        Updates summaries only for the provided list of modified files.
+        progress_callback(done, total, rel_path) is called after each file; setting cancel_event
+        stops before the next file and raises ScanCancelled without saving the combined summary.
+        The project summary is refreshed per _refresh_project_summary; pass refresh_project_summary
+        True to force the LLM regeneration, or False to only patch in the changed files.
+        """
         if not self.combined_json_path.exists():
             print("Warning: Combined summary file does not exist. Cannot update modified files. Run full summarization.")
             # Or maybe initialize an empty one here? Let's require full summary first.
@@ -455,8 +558,14 @@ class ProjectManager:
         print(f"Updating summaries for {len(modified_files)} modified file(s)...")
         updated_count = 0
         total_lines_updated = 0 # Track line changes for record update
-
-        for rel_path_str in modified_files:
+        old_concise = {path: data.get("concise_summary") for path, data in combined["files"].items()
+                       if isinstance(data, dict)}
+
+        for done, rel_path_str in enumerate(modified_files, start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ScanCancelled("Summary update cancelled")
+            if progress_callback:
+                progress_callback(done - 1, len(modified_files), rel_path_str)
             full_path = self.project_path_obj / rel_path_str.replace("\\", "/") # Ensure Path object
             if not full_path.exists():
                 print(f"Warning: File {rel_path_str} listed as modified but not found. Removing from summary.")
@@ -481,9 +590,18 @@ class ProjectManager:
                 total_lines_updated -= old_lines # Adjust total lines
                 continue
 
+            out_file = self.summaries_dir / (safe_filename(rel_path_str) + ".json")
+            source_file = out_file.with_suffix(".src") # Content the current summary was made from
+            previous = combined["files"].get(rel_path_str)
             print(f"Summarizing modified file: {rel_path_str}")
             try:
-                detailed, concise = summarizer.summarize_file_combined(content, str(full_path))
+                result = None
+                if isinstance(previous, dict) and source_file.exists():
+                    # Revise the existing summary from a diff; None means the change needs a full summary
+                    result = summarizer.summarize_file_incremental(
+                        content, str(full_path), read_file_content(source_file),
+                        previous.get("detailed_summary"), previous.get("concise_summary"))
+                detailed, concise = result or summarizer.summarize_file_combined(content, str(full_path))
                 lines = len(content.splitlines())
                 size = full_path.stat().st_size
                 old_lines = combined["files"].get(rel_path_str, {}).get("lines", 0)
@@ -496,9 +614,11 @@ class ProjectManager:
                 }
                 combined["files"][rel_path_str] = file_entry
                 total_lines_updated += (lines - old_lines) # Accumulate line difference
-                # Also save individual summary to summaries_dir
-                out_file = self.summaries_dir / (safe_filename(rel_path_str) + ".json")
+                # Also save individual summary (and the content it describes) to summaries_dir
                 save_json(file_entry, out_file)
+                if not detailed.startswith("Error"):
+                    with open(source_file, "w", encoding="utf-8") as f:
+                        f.write(content)
                 updated_count += 1
             except Exception as e:
                 print(f"Error summarizing {rel_path_str}: {e}")
@@ -513,33 +633,25 @@ class ProjectManager:
                 total_lines_updated -= old_lines # Adjust total lines
                 # Save error state to individual file too? Maybe not.
 
+        if progress_callback and modified_files:
+            progress_callback(len(modified_files), len(modified_files), None)
+
         if updated_count > 0:
             print(f"Successfully updated summaries for {updated_count} file(s).")
-            print("Regenerating project-level summary...")
-            # Regenerate project summary based on ALL current file summaries
-            aggregated = "\n\n".join(
-                f"File: {path}\nConcise Summary: {data.get('concise_summary', 'N/A')}" # Use concise for project summary input
-                for path, data in combined.get("files", {}).items()
-                if isinstance(data, dict) and data.get('concise_summary') and "Error" not in data.get('concise_summary', "")
-            )
-            if aggregated:
-                try:
-                    prompt_project = AGGREGATED_SUMMARY_PROMPT.format(aggregated=aggregated)
-                    project_summary = summarizer.get_llm_response_with_timeout(prompt_project)
-                    combined["project_summary"] = project_summary
-                    print("Project-level summary updated.")
-                except Exception as e:
-                    print(f"Error generating project summary during update: {e}")
-                    combined["project_summary"] = combined.get("project_summary", "") + f"\n\n[Error updating project summary: {e}]"
-            else:
-                combined["project_summary"] = "No valid file summaries available to generate project summary."
+            # Concise summaries that changed (None: file removed) drive the project-summary refresh
+            changed = {}
+            for path in modified_files:
+                new = combined["files"].get(path, {}).get("concise_summary") if path in combined["files"] else None
+                if new != old_concise.get(path):
+                    changed[path] = new
+            self._refresh_project_summary(combined, changed, summarizer, force=refresh_project_summary)
 
             # Update counts and save
             combined["file_count"] = len(combined["files"])
             # Ensure total lines is calculated correctly over all files, not just updated diff
             combined["total_lines"] = sum(f.get("lines", 0) for f in combined["files"].values() if isinstance(f, dict))
 
-            save_json(combined, self.combined_json_path)
+            self.save_combined_summary(combined)
             print(f"Combined summary updated and saved to {self.combined_json_path}")
 
             # Update project record
@@ -549,6 +661,7 @@ class ProjectManager:
                 "total_lines": combined["total_lines"],
                 "status": "up_to_date" # Mark as up-to-date after successful update
             })
+            self.record_summarized_commit()
             return combined # Return the updated summary data
         elif modified_files: # Modified files existed, but none were updated (e.g., all had errors)
              print("No summaries were successfully updated.")
@@ -560,6 +673,71 @@ class ProjectManager:
              return combined # Return existing summary
 
 
+    @staticmethod
+    def _reset_project_summary_state(combined):
+        """Marks combined["project_summary"] as freshly generated, with no pending file changes."""
+        combined["project_summary_state"] = {
+            "base": combined.get("project_summary", ""),
+            "generated_at": datetime.now().isoformat(),
+            "pending": {},
+        }
+
+    def _refresh_project_summary(self, combined, changed, summarizer, force=None):
+        """
+        Refreshes combined["project_summary"] after the concise summaries in 'changed' were updated.
+
+        The full LLM regeneration runs only once PROJECT_SUMMARY_REFRESH_FRACTION of the files have
+        changed since it last ran, or it is older than PROJECT_SUMMARY_DEBOUNCE_SECONDS (force=True
+        always regenerates, force=False never does). Otherwise the last generated summary is kept
+        and the pending files are patched into a "recently updated" section, with no LLM call.
+        """
+        state = combined.get("project_summary_state")
+        if not isinstance(state, dict):  # Summaries written before refresh tracking: adopt as generated now
+            self._reset_project_summary_state(combined)
+            state = combined["project_summary_state"]
+        pending = dict(state.get("pending") or {})
+        pending.update(changed)
+        if not pending and not force:
+            return
+
+        regenerate = force
+        if regenerate is None:
+            try:
+                age = (datetime.now() - datetime.fromisoformat(state.get("generated_at"))).total_seconds()
+            except (TypeError, ValueError):
+                age = float("inf")
+            fraction = len(pending) / max(len(combined.get("files", {})), 1)
+            regenerate = fraction >= PROJECT_SUMMARY_REFRESH_FRACTION or age >= PROJECT_SUMMARY_DEBOUNCE_SECONDS
+            if not regenerate:
+                print(f"Project summary refresh deferred: {len(pending)} file(s) pending ({fraction:.0%} of files).")
+
+        if regenerate:
+            print("Regenerating project-level summary...")
+            # Regenerate project summary based on ALL current file summaries (concise ones);
+            # in hierarchical mode only directories containing updated files are re-reduced.
+            try:
+                project_summary = summarizer.generate_project_summary(
+                    combined.get("files", {}), rollup_cache_path=self.directory_summaries_path)
+                if project_summary is None:
+                    combined["project_summary"] = "No valid file summaries available to generate project summary."
+                    self._reset_project_summary_state(combined)
+                    return
+                if not project_summary.startswith("Error"):
+                    combined["project_summary"] = project_summary
+                    self._reset_project_summary_state(combined)
+                    print("Project-level summary updated.")
+                    return
+                print(f"Project summary regeneration failed ({project_summary[:100]}); patching instead.")
+            except Exception as e:
+                print(f"Error generating project summary during update: {e}; patching instead.")
+
+        # Fast path: the last generated summary plus a section listing the files changed since
+        state["pending"] = pending
+        lines = [f"- {path}: {summary}" if summary else f"- {path}: (removed)"
+                 for path, summary in sorted(pending.items())]
+        combined["project_summary"] = (f"{state.get('base', '')}\n\n"
+                                       f"Recently updated files (not yet reflected above):\n" + "\n".join(lines))
+
     def combine_summaries(self, summarizer=None):
         """
         Reads all individual JSON files from self.summaries_dir,
@@ -604,36 +782,31 @@ class ProjectManager:
         # Generate project-level summary if a summarizer is provided and there are files
         if summarizer and combined["files"]:
             print("Generating project-level summary...")
-            aggregated = "\n\n".join(
-                f"File: {path}\nConcise Summary: {data.get('concise_summary', 'N/A')}"
-                for path, data in combined["files"].items()
-                if isinstance(data, dict) and data.get('concise_summary') and "Error" not in data.get('concise_summary', "")
-            )
-            if aggregated:
-                try:
-                    prompt_project = AGGREGATED_SUMMARY_PROMPT.format(aggregated=aggregated)
-                    project_summary = summarizer.get_llm_response_with_timeout(prompt_project)
+            try:
+                project_summary = summarizer.generate_project_summary(
+                    combined["files"], rollup_cache_path=self.directory_summaries_path)
+                if project_summary is None:
+                    combined["project_summary"] = "No valid file summaries available to generate project summary."
+                else:
                     combined["project_summary"] = project_summary
                     print("Project-level summary generated.")
-                except Exception as e:
-                    print(f"Error generating project summary during combine: {e}")
-                    combined["project_summary"] = f"[Error generating project summary: {e}]"
-            else:
-                 combined["project_summary"] = "No valid file summaries available to generate project summary."
+            except Exception as e:
+                print(f"Error generating project summary during combine: {e}")
+                combined["project_summary"] = f"[Error generating project summary: {e}]"
         elif not combined["files"]:
              combined["project_summary"] = "Project contains no summarized files."
         else: # No summarizer provided
              combined["project_summary"] = combined.get("project_summary", "Project summary generation skipped (no summarizer provided).")
+        self._reset_project_summary_state(combined)
 
-
-        save_json(combined, self.combined_json_path)
+        self.save_combined_summary(combined)
         print(f"Combined summary saved to {self.combined_json_path}")
         return combined # Return the newly combined summary
 
-    def update_file_hashes(self):
+    def update_file_hashes(self, full_hash=False):
         """Refreshes the file hashes by calling get_modified_files (which updates the hash file)."""
         print("Updating file hashes...")
-        modified = self.get_modified_files() # Call primarily for its side effect of saving hashes
+        modified = self.get_modified_files(full_hash=full_hash) # Call primarily for its side effect of saving hashes
         print(f"File hash update complete. {len(modified)} files detected as changed since last hash save.")
 
     # save_results might be redundant if combine_summaries and update_modified_summaries handle saving
@@ -645,29 +818,30 @@ class ProjectManager:
     #     # ...
 
     def load_query_history(self):
-        """Loads the query history list from its JSON file."""
-        if self.query_history_path.exists():
-            history = load_json(self.query_history_path)
-            # Ensure it's a list, return empty list if not or if error
-            return history if isinstance(history, list) else []
-        return [] # Return empty list if file doesn't exist
+        """Returns the query history list, newest first."""
+        return self.store.list_queries()
+
+    def get_query(self, query_id):
+        """Returns one query history entry by id, or None."""
+        return self.store.get_query(query_id)
+
+    def add_query(self, entry):
+        """Records a new query (shown first in the history) and updates the query count."""
+        self.update_project_record({"query_count": self.store.add_query(entry)})
 
     def save_query_history(self, history):
-        """Saves the query history list to its JSON file."""
+        """Replaces the whole query history list."""
         if isinstance(history, list):
             # Update query count in project record before saving
             self.update_project_record({"query_count": len(history)})
-            save_json(history, self.query_history_path)
+            self.store.replace_queries(history)
         else:
             print(f"Error: Query history must be a list for {self.project_name}. Save failed.")
 
     def delete_query(self, query_id):
         """Deletes a specific query entry from the history by its ID."""
-        history = self.load_query_history()
-        initial_length = len(history)
-        history = [item for item in history if item.get("id") != query_id]
-        if len(history) < initial_length:
-            self.save_query_history(history) # Save also updates count
+        if self.store.delete_query(query_id):
+            self.update_project_record({"query_count": self.store.query_count()})
             print(f"Deleted query {query_id} from history.")
             return True
         else:
@@ -676,17 +850,58 @@ class ProjectManager:
 
 
     def load_modifications_history(self):
-        """Loads the modifications history list from its JSON file."""
-        if self.modifications_history_path.exists():
-            history = load_json(self.modifications_history_path)
-            return history if isinstance(history, list) else []
-        return []
+        """Returns the modifications history list, oldest first."""
+        return self.store.list_modifications()
+
+    def get_modification(self, modification_id):
+        """Returns one modification record by id, or None."""
+        return self.store.get_modification(modification_id)
+
+    def add_modification(self, entry):
+        """Appends a modification record and updates the modification count."""
+        self.update_project_record({"modification_count": self.store.add_modification(entry)})
 
     def save_modifications_history(self, history):
-        """Saves the modifications history list to its JSON file."""
+        """Replaces the whole modifications history list."""
         if isinstance(history, list):
              # Update modification count in project record before saving
             self.update_project_record({"modification_count": len(history)})
-            save_json(history, self.modifications_history_path)
+            self.store.replace_modifications(history)
         else:
             print(f"Error: Modifications history must be a list for {self.project_name}. Save failed.")
+
+
+# --- Process-wide registry of live ProjectManagers, keyed by project storage path ---
+_managers = OrderedDict()
+_managers_lock = threading.Lock()
+
+
+def get_project_manager(project_path, output_dir, is_new=False):
+    """
+    Returns the live ProjectManager for a project storage dir, creating it on first use, so
+    requests share its setup and cached state. The PROJECT_REGISTRY_SIZE most recently used
+    managers are kept. A manager is rebuilt when the source path changes or is_new is passed.
+    """
+    key = str(Path(output_dir).resolve())
+    with _managers_lock:
+        pm = _managers.get(key)
+        if pm is not None and not is_new and pm.project_path == str(project_path) and pm.output_dir.is_dir():
+            _managers.move_to_end(key)
+            return pm
+    pm = ProjectManager(project_path, output_dir, is_new=is_new)
+    evicted = []
+    with _managers_lock:
+        _managers[key] = pm
+        _managers.move_to_end(key)
+        while len(_managers) > PROJECT_REGISTRY_SIZE:
+            evicted.append(_managers.popitem(last=False)[0])
+    for evicted_key in evicted:  # Watchers live only as long as their project's manager
+        unwatch_project(evicted_key)
+    return pm
+
+
+def forget_project_manager(output_dir):
+    """Drops a project's cached manager (e.g. after its storage was removed)."""
+    with _managers_lock:
+        _managers.pop(str(Path(output_dir).resolve()), None)
+    unwatch_project(output_dir)
@@ -0,0 +1,408 @@
+# project_store.py
+
+import json
+import uuid
+import sqlite3
+import threading
+from pathlib import Path
+from utils import load_json, save_json, serialize_data
+from file_hasher import LEGACY_HASH_ALGORITHM
+from history_log import open_history_log
+from constants import PROJECT_STORE_BACKEND, SQLITE_BUSY_TIMEOUT_MS
+
+PROJECT_DB_FILENAME = "project.db"
+
+
+def _stat_version(*paths):
+    """(mtime_ns, size) of each path, None for missing ones: changes whenever a file is rewritten."""
+    version = []
+    for path in paths:
+        try:
+            st = path.stat()
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+class JSONProjectStore:
+    """
+    File-based storage: project_record.json and file_hashes.json are small documents rewritten
+    as a whole; query and modification history are append-only HistoryLogs (query_history.*.jsonl,
+    modifications_history.*.jsonl) with an offset index. History arrays from older versions
+    (query_history.json, modifications_history.json) are imported into the logs on first use.
+    """
+    backend = "json"
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.project_record_path = self.output_dir / 'project_record.json'
+        self.query_history_path = self.output_dir / 'query_history.json'
+        self.modifications_history_path = self.output_dir / 'modifications_history.json'
+        self.file_hashes_path = self.output_dir / 'file_hashes.json'
+        self.queries = open_history_log(self.output_dir / 'query_history')
+        self.modifications = open_history_log(self.output_dir / 'modifications_history')
+
+    def initialize(self):
+        if not self.file_hashes_path.exists():
+            save_json({}, self.file_hashes_path)
+            print(f"  Created empty: {self.file_hashes_path.name}")
+        self.import_legacy_history()
+
+    def import_legacy_history(self):
+        """Moves history arrays of the old whole-file layout into the logs (renamed to *.migrated)."""
+        for path, log, newest_first in ((self.query_history_path, self.queries, True),
+                                        (self.modifications_history_path, self.modifications, False)):
+            if not path.exists():
+                continue
+            history = load_json(path)
+            if isinstance(history, list) and history and not log.exists():
+                entries = [dict(entry, id=entry.get("id") or str(uuid.uuid4())) for entry in history]
+                log.compact(list(reversed(entries)) if newest_first else entries)
+                print(f"  Imported {len(entries)} entries from {path.name} into {log.base_path.name} log")
+            path.replace(path.with_name(path.name + ".migrated"))
+
+    def history_files(self):
+        return self.queries.files() + self.modifications.files()
+
+    # --- Change stamps (compared by ProjectManager's in-memory caches) ---
+    def record_version(self):
+        return _stat_version(self.project_record_path)
+
+    def hashes_version(self):
+        return _stat_version(self.file_hashes_path)
+
+    # --- Project record ---
+    def has_record(self):
+        return self.project_record_path.exists()
+
+    def get_record(self):
+        return load_json(self.project_record_path)
+
+    def save_record(self, record):
+        save_json(record, self.project_record_path)
+
+    def update_record(self, data):
+        record = self.get_record()
+        if not record:
+            return None
+        record.update(data)
+        self.save_record(record)
+        return record
+
+    # --- File hashes ---
+    def get_file_hashes(self):
+        """Returns (hashes, algorithm); legacy flat {path: md5} files report LEGACY_HASH_ALGORITHM."""
+        data = load_json(self.file_hashes_path) or {}
+        if isinstance(data.get("files"), dict) and "algorithm" in data:
+            return data["files"], data["algorithm"]
+        return data, LEGACY_HASH_ALGORITHM
+
+    def save_file_hashes(self, hashes, algorithm):
+        save_json({"algorithm": algorithm, "files": hashes}, self.file_hashes_path)
+
+    # --- Query history (listed newest first) ---
+    def list_queries(self):
+        return list(reversed(self.queries.list()))
+
+    def get_query(self, query_id):
+        return self.queries.get(query_id)
+
+    def add_query(self, entry):
+        self.queries.append(entry)
+        return self.queries.count()
+
+    def replace_queries(self, history):
+        self.queries.compact(list(reversed(history)))
+
+    def delete_query(self, query_id):
+        return self.queries.delete(query_id)
+
+    def query_count(self):
+        return self.queries.count()
+
+    # --- Modification history (listed oldest first) ---
+    def list_modifications(self):
+        return self.modifications.list()
+
+    def get_modification(self, modification_id):
+        return self.modifications.get(modification_id)
+
+    def add_modification(self, entry):
+        self.modifications.append(entry)
+        return self.modifications.count()
+
+    def replace_modifications(self, history):
+        self.modifications.compact(history)
+
+    def modification_count(self):
+        return self.modifications.count()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS project_record (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS queries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS modifications (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    query_id TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS modifications_query_id ON modifications (query_id);
+"""
+
+def _dumps(value):
+    return json.dumps(serialize_data(value))
+
+
+# One connection per (thread, database); sqlite3 connections must not be shared across threads
+_connections = threading.local()
+
+
+class SQLiteProjectStore:
+    """
+    Project storage in a single SQLite database (project.db, WAL mode). The record is stored one
+    key per row, histories one entry per row, so appends, id lookups and record updates touch
+    only the affected rows, and concurrent writers are serialized by SQLite instead of
+    overwriting each other's files. Existing JSON files are imported on first open.
+    """
+    backend = "sqlite"
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.db_path = self.output_dir / PROJECT_DB_FILENAME
+        self.legacy = JSONProjectStore(output_dir)
+
+    def _conn(self):
+        cache = getattr(_connections, "by_path", None)
+        if cache is None:
+            cache = _connections.by_path = {}
+        key = str(self.db_path.resolve())
+        conn = cache.get(key)
+        if conn is None:
+            conn = sqlite3.connect(key, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable across app crashes; WAL keeps the db consistent
+            conn.executescript(_SCHEMA)
+            cache[key] = conn
+        return conn
+
+    def initialize(self):
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is None:
+            self._migrate_from_json(conn)
+
+    def _migrate_from_json(self, conn):
+        """Imports the JSON files of the original layout (if any), then renames them to *.migrated."""
+        legacy = self.legacy
+        conn.execute("BEGIN IMMEDIATE")  # Serializes concurrent first opens
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None:
+                conn.rollback()
+                return
+            legacy.import_legacy_history()  # Old history arrays -> logs, so both layouts are read the same way
+            legacy_paths = [legacy.project_record_path, legacy.file_hashes_path] + legacy.history_files()
+            if legacy.has_record():
+                record = legacy.get_record() or {}
+                conn.executemany("INSERT OR REPLACE INTO project_record (key, value) VALUES (?, ?)",
+                                 [(k, _dumps(v)) for k, v in record.items()])
+            if legacy.file_hashes_path.exists():
+                hashes, algorithm = legacy.get_file_hashes()
+                conn.executemany("INSERT OR REPLACE INTO file_hashes (path, hash) VALUES (?, ?)", hashes.items())
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hash_algorithm', ?)", (algorithm,))
+            for entry in reversed(legacy.list_queries()):  # Stored newest first; rows are oldest first
+                self._insert_query(conn, entry)
+            for entry in legacy.list_modifications():
+                self._insert_modification(conn, entry)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', '1')")
+            self._bump_version(conn, "record_version")
+            self._bump_version(conn, "hashes_version")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        migrated = [path for path in legacy_paths if path.exists()]
+        for path in migrated:
+            path.replace(path.with_name(path.name + ".migrated"))
+        if migrated:
+            print(f"  Migrated {', '.join(p.name for p in migrated)} into {self.db_path.name}")
+
+    # --- Change stamps ---
+    # Counters in meta, bumped in the same transaction as the write they describe, so they are
+    # comparable across connections and processes. PRAGMA data_version alone cannot be shared
+    # this way: it is per connection (one per thread here) and ignores the connection's own
+    # commits. It is used to skip re-reading the counters while nothing was committed.
+    @staticmethod
+    def _bump_version(conn, name):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) "
+                     "VALUES (?, COALESCE((SELECT CAST(value AS INTEGER) FROM meta WHERE key = ?), 0) + 1)",
+                     (name, name))
+
+    def _version(self, name):
+        conn = self._conn()
+        gate = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        cache = getattr(_connections, "versions", None)
+        if cache is None:
+            cache = _connections.versions = {}
+        key = str(self.db_path.resolve())
+        cached = cache.get(key)
+        if cached is None or cached[0] != gate:
+            rows = conn.execute("SELECT key, value FROM meta WHERE key IN ('record_version', 'hashes_version')")
+            cached = cache[key] = (gate, dict(rows.fetchall()))
+        return cached[1].get(name, "0")
+
+    def record_version(self):
+        return self._version("record_version")
+
+    def hashes_version(self):
+        return self._version("hashes_version")
+
+    # --- Project record ---
+    def has_record(self):
+        return self._conn().execute("SELECT 1 FROM project_record LIMIT 1").fetchone() is not None
+
+    def get_record(self):
+        rows = self._conn().execute("SELECT key, value FROM project_record").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def save_record(self, record):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM project_record")
+            conn.executemany("INSERT INTO project_record (key, value) VALUES (?, ?)",
+                             [(k, _dumps(v)) for k, v in record.items()])
+            self._bump_version(conn, "record_version")
+
+    def update_record(self, data):
+        conn = self._conn()
+        with conn:
+            if conn.execute("SELECT 1 FROM project_record LIMIT 1").fetchone() is None:
+                return None
+            conn.executemany("INSERT OR REPLACE INTO project_record (key, value) VALUES (?, ?)",
+                             [(k, _dumps(v)) for k, v in data.items()])
+            self._bump_version(conn, "record_version")
+        return self.get_record()
+
+    # --- File hashes ---
+    def get_file_hashes(self):
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'hash_algorithm'").fetchone()
+        hashes = dict(conn.execute("SELECT path, hash FROM file_hashes").fetchall())
+        return hashes, row[0] if row else LEGACY_HASH_ALGORITHM
+
+    def save_file_hashes(self, hashes, algorithm):
+        """Writes only the rows that changed."""
+        conn = self._conn()
+        with conn:
+            existing = dict(conn.execute("SELECT path, hash FROM file_hashes").fetchall())
+            row = conn.execute("SELECT value FROM meta WHERE key = 'hash_algorithm'").fetchone()
+            removed = [(path,) for path in existing if path not in hashes]
+            changed = [(path, h) for path, h in hashes.items() if existing.get(path) != h]
+            if removed:
+                conn.executemany("DELETE FROM file_hashes WHERE path = ?", removed)
+            if changed:
+                conn.executemany("INSERT OR REPLACE INTO file_hashes (path, hash) VALUES (?, ?)", changed)
+            if row is None or row[0] != algorithm:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('hash_algorithm', ?)", (algorithm,))
+            if removed or changed or row is None or row[0] != algorithm:
+                self._bump_version(conn, "hashes_version")
+
+    # --- Query history (listed newest first) ---
+    @staticmethod
+    def _insert_query(conn, entry):
+        entry_id = entry.get("id") or str(uuid.uuid4())
+        conn.execute("INSERT OR REPLACE INTO queries (id, timestamp, data) VALUES (?, ?, ?)",
+                     (entry_id, entry.get("timestamp"), _dumps(dict(entry, id=entry_id))))
+
+    def list_queries(self):
+        rows = self._conn().execute("SELECT data FROM queries ORDER BY seq DESC").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get_query(self, query_id):
+        row = self._conn().execute("SELECT data FROM queries WHERE id = ?", (query_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_query(self, entry):
+        conn = self._conn()
+        with conn:
+            self._insert_query(conn, entry)
+        return self.query_count()
+
+    def replace_queries(self, history):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM queries")
+            for entry in reversed(history):
+                self._insert_query(conn, entry)
+
+    def delete_query(self, query_id):
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM queries WHERE id = ?", (query_id,)).rowcount > 0
+
+    def query_count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    # --- Modification history (listed oldest first) ---
+    @staticmethod
+    def _insert_modification(conn, entry):
+        entry_id = entry.get("id") or str(uuid.uuid4())
+        conn.execute("INSERT OR REPLACE INTO modifications (id, query_id, timestamp, data) VALUES (?, ?, ?, ?)",
+                     (entry_id, entry.get("query_id"), entry.get("timestamp"), _dumps(dict(entry, id=entry_id))))
+
+    def list_modifications(self):
+        rows = self._conn().execute("SELECT data FROM modifications ORDER BY seq").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get_modification(self, modification_id):
+        row = self._conn().execute("SELECT data FROM modifications WHERE id = ?", (modification_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_modification(self, entry):
+        conn = self._conn()
+        with conn:
+            self._insert_modification(conn, entry)
+        return self.modification_count()
+
+    def replace_modifications(self, history):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM modifications")
+            for entry in history:
+                self._insert_modification(conn, entry)
+
+    def modification_count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM modifications").fetchone()[0]
+
+
+STORE_BACKENDS = {
+    "json": JSONProjectStore,
+    "sqlite": SQLiteProjectStore,
+}
+
+
+def open_store(output_dir, backend=None):
+    """Returns the project store for output_dir using PROJECT_STORE_BACKEND (or 'backend')."""
+    backend = backend or PROJECT_STORE_BACKEND
+    if backend not in STORE_BACKENDS:
+        print(f"Warning: Unknown project store backend '{backend}', using json.")
+        backend = "json"
+    return STORE_BACKENDS[backend](output_dir)
+
+
+def read_project_record(output_dir):
+    """Reads a project's record without initializing a ProjectManager (e.g. to list projects)."""
+    output_dir = Path(output_dir)
+    if (output_dir / PROJECT_DB_FILENAME).exists():
+        store = SQLiteProjectStore(output_dir)
+        store.initialize()
+        return store.get_record()
+    return load_json(output_dir / 'project_record.json')
@@ -0,0 +1,99 @@
+# query_cache.py
+
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from utils import load_json, save_json
+from constants import QUERY_CACHE_TTL_SECONDS, QUERY_CACHE_MAX_ENTRIES
+
+
+def normalize_query(text):
+    """Case, whitespace and trailing punctuation do not change the question."""
+    return re.sub(r"\s+", " ", (text or "").strip().lower()).rstrip(" ?.!")
+
+
+class QueryCache:
+    """
+    Per-project cache of answered queries (query_cache.json in the project output dir), keyed by
+    the normalized query text, the client (service and model) and a fingerprint of the combined
+    summary version and prompt templates. The key needs no context building, so a hit costs a
+    lookup; any rewrite of the combined summary gives a new key. Entries expire after
+    QUERY_CACHE_TTL_SECONDS; past QUERY_CACHE_MAX_ENTRIES the least recently used are evicted.
+    """
+
+    def __init__(self, output_dir, ttl=QUERY_CACHE_TTL_SECONDS, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.path = Path(output_dir) / "query_cache.json"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = None  # key -> entry, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(input_query, client_id, context_fingerprint):
+        return hashlib.sha256(f"{normalize_query(input_query)}|{client_id}|{context_fingerprint}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(*parts):
+        """Fingerprint of the summary data used in a prompt."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8", errors="replace"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _load(self):
+        if self._entries is None:
+            data = load_json(self.path) or {}
+            entries = data.get("entries") if isinstance(data.get("entries"), list) else []
+            self._entries = OrderedDict((entry["key"], entry) for entry in entries
+                                        if isinstance(entry, dict) and "key" in entry)
+
+    def _save(self):
+        save_json({"entries": list(self._entries.values())}, self.path)
+
+    def get(self, key):
+        """The cached entry for key (dict with query_id, response, raw_response, ...), or None."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.get("created_at", 0) > self.ttl:
+                del self._entries[key]
+                self._save()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)  # Recency is persisted with the next put()
+            entry["hit_count"] = entry.get("hit_count", 0) + 1
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, key, query_id, response, raw_response, trigger_code_generation=False):
+        with self._lock:
+            self._load()
+            now = time.time()
+            self._entries.pop(key, None)
+            self._entries[key] = {"key": key, "query_id": query_id, "response": response, "raw_response": raw_response,
+                                  "trigger_code_generation": trigger_code_generation, "created_at": now, "hit_count": 0}
+            for stale in [k for k, entry in self._entries.items() if now - entry.get("created_at", 0) > self.ttl]:
+                del self._entries[stale]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "entries": len(self._entries or ())}
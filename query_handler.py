@@ -3,9 +3,41 @@ import json
 import uuid
 import time # Import time
 import re   # Import re
+import posixpath
 from datetime import datetime
 from utils import extract_json, load_json, save_json # Import load_json
-from constants import NEW_PROJECT_CREATION_PROMPT
+from token_budget import PromptBudget
+from constants import NEW_PROJECT_CREATION_PROMPT, DEPENDENCY_NEIGHBOUR_LIMIT, QUERY_CONTEXT_TOKEN_BUDGET, \
+    QUERY_MIN_FILES, SYMBOL_PIN_LIMIT, QUERY_CACHE_ENABLED
+
+_QUERY_SYMBOL_RE = re.compile(r"(?<![\w/])/[\w<>{}:.-]+(?:/[\w<>{}:.-]*)*|[.#]?[A-Za-z_$][\w$-]*(?:\.[A-Za-z_$][\w$]*)*")
+# Query prompts start with the project context, which is the same for every query until the
+# summaries change, so providers can serve it from their prompt cache (see LLM_Client prefix).
+_QUERY_PROMPT_PREFIX = """You will be given the summary of a software project and summaries of its files, followed by a user query about the project.
+    Project summary: {project_summary}
+{catalogue}"""
+
+_QUERY_PROMPT = """    File summaries: {file_summaries}
+    This is user query: {input_query}
+    Select the files that are most relevant to the query and provide instructions for modifications. If the query requires creating a new file, provide the path and the complete code/content for the new file in 'instructions_to_modify'.
+    Respond ONLY in JSON format, starting with [ and ending with ], following this structure exactly:
+    [{{"file_path": "relative/path/to/file.ext", "concise_summary": "Brief explanation of how this file relates to the user query, or the purpose of a new file.", "instructions_to_modify": "Specific, actionable instructions for how the code in this file should be changed, OR the complete code/content for a new file."}}, ...]
+    Ensure the output is valid JSON. Do not include any other text, explanations, or markdown formatting outside the JSON structure. Ensure 'file_path' uses forward slashes '/' and is relative to the project root.
+    """
+
+_EMPTY_PROJECT_QUERY_PROMPT = """This is a user query for a project with a summary but no files yet: {input_query}
+    Project summary: {project_summary}
+    There are currently no files with summaries in the project.
+    Generate the necessary file(s) or instructions based on the query. If creating files, provide the path and the complete code/content for the new file in 'instructions_to_modify'.
+    Respond ONLY in JSON format, starting with [ and ending with ], following this structure exactly:
+    [{{"file_path": "relative/path/to/new_file.ext", "concise_summary": "Purpose of the new file.", "instructions_to_modify": "Complete code/content for the new file."}}, ...]
+    Ensure the output is valid JSON. Do not include any other text, explanations, or markdown formatting outside the JSON structure. Ensure 'file_path' uses forward slashes '/' and is relative to the project root.
+    """
+
+_QUERY_PLAIN_WORDS = frozenset("""
+where what which when does how handled handle handles defined define used uses called call calls code file files
+function class method this that there with from into the and for are is
+""".split())
 
 
 class QueryHandler:
@@ -196,12 +228,185 @@ class QueryHandler:
 #         return query_id, trigger_code_generation
     
 
-    def process_query(self, input_query, client_type):
+    @staticmethod
+    def _symbol_matches(pm, input_query, files_data):
+        """
+        Definitions (from the project's symbol index) of the identifiers, routes and selectors
+        named in the query. Code-like terms (snake_case, camelCase, dotted, /routes, .selectors)
+        match case-insensitively; plain words only match a definition of exactly that name.
+        """
+        terms = list(dict.fromkeys(_QUERY_SYMBOL_RE.findall(input_query)))
+        if not terms:
+            return []
+        try:
+            index = pm.symbol_index.refresh()
+        except Exception as e:
+            print(f"Warning: Could not load the symbol index: {e}")
+            return []
+        matches = []
+        for term in terms:
+            code_like = term[0] in "/.#$" or any(c in term for c in "_.-") or term[1:] != term[1:].lower()
+            if not code_like and (len(term) < 4 or term.lower() in _QUERY_PLAIN_WORDS):
+                continue
+            for definition in index.definitions(term, limit=SYMBOL_PIN_LIMIT):
+                if definition["file_path"] in files_data and \
+                        (code_like or term in (definition["name"], definition["name"].rsplit(".", 1)[-1])):
+                    matches.append(definition)
+        return matches
+
+    @staticmethod
+    def _related_files(pm, input_query, files_data, pinned=()):
+        """
+        Pinned files (defining symbols named in the query), then summarized files named in the
+        query (by path or file name), followed by their import-graph neighbours.
+        """
+        query = input_query.lower()
+        mentioned = [path for path in files_data if path.lower() in query or
+                     re.search(r"(?<![\w./-])" + re.escape(posixpath.basename(path).lower()) + r"(?![\w-])", query)]
+        mentioned = list(dict.fromkeys(list(pinned) + mentioned[:DEPENDENCY_NEIGHBOUR_LIMIT]))
+        if not mentioned:
+            return []
+        try:
+            neighbours = pm.dependency_graph.refresh().neighbours(mentioned)
+        except Exception as e:
+            print(f"Warning: Could not load the dependency graph: {e}")
+            neighbours = []
+        return mentioned + [path for path in neighbours if path in files_data]
+
+    @staticmethod
+    def _concise_entry(path, data):
+        if isinstance(data, dict):
+            concise_summary = data.get('concise_summary', 'No concise summary available.')
+            return f"\nFile path: {path}\nConcise Summary: {concise_summary}\n"
+        print(f"Warning: Unexpected data format for file '{path}' in summary.")
+        return f"\nFile path: {path}\nConcise Summary: Error loading summary.\n"
+
+    def _file_context(self, pm, input_query, files_data, budget):
+        """
+        Returns (catalogue, context), fitted to the budget. The catalogue lists the concise summary
+        of every file in path order; it does not depend on the query and goes into the cacheable
+        prompt prefix, but only if it fits the context budget whole. The query-specific context
+        follows: files defining symbols named in the query, files named in it and their
+        import-graph neighbours, with detailed summaries (falling back to the concise one when
+        the detailed does not fit). Without a catalogue, the other files follow in search-relevance
+        order with concise summaries. In both lists only the first QUERY_MIN_FILES may exceed the
+        context budget, never the model's limit.
+        """
+        context = ""
+        catalogue = "    Summaries of all project files:\n" + "".join(
+            self._concise_entry(path, files_data[path]) for path in sorted(files_data))
+        if not budget.add(catalogue):
+            catalogue = ""
+        symbols = self._symbol_matches(pm, input_query, files_data)
+        pinned = list(dict.fromkeys(symbol["file_path"] for symbol in symbols))[:SYMBOL_PIN_LIMIT]
+        if symbols:
+            print(f"Symbol index: pinned {len(pinned)} file(s) defining symbols named in the query.")
+            section = "\nDefinitions of symbols named in the query:\n" + "".join(
+                f"- {symbol['name']} ({symbol['kind']}) in {symbol['file_path']}, line {symbol['line']}\n"
+                for symbol in symbols if symbol["file_path"] in pinned)
+            if budget.add(section, "symbol definitions", required=True):
+                context += section
+
+        related = self._related_files(pm, input_query, files_data, pinned)
+        if related:
+            context += "\nFiles most related to the query:\n"
+            budget.reserve("\nFiles most related to the query:\n\nOther files:\n")
+            for included, path in enumerate(related):
+                data = files_data[path] if isinstance(files_data[path], dict) else {}
+                imports = ", ".join(pm.dependency_graph.dependencies(path)) or "none in project"
+                detailed = (f"\nFile path: {path}\nImports: {imports}\n"
+                            f"Detailed Summary: {data.get('detailed_summary', 'No detailed summary available.')}\n")
+                concise = (f"\nFile path: {path}\nImports: {imports}\n"
+                           f"Concise Summary: {data.get('concise_summary', 'No concise summary available.')}\n")
+                required = included < QUERY_MIN_FILES
+                if budget.add(detailed, f"{path} (detailed summary)", required=required):
+                    context += detailed
+                elif not catalogue and budget.add(concise, path, required=required):
+                    context += concise
+            if not catalogue:
+                context += "\nOther files:\n"
+        if catalogue:
+            return catalogue, context
+
+        # The rest, best search matches first, while they fit (small projects fit whole)
+        try:
+            matches = [path for path, _ in pm.search_files(input_query) if path in files_data]
+        except Exception as e:
+            print(f"Warning: Search index unavailable, listing files in order: {e}")
+            matches = []
+        ordered = list(dict.fromkeys(matches + list(files_data)))
+        ordered = [path for path in ordered if path not in related]
+        budget.reserve(f"\n({len(ordered)} less relevant file(s) omitted.)\n")  # Room for the note below
+        for included, path in enumerate(ordered):
+            entry = self._concise_entry(path, files_data[path])
+            if not budget.add(entry, path, required=included < QUERY_MIN_FILES):
+                budget.dropped.extend(ordered[included + 1:])  # Less relevant still: left out too
+                context += f"\n({len(ordered) - included} less relevant file(s) omitted.)\n"
+                print(f"Query context: {included} of {len(ordered)} other file(s) fit the token budget.")
+                break
+            context += entry
+        return catalogue, context
+
+    def _answer_from_cache(self, cached, input_query, client_type, started):
+        """Records a history entry for a cached answer and returns (query_id, trigger_code_generation)."""
+        pm = self.project_manager
+        query_id = str(uuid.uuid4())
+        elapsed = time.time() - started
+        print(f"Query cache hit (answer of query {cached['query_id']}), served in {elapsed * 1000:.1f} ms.")
+        query_entry = {
+            "id": query_id,
+            "timestamp": datetime.now().isoformat(),
+            "input_query": input_query,
+            "client_type": client_type,
+            "response": cached["response"],
+            "raw_response": cached["raw_response"],
+            "response_time": elapsed,
+            "is_new_project_query": False,
+            "trigger_code_generation": cached.get("trigger_code_generation", False),
+            "cached": True,  # Served from the query cache; no LLM call was made
+            "cached_from": cached["query_id"],
+        }
+        try:
+            pm.add_query(query_entry)
+        except Exception as e:
+            print(f"Error saving query history: {e}")
+        return query_id, query_entry["trigger_code_generation"]
+
+    def process_query(self, input_query, client_type, use_cache=True):
+        """
+        Answers a query, from the project's query cache when the same (normalized) query was
+        answered by the same client on the same combined summary; use_cache=False forces an
+        LLM call, whose answer then replaces the cached one.
+        """
         pm = self.project_manager
+        started = time.time()
         prompt = ""
+        prefix = ""  # Stable project context sent ahead of prompt
         is_new_project_query = False
         trigger_code_generation = False  # Flag to signal code generation step
 
+        client = self.clients_mapping.get(client_type)
+        if not client:
+            print(f"Warning: Client type '{client_type}' not found. Using default (openai).")
+            client = self.clients_mapping.get("openai")  # Fallback to default
+            if not client:
+                print("CRITICAL ERROR: Default LLM client 'openai' not found.")
+                return None  # Indicate critical failure
+        # Repeated queries on an unchanged combined summary are answered before any context is built
+        cache_key = None
+        version = pm.combined_summary_version()
+        if QUERY_CACHE_ENABLED and version is not None:
+            client_id = f"{client_type}|{getattr(client, 'llm_service', '')}|{getattr(client, 'model_name', '')}"
+            cache_key = pm.query_cache.make_key(input_query, client_id, pm.query_cache.fingerprint(
+                *version, _QUERY_PROMPT_PREFIX, _QUERY_PROMPT, QUERY_CONTEXT_TOKEN_BUDGET))
+            cached = pm.query_cache.get(cache_key) if use_cache else None
+            if cached:
+                return self._answer_from_cache(cached, input_query, client_type, started)
+
+        # Prompt size is checked against the client's model before anything is sent
+        hard_limit = client.prompt_token_limit() if hasattr(client, "prompt_token_limit") else None
+        model_name = getattr(client, "model_name", None)
+
         # Check if the project is effectively empty: either no summary exists or there are no processable files.
         if not pm.has_summary() or pm.is_project_empty():
             is_new_project_query = True
@@ -209,9 +414,11 @@ class QueryHandler:
             # Use the specific prompt for generating the project structure definition.
             prompt = NEW_PROJECT_CREATION_PROMPT.format(input_query=input_query)
             # The expected response is the JSON structure resembling combined_code_summary.json
+            budget = PromptBudget(0, hard_limit, model_name)
+            budget.reserve(prompt)
         else:
             # --- Existing Project Logic (remains largely the same) ---
-            combined = load_json(pm.combined_json_path)
+            combined = pm.load_combined_summary()
             if not combined:
                 print(f"Error: Could not load or parse summary file from {pm.combined_json_path}")
                 return None  # Indicate failure
@@ -222,41 +429,29 @@ class QueryHandler:
             if not files_data:
                 print("Warning: Summary exists but contains no file entries. Treating as standard query (might create new files).")
                 # Construct prompt assuming user might want to add files to an empty project structure
-                prompt = f"""This is a user query for a project with a summary but no files yet: {input_query}
-    Project summary: {project_summary}
-    There are currently no files with summaries in the project.
-    Generate the necessary file(s) or instructions based on the query. If creating files, provide the path and the complete code/content for the new file in 'instructions_to_modify'.
-    Respond ONLY in JSON format, starting with [ and ending with ], following this structure exactly:
-    [{{"file_path": "relative/path/to/new_file.ext", "concise_summary": "Purpose of the new file.", "instructions_to_modify": "Complete code/content for the new file."}}, ...]
-    Ensure the output is valid JSON. Do not include any other text, explanations, or markdown formatting outside the JSON structure. Ensure 'file_path' uses forward slashes '/' and is relative to the project root.
-    """
+                prompt = _EMPTY_PROJECT_QUERY_PROMPT.format(input_query=input_query, project_summary=project_summary)
+                budget = PromptBudget(0, hard_limit, model_name)
+                budget.reserve(prompt)
             else:
-                # Standard prompt for existing projects
-                for path, data in files_data.items():
-                    if isinstance(data, dict):
-                        concise_summary = data.get('concise_summary', 'No concise summary available.')
-                        file_summaries_str += f"\nFile path: {path}\nConcise Summary: {concise_summary}\n"
-                    else:
-                        print(f"Warning: Unexpected data format for file '{path}' in summary.")
-                        file_summaries_str += f"\nFile path: {path}\nConcise Summary: Error loading summary.\n"
-
-                prompt = f"""This is user query: {input_query}
-    Project summary: {project_summary}
-    File summaries: {file_summaries_str}
-    Select the files that are most relevant to the query and provide instructions for modifications. If the query requires creating a new file, provide the path and the complete code/content for the new file in 'instructions_to_modify'.
-    Respond ONLY in JSON format, starting with [ and ending with ], following this structure exactly:
-    [{{"file_path": "relative/path/to/file.ext", "concise_summary": "Brief explanation of how this file relates to the user query, or the purpose of a new file.", "instructions_to_modify": "Specific, actionable instructions for how the code in this file should be changed, OR the complete code/content for a new file."}}, ...]
-    Ensure the output is valid JSON. Do not include any other text, explanations, or markdown formatting outside the JSON structure. Ensure 'file_path' uses forward slashes '/' and is relative to the project root.
-    """
-        # --- Common Logic: Call LLM and Process Response ---
+                # Standard prompt for existing projects: the template, query and project summary are
+                # always sent; file summaries are added most relevant first while they fit.
+                budget = PromptBudget(QUERY_CONTEXT_TOKEN_BUDGET, hard_limit, model_name)
+                budget.reserve(_QUERY_PROMPT_PREFIX.format(project_summary=project_summary, catalogue=""))
+                budget.reserve(_QUERY_PROMPT.format(input_query=input_query, file_summaries=""))
+                catalogue, file_summaries_str = self._file_context(pm, input_query, files_data, budget)
+                prefix = _QUERY_PROMPT_PREFIX.format(project_summary=project_summary, catalogue=catalogue)
+                prompt = _QUERY_PROMPT.format(input_query=input_query, file_summaries=file_summaries_str)
+
+        prompt_budget = budget.report()
+        print(f"Query prompt: ~{budget.used} tokens (model limit {hard_limit}), "
+              f"{prompt_budget['dropped_count']} context item(s) dropped.")
+        if budget.over_limit:
+            print(f"Error: The query prompt (~{budget.used} tokens) exceeds the prompt limit of {model_name} "
+                  f"({hard_limit} tokens) even without optional context; not sending it.")
+            return None
 
-        client = self.clients_mapping.get(client_type)
-        if not client:
-            print(f"Warning: Client type '{client_type}' not found. Using default (openai).")
-            client = self.clients_mapping.get("openai")  # Fallback to default
-            if not client:
-                print("CRITICAL ERROR: Default LLM client 'openai' not found.")
-                return None  # Indicate critical failure
+        if is_new_project_query:
+            cache_key = None  # New-project answers create files: never replayed
 
         print(f"--- Sending Prompt to {client_type} ---")
         print("--- End Prompt ---")
@@ -264,7 +459,7 @@ class QueryHandler:
         start_time = time.time()
         response = None
         try:
-            response = client.get_response(prompt)
+            response = client.get_response(prompt, prefix=prefix) if prefix else client.get_response(prompt)
             print(f"--- Raw Response from {client_type} ---")
             temp_store_file_path = pm.output_dir / f"raw_response_qh_{uuid.uuid4()}.txt"
             try:
@@ -298,7 +493,7 @@ class QueryHandler:
             else:
                 print("Received valid project structure definition.")
                 # Save this structure as the combined summary
-                save_json(project_structure_data, pm.combined_json_path)
+                pm.save_combined_summary(project_structure_data)
                 print(f"Saved new project structure to {pm.combined_json_path}")
                 pm.update_project_record({
                     "last_summarized": datetime.now().isoformat(),
@@ -343,6 +538,13 @@ class QueryHandler:
                 else:
                     file_recommendations = [{"error": "Failed to parse valid JSON list from LLM response.", "file_path": None, "instructions_to_modify": None}]
 
+        if cache_key and isinstance(file_recommendations, list) and \
+                not any(isinstance(item, dict) and "error" in item for item in file_recommendations):
+            try:
+                pm.query_cache.put(cache_key, query_id, file_recommendations, response, trigger_code_generation)
+            except Exception as e:
+                print(f"Warning: Could not update the query cache: {e}")
+
         # --- Save Query History (Common Logic) ---
         query_entry = {
             "id": query_id,
@@ -353,13 +555,13 @@ class QueryHandler:
             "raw_response": response,
             "response_time": elapsed,
             "is_new_project_query": is_new_project_query,
-            "trigger_code_generation": trigger_code_generation
+            "trigger_code_generation": trigger_code_generation,
+            "prompt_budget": prompt_budget,  # Token estimate of the prompt and the context left out of it
+            "llm_usage": getattr(client, "last_usage", None)  # Provider-reported tokens, cached ones included
         }
 
         try:
-            history = pm.load_query_history()
-            history.insert(0, query_entry)
-            pm.save_query_history(history)
+            pm.add_query(query_entry)
         except Exception as e:
             print(f"Error saving query history: {e}")
             return query_id, trigger_code_generation
@@ -0,0 +1,98 @@
+# scan_journal.py
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+def content_hash(content):
+    """Hash of a file's text content as recorded in the scan journal."""
+    return hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+
+
+class ScanJournal:
+    """
+    Append-only JSONL journal of a project scan. Every summarized file is recorded with the
+    hash of the content it was summarized from, so a scan that was interrupted (crash, deploy,
+    cancelled job) can be restarted and skip files whose summary in summaries_dir is still
+    valid for their current content.
+
+    Records:
+        {"event": "scan_started", "model": ..., "timestamp": ...}
+        {"event": "file_done", "path": ..., "hash": ..., "timestamp": ...}
+        {"event": "scan_completed", "timestamp": ...}
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = Path(journal_path)
+        self._lock = threading.Lock()
+        self.model = None
+        self.completed = True
+        self.done = {}  # relative path -> content hash
+        self._load()
+
+    def _load(self):
+        if not self.journal_path.exists():
+            return
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partially written last line after a crash
+                    event = record.get("event")
+                    if event == "scan_started":
+                        self.model = record.get("model")
+                        self.completed = False
+                        self.done = {}
+                    elif event == "file_done" and record.get("path"):
+                        self.done[record["path"]] = record.get("hash")
+                    elif event == "scan_completed":
+                        self.completed = True
+        except OSError as e:
+            print(f"Error reading scan journal {self.journal_path}: {e}")
+
+    def _append(self, record):
+        record["timestamp"] = datetime.now().isoformat()
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def begin(self, model):
+        """
+        Starts a scan. Resumes the previous scan if it never completed and used the same
+        model; otherwise starts a fresh journal. Returns True when resuming.
+        """
+        with self._lock:
+            if not self.completed and self.model == model and self.done:
+                print(f"Resuming interrupted scan: {len(self.done)} file(s) already summarized.")
+                return True
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self.journal_path.write_text("", encoding="utf-8")
+            self.model = model
+            self.completed = False
+            self.done = {}
+            self._append({"event": "scan_started", "model": model})
+            return False
+
+    def is_done(self, relative_path, file_hash):
+        with self._lock:
+            return not self.completed and self.done.get(relative_path) == file_hash
+
+    def record(self, relative_path, file_hash):
+        with self._lock:
+            self.done[relative_path] = file_hash
+            self._append({"event": "file_done", "path": relative_path, "hash": file_hash})
+
+    def complete(self):
+        """Marks the scan as finished so the next scan starts from scratch."""
+        with self._lock:
+            if self.completed:
+                return
+            self.completed = True
+            self._append({"event": "scan_completed"})
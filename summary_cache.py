@@ -0,0 +1,143 @@
+# summary_cache.py
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from constants import COMBINED_FILE_PROMPT, INCREMENTAL_FILE_PROMPT, SUMMARY_CACHE_DIR, SUMMARY_CACHE_MAX_BYTES, SUMMARY_CACHE_MAX_ENTRIES
+from utils import load_json, save_json
+
+# Changes whenever the prompt template is edited, so stale summaries are never served.
+COMBINED_FILE_PROMPT_VERSION = hashlib.sha256(COMBINED_FILE_PROMPT.encode("utf-8")).hexdigest()[:16]
+INCREMENTAL_FILE_PROMPT_VERSION = hashlib.sha256(INCREMENTAL_FILE_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+
+class SummaryCache:
+    """
+    Persistent cache of (detailed, concise) file summaries keyed by file content hash,
+    COMBINED_FILE_PROMPT version and model name. Entries are stored one JSON file each
+    under cache_dir and evicted least-recently-used first (file mtime is bumped on every
+    hit) once either the byte or the entry limit is exceeded.
+    """
+
+    def __init__(self, cache_dir=SUMMARY_CACHE_DIR, max_bytes=SUMMARY_CACHE_MAX_BYTES,
+                 max_entries=SUMMARY_CACHE_MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.entries_dir = self.cache_dir / "entries"
+        self.stats_path = self.cache_dir / "stats.json"
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+
+        stored = load_json(self.stats_path) or {}
+        self.hits = stored.get("hits", 0)
+        self.misses = stored.get("misses", 0)
+        self.evictions = stored.get("evictions", 0)
+
+        # Track the current footprint so eviction only needs a directory scan when over budget
+        self._total_bytes = 0
+        self._entry_count = 0
+        for entry in os.scandir(self.entries_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                self._total_bytes += entry.stat().st_size
+                self._entry_count += 1
+
+    @staticmethod
+    def make_key(content, file_path, model_name, prompt_version=COMBINED_FILE_PROMPT_VERSION):
+        """
+        Builds the cache key for a file's content as summarized by a given model and prompt.
+        Summaries revised from a diff pass incremental_prompt_version(), so they never answer
+        for a full summary of the same content.
+        """
+        content_hash = hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+        file_type = os.path.splitext(str(file_path))[1]
+        return hashlib.sha256(f"{content_hash}|{file_type}|{prompt_version}|{model_name}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def incremental_prompt_version(previous_detailed, previous_concise):
+        """Prompt version for a revision of the given previous summaries (they shape the result)."""
+        previous = hashlib.sha256(f"{previous_detailed}\0{previous_concise}".encode("utf-8", errors="replace"))
+        return f"{INCREMENTAL_FILE_PROMPT_VERSION}:{previous.hexdigest()[:16]}"
+
+    def _entry_path(self, key):
+        return self.entries_dir / f"{key}.json"
+
+    def get(self, key):
+        """Returns (detailed, concise) for key, or None on a miss."""
+        entry_path = self._entry_path(key)
+        data = load_json(entry_path) if entry_path.exists() else None
+        with self._lock:
+            if not data or "detailed_summary" not in data:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(entry_path)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return data["detailed_summary"], data.get("concise_summary", "")
+
+    def put(self, key, detailed, concise, model_name=None):
+        """Stores a summary. Error responses are never cached."""
+        if detailed.startswith("Error") or concise.startswith("Error"):
+            return
+        entry_path = self._entry_path(key)
+        existed = entry_path.exists()
+        old_size = entry_path.stat().st_size if existed else 0
+        save_json({"detailed_summary": detailed, "concise_summary": concise, "model": model_name}, entry_path)
+        try:
+            new_size = entry_path.stat().st_size
+        except OSError:
+            return
+        with self._lock:
+            self._total_bytes += new_size - old_size
+            if not existed:
+                self._entry_count += 1
+            over_budget = self._total_bytes > self.max_bytes or self._entry_count > self.max_entries
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """Removes least-recently-used entries until the cache is back under 90% of its limits."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.entries_dir):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+            entries.sort()
+            total_bytes = sum(size for _, size, _ in entries)
+            count = len(entries)
+            target_bytes = int(self.max_bytes * 0.9)
+            target_entries = max(1, int(self.max_entries * 0.9))
+            for _, size, path in entries:
+                if total_bytes <= target_bytes and count <= target_entries:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_bytes -= size
+                count -= 1
+                self.evictions += 1
+            self._total_bytes = total_bytes
+            self._entry_count = count
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": self._entry_count,
+                "bytes": self._total_bytes,
+            }
+
+    def save_stats(self):
+        """Persists the hit/miss/eviction counters."""
+        stats = self.stats()
+        save_json({"hits": stats["hits"], "misses": stats["misses"], "evictions": stats["evictions"]}, self.stats_path)
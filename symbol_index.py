@@ -0,0 +1,343 @@
+# symbol_index.py
+
+import ast
+import re
+import bisect
+import posixpath
+import threading
+from pathlib import Path
+from utils import load_json, save_json
+from constants import SYMBOL_MAX_FILE_BYTES, SYMBOL_SEARCH_LIMIT, SYMBOL_USAGE_LIMIT
+
+# --- Definition extraction. Each extractor returns (kind, name, line) triples; kinds are
+#   "class", "function", "method", "type", "constant", "route", "selector", "id", "block"
+
+_IDENT_RE = re.compile(r"[A-Za-z_$][\w$]*")
+_ROUTE_DECORATORS = {"route", "get", "post", "put", "patch", "delete", "websocket", "api_route"}
+_NOT_METHODS = {"if", "for", "while", "switch", "catch", "return", "function", "with", "else", "new", "typeof"}
+
+
+def _rx(pattern, flags=re.M):
+    return re.compile(pattern, flags)
+
+
+# Per extension family: (kind, pattern) pairs, the name in group 1
+_JS_PATTERNS = [
+    ("function", _rx(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)")),
+    ("class", _rx(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)")),
+    ("function", _rx(r"^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=\n]+)?=\s*"
+                     r"(?:async\s+)?(?:function\b|\([^)\n]*\)\s*(?::[^=\n]+)?=>|[A-Za-z_$][\w$]*\s*=>)")),
+    ("type", _rx(r"^\s*(?:export\s+)?(?:declare\s+)?(?:interface|type|enum)\s+([A-Za-z_$][\w$]*)")),
+    ("method", _rx(r"^[ \t]+(?:static\s+|async\s+|public\s+|private\s+|protected\s+|get\s+|set\s+)*"
+                   r"([A-Za-z_$][\w$]*)\s*\([^)\n]*\)\s*(?::[^{\n]+)?\{")),
+    ("route", _rx(r"""\b(?:app|router|server|api)\.(?:get|post|put|patch|delete|all|use)\(\s*['"`](/[^'"`]*)""")),
+]
+_STYLE_PATTERNS = [
+    ("function", _rx(r"^\s*@(?:mixin|function)\s+([\w-]+)")),
+]
+_HTML_PATTERNS = [
+    ("id", _rx(r"""\bid\s*=\s*['"]([\w-]+)['"]""")),
+    ("block", _rx(r"""{%-?\s*block\s+(\w+)""")),
+    ("function", _rx(r"""{%-?\s*macro\s+(\w+)""")),
+]
+_LANG_PATTERNS = {
+    ".php": [
+        ("function", _rx(r"^\s*(?:(?:public|private|protected|static|abstract|final)\s+)*function\s+&?(\w+)")),
+        ("class", _rx(r"^\s*(?:abstract\s+|final\s+)?(?:class|interface|trait|enum)\s+(\w+)")),
+        ("route", _rx(r"""\bRoute::(?:get|post|put|patch|delete|any|match)\(\s*['"]([^'"]+)""")),
+    ],
+    ".rb": [
+        ("function", _rx(r"^\s*def\s+(?:self\.)?([\w?!=]+)")),
+        ("class", _rx(r"^\s*(?:class|module)\s+([\w:]+)")),
+        ("route", _rx(r"""^\s*(?:get|post|put|patch|delete)\s+['"](/?[^'"]+)""")),
+    ],
+    ".java": [
+        ("class", _rx(r"^\s*(?:(?:public|private|protected|static|abstract|final|sealed)\s+)*"
+                      r"(?:class|interface|enum|record|@interface)\s+(\w+)")),
+        ("method", _rx(r"^\s+(?:(?:public|private|protected|static|final|abstract|synchronized|default)\s+)+"
+                       r"[\w<>\[\],.? ]+?\s+(\w+)\s*\(")),
+        ("route", _rx(r"""@(?:Get|Post|Put|Patch|Delete|Request)Mapping\(\s*(?:value\s*=\s*|path\s*=\s*)?"([^"]+)\"""")),
+    ],
+    ".kt": [
+        ("class", _rx(r"^\s*(?:(?:data|sealed|abstract|open|enum|inner|private|internal|public)\s+)*"
+                      r"(?:class|interface|object)\s+(\w+)")),
+        ("function", _rx(r"^\s*(?:(?:private|internal|public|override|suspend|inline|open)\s+)*fun\s+(?:<[^>]+>\s*)?"
+                         r"(?:[\w.]+\.)?(\w+)")),
+        ("route", _rx(r"""@(?:Get|Post|Put|Patch|Delete|Request)Mapping\(\s*(?:value\s*=\s*|path\s*=\s*)?"([^"]+)\"""")),
+    ],
+    ".cs": [
+        ("class", _rx(r"^\s*(?:(?:public|private|protected|internal|static|abstract|sealed|partial)\s+)*"
+                      r"(?:class|interface|struct|enum|record)\s+(\w+)")),
+        ("method", _rx(r"^\s+(?:(?:public|private|protected|internal|static|virtual|override|async|abstract)\s+)+"
+                       r"[\w<>\[\],.? ]+?\s+(\w+)\s*\(")),
+        ("route", _rx(r"""\[(?:Http(?:Get|Post|Put|Patch|Delete)|Route)\(\s*"([^"]+)\"""")),
+    ],
+    ".go": [
+        ("function", _rx(r"^func\s+(?:\([^)]*\)\s*)?(\w+)")),
+        ("type", _rx(r"^type\s+(\w+)\s")),
+        ("route", _rx(r"""\.(?:HandleFunc|Handle|GET|POST|PUT|PATCH|DELETE|Get|Post|Put|Patch|Delete)\(\s*"(/[^"]*)\"""")),
+    ],
+    ".rs": [
+        ("function", _rx(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:const\s+)?(?:unsafe\s+)?fn\s+(\w+)")),
+        ("type", _rx(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|type|union)\s+(\w+)")),
+        ("constant", _rx(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const|static)\s+(?:mut\s+)?([A-Z_][A-Z0-9_]*)\s*:")),
+    ],
+    ".swift": [
+        ("function", _rx(r"^\s*(?:(?:public|private|internal|fileprivate|open|static|class|override|mutating)\s+)*"
+                         r"func\s+(\w+)")),
+        ("class", _rx(r"^\s*(?:(?:public|private|internal|fileprivate|open|final)\s+)*"
+                      r"(?:class|struct|enum|protocol|actor|extension)\s+(\w+)")),
+    ],
+    ".c": [
+        ("function", _rx(r"^(?!\s*(?:if|for|while|switch|return|else)\b)[A-Za-z_][\w \t\*&:<>,]*?\b(\w+)\s*\([^;{}]*\)\s*(?:const\s*)?\{")),
+        ("type", _rx(r"^\s*(?:typedef\s+)?(?:struct|union|enum|class)\s+(\w+)\s*(?:[:{]|$)")),
+        ("constant", _rx(r"^\s*#\s*define\s+(\w+)")),
+    ],
+    ".sql": [
+        ("type", _rx(r"^\s*create\s+(?:or\s+replace\s+)?(?:temporary\s+|temp\s+)?(?:table|view|materialized\s+view|type)"
+                     r"\s+(?:if\s+not\s+exists\s+)?[\"`\[]?([\w.]+)", re.M | re.I)),
+        ("function", _rx(r"^\s*create\s+(?:or\s+replace\s+)?(?:function|procedure|trigger)\s+[\"`\[]?([\w.]+)", re.M | re.I)),
+    ],
+    ".sh": [
+        ("function", _rx(r"^\s*(?:function\s+([\w-]+)|([\w-]+)\s*\(\)\s*\{)")),
+    ],
+    ".ps1": [
+        ("function", _rx(r"^\s*function\s+([\w-]+)", re.M | re.I)),
+    ],
+}
+for _alias, _family in ((".cpp", ".c"), (".h", ".c"), (".hpp", ".c"), (".bash", ".sh")):
+    _LANG_PATTERNS[_alias] = _LANG_PATTERNS[_family]
+_LANG_PATTERNS.update({ext: _JS_PATTERNS for ext in (".js", ".jsx", ".ts", ".tsx")})
+_LANG_PATTERNS.update({ext: _STYLE_PATTERNS for ext in (".css", ".scss", ".sass")})
+_LANG_PATTERNS[".html"] = _HTML_PATTERNS
+
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SELECTOR_RE = re.compile(r"([.#])(-?[A-Za-z_][\w-]*)")
+_CSS_DELIMITER_RE = re.compile(r"(?<!#)\{|[};]")  # '#{' is SCSS interpolation, not a block
+_VUE_BLOCK_RE = re.compile(r"<(script|style)\b[^>]*>(.*?)</\1>", re.S | re.I)
+
+
+def _line_starts(text):
+    starts = [0]
+    starts.extend(match.end() for match in re.finditer("\n", text))
+    return starts
+
+
+def _line_of(starts, offset):
+    return bisect.bisect_right(starts, offset)
+
+
+def _match_patterns(patterns, text, offset=0, starts=None):
+    starts = starts or _line_starts(text)
+    symbols = []
+    for kind, pattern in patterns:
+        for match in pattern.finditer(text):
+            name = next((g for g in match.groups() if g), None)
+            if not name or (kind == "method" and name in _NOT_METHODS):
+                continue
+            symbols.append((kind, name, _line_of(starts, offset + match.start(match.lastindex or 0))))
+    return symbols
+
+
+def _css_selectors(text, offset=0, starts=None):
+    """Class and id selectors of style rules: the text before each '{' back to the previous '{', '}' or ';'."""
+    starts = starts or _line_starts(text)
+    text = _CSS_COMMENT_RE.sub(lambda m: re.sub(r"[^\n]", " ", m.group(0)), text)
+    symbols = []
+    position = 0
+    for delimiter in _CSS_DELIMITER_RE.finditer(text):
+        if delimiter.group(0) == "{" and not text[position:delimiter.start()].lstrip().startswith("@"):
+            for match in _CSS_SELECTOR_RE.finditer(text, position, delimiter.start()):
+                symbols.append(("selector" if match.group(1) == "." else "id", match.group(1) + match.group(2),
+                                _line_of(starts, offset + match.start())))
+        position = delimiter.end()
+    return symbols
+
+
+def _python_symbols(text):
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return _match_patterns([
+            ("function", _rx(r"^\s*(?:async\s+)?def\s+(\w+)")),
+            ("class", _rx(r"^\s*class\s+(\w+)")),
+        ], text)
+    symbols = []
+
+    def visit(node, container):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                name = f"{container}.{child.name}" if container else child.name
+                symbols.append(("class", name, child.lineno))
+                visit(child, name)
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = f"{container}.{child.name}" if container else child.name
+                symbols.append(("method" if container else "function", name, child.lineno))
+                for decorator in child.decorator_list:
+                    if isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute) and \
+                            decorator.func.attr in _ROUTE_DECORATORS and decorator.args and \
+                            isinstance(decorator.args[0], ast.Constant) and isinstance(decorator.args[0].value, str):
+                        symbols.append(("route", decorator.args[0].value, decorator.lineno))
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and not container and isinstance(node, ast.Module):
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                symbols.extend(("constant", target.id, child.lineno) for target in targets
+                               if isinstance(target, ast.Name) and target.id.isupper())
+            elif not isinstance(child, (ast.Lambda, ast.expr)):
+                visit(child, container)  # if/try blocks at module or class level
+
+    visit(tree, "")
+    return symbols
+
+
+def extract_symbols(ext, text):
+    """Definitions in a source file as (kind, name, line) triples."""
+    if ext == ".py":
+        return _python_symbols(text)
+    if ext in (".css", ".scss", ".sass"):
+        return _match_patterns(_STYLE_PATTERNS, text) + _css_selectors(text)
+    if ext == ".vue":
+        starts = _line_starts(text)
+        symbols = []
+        for match in _VUE_BLOCK_RE.finditer(text):
+            offset = match.start(2)
+            if match.group(1).lower() == "script":
+                symbols.extend(_match_patterns(_JS_PATTERNS, match.group(2), offset, starts))
+            else:
+                symbols.extend(_css_selectors(match.group(2), offset, starts))
+        return symbols
+    patterns = _LANG_PATTERNS.get(ext)
+    return _match_patterns(patterns, text) if patterns else []
+
+
+class SymbolIndex:
+    """
+    Project-local index of definitions (functions, classes, methods, types, constants, routes,
+    CSS selectors, HTML ids) and of the identifiers each file mentions, kept in symbol_index.json
+    in the project output dir. Like DependencyGraph it is fed by the project's FileInventory, so
+    refresh() only re-parses files whose stat changed. Answers "where is X defined / used"
+    without an LLM call.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.source_path = inventory.source_path
+        self.path = Path(inventory.output_dir) / "symbol_index.json"
+        self._lock = threading.RLock()
+        self._files = None  # rel_path -> {"stat": [size, mtime_ns, ino], "symbols": [[kind, name, line]], "refs": [...]}
+        self._definitions = {}  # lowercased name (and last dotted part) -> [(rel_path, kind, name, line)]
+        self._references = {}  # identifier -> set of rel_paths mentioning it
+
+    # --- Building ---
+    def _load(self):
+        if self._files is None:
+            data = load_json(self.path) or {}
+            same_tree = data.get("source_path") == str(self.source_path)
+            self._files = data.get("files", {}) if same_tree and isinstance(data.get("files"), dict) else {}
+
+    def refresh(self):
+        """Refreshes the inventory and re-parses new or changed files. Returns self."""
+        with self._lock:
+            self._load()
+            inventory_files = self.inventory.refresh().entries()
+            changed = False
+            for rel in [rel for rel in self._files if rel not in inventory_files]:
+                del self._files[rel]
+                changed = True
+            parsed = 0
+            for rel, entry in inventory_files.items():
+                stat = [entry["size"], entry["mtime_ns"], entry["ino"]]
+                cached = self._files.get(rel)
+                if cached is not None and cached.get("stat") == stat:
+                    continue
+                self._files[rel] = dict(self._parse(rel, entry["size"]), stat=stat)
+                changed = True
+                parsed += 1
+            if changed or not self._definitions and self._files:
+                self._build_maps()
+            if changed:
+                save_json({"source_path": str(self.source_path), "files": self._files}, self.path)
+                if parsed:
+                    print(f"Symbol index: parsed {parsed} file(s), {len(self._files)} indexed.")
+            return self
+
+    def _parse(self, rel, size):
+        if size > SYMBOL_MAX_FILE_BYTES:
+            return {"symbols": [], "refs": []}
+        try:
+            text = (self.source_path / rel).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return {"symbols": [], "refs": []}
+        try:
+            symbols = extract_symbols(posixpath.splitext(rel)[1].lower(), text)
+        except (RecursionError, ValueError) as e:
+            print(f"Symbol index: could not parse {rel}: {e}")
+            symbols = []
+        refs = sorted({word for word in _IDENT_RE.findall(text) if len(word) > 2})
+        return {"symbols": [list(symbol) for symbol in dict.fromkeys(symbols)], "refs": refs}
+
+    def _build_maps(self):
+        self._definitions = {}
+        self._references = {}
+        for rel, data in self._files.items():
+            for kind, name, line in data.get("symbols", []):
+                entry = (rel, kind, name, line)
+                keys = {name.lower(), name.rsplit(".", 1)[-1].lower(), name.lstrip(".#").lower()}
+                for key in keys:
+                    self._definitions.setdefault(key, []).append(entry)
+            for word in data.get("refs", []):
+                self._references.setdefault(word, set()).add(rel)
+
+    # --- Queries (call refresh() first) ---
+    @staticmethod
+    def _as_dict(entry):
+        rel, kind, name, line = entry
+        return {"name": name, "kind": kind, "file_path": rel, "line": line}
+
+    def definitions(self, name, kind=None, limit=SYMBOL_SEARCH_LIMIT):
+        """
+        Definitions named 'name' (case-insensitive; 'save' also finds methods such as
+        'Store.save', 'btn' the selector '.btn'), exact-case matches first.
+        """
+        matches = [entry for entry in self._definitions.get(name.lower(), ()) if not kind or entry[1] == kind]
+        matches.sort(key=lambda entry: (name not in (entry[2], entry[2].rsplit(".", 1)[-1]), entry[0], entry[3]))
+        return [self._as_dict(entry) for entry in matches[:limit]]
+
+    def search(self, text, kind=None, limit=SYMBOL_SEARCH_LIMIT):
+        """Definitions whose name starts with (then contains) 'text', case-insensitively."""
+        needle = text.lower().strip()
+        if not needle:
+            return []
+        prefix, contains = [], []
+        for key in sorted(self._definitions):
+            if needle in key:
+                (prefix if key.startswith(needle) else contains).append(key)
+        results, seen = [], set()
+        for key in prefix + contains:
+            for entry in self._definitions[key]:
+                if entry not in seen and (not kind or entry[1] == kind):
+                    seen.add(entry)
+                    results.append(self._as_dict(entry))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def files_mentioning(self, name):
+        """Files whose source contains the identifier 'name' (exact case)."""
+        return sorted(self._references.get(name, ()))
+
+    def usages(self, name, limit=SYMBOL_USAGE_LIMIT):
+        """[{"file_path", "line", "text"}] of lines mentioning the identifier 'name', definitions excluded."""
+        word = re.compile(r"(?<![\w$])" + re.escape(name) + r"(?![\w$])")
+        defined = {(d["file_path"], d["line"]) for d in self.definitions(name, limit=None)}
+        results = []
+        for rel in self.files_mentioning(name):
+            try:
+                lines = (self.source_path / rel).read_text(encoding="utf-8", errors="replace").splitlines()
+            except OSError:
+                continue
+            for number, line in enumerate(lines, 1):
+                if word.search(line) and (rel, number) not in defined:
+                    results.append({"file_path": rel, "line": number, "text": line.strip()[:200]})
+                    if len(results) >= limit:
+                        return results
+        return results
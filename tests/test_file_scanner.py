@@ -0,0 +1,108 @@
+# tests/test_file_scanner.py
+
+import os
+import shutil
+import subprocess
+import pytest
+from file_scanner import FileScanner, ExclusionMatcher, GitIgnore
+
+# Files created in every work tree; directories are implied by the paths
+PATHS = [
+    "foo", "foo.py", "a/foo", "a/b/foo", "a/b/c.txt", "a/x/y/b/z", "a/xx/b/z", "a/xb", "a/x/yb",
+    "ab", "a-b", "axb", "doc/frotz", "x/doc/frotz", "build/out.o", "src/build/keep.c",
+    "lib/keep.txt", "lib/drop.txt", "lib/sub/deep.txt", "abc/def", "abc/x/y", "dot/.hidden",
+    "name with space ", "name with space", "#hash", "!bang", "star*", "stara", "trail\\",
+    "q[x", "qx", "qy", "q]", "q-", "q\\", "qa", "qb", "ba", "bb", "b!", "b]", "x/q/y", "x/qby",
+]
+
+CASES = {
+    "double_star_prefix": "**/foo\n",
+    "double_star_middle": "a/**/z\n",
+    "double_star_suffix": "abc/**\n",
+    "double_star_everything": "**\n!a/\n!a/**\n",
+    "double_star_inside_name": "a**b\n",
+    "double_star_after_slash": "a/**b\n",
+    "double_star_before_slash": "a/x**/b\n",
+    "anchored_leading_slash": "/foo\n",
+    "anchored_inner_slash": "doc/frotz\n",
+    "unanchored": "foo\n",
+    "dir_only": "build/\n",
+    "dir_only_glob": "*/\n!a/\n",
+    "negation": "*.txt\n!keep.txt\n",
+    "negation_in_ignored_dir": "lib/\n!lib/keep.txt\n",
+    "negation_of_dir_contents": "lib/*\n!lib/keep.txt\n!lib/sub/\n",
+    "dot_files": "*\n!*/\n!.hidden\n",
+    "comment_and_blank": "# foo\n\n   \nab\n",
+    "escaped_specials": "\\#hash\n\\!bang\nstar\\*\n",
+    "escaped_trailing_space": "name with space\\ \n",
+    "escaped_space_then_spaces": "name with space\\   \n",
+    "unescaped_trailing_spaces": "foo   \n",
+    "trailing_backslash": "trail\\\n",
+    "question_mark": "a?b\nx/q?y\n",
+    "bracket": "q[xy]\n",
+    "bracket_negated": "b[!a]\n",
+    "bracket_caret": "b[^a]\n",
+    "bracket_close_first": "q[]]\n",
+    "bracket_negated_close_first": "b[!]]\n",
+    "bracket_escaped_close": "q[\\]]\n",
+    "bracket_range": "[a-b]x?\n",
+    "bracket_reversed_range": "q[b-a]\n",
+    "bracket_trailing_dash": "q[a-]\n",
+    "bracket_posix": "b[[:alpha:]]\n",
+    "bracket_unknown_posix": "q[[:foo:]]\nqx\n",
+    "bracket_unterminated": "q[x\n",
+    "bracket_slash": "x/q[/]y\nx/q[!a]y\n",
+}
+
+NESTED_CASES = {
+    "nested_overrides_parent": ("*.txt\n", {"lib": "!keep.txt\n"}),
+    "nested_anchored": ("", {"a": "/foo\nb/c.txt\n"}),
+    "nested_dir_only": ("", {"a": "b/\n"}),
+}
+
+ALL_CASES = {**{name: (gitignore, {}) for name, gitignore in CASES.items()}, **NESTED_CASES}
+
+
+def _make_tree(root, gitignore, nested):
+    subprocess.run(["git", "init", "-q", str(root)], check=True)
+    for rel_path in PATHS:
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    (root / ".gitignore").write_text(gitignore, encoding="utf-8")
+    for dir_rel, content in nested.items():
+        (root / dir_rel / ".gitignore").write_text(content, encoding="utf-8")
+
+
+def _git_visible(root):
+    """Untracked files git does not ignore: the ground truth the scanner must reproduce."""
+    out = subprocess.run(["git", "ls-files", "-z", "--others", "--exclude-standard"],
+                         cwd=root, capture_output=True, check=True).stdout
+    return {p for p in out.decode("utf-8").split("\0") if p}
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+@pytest.mark.parametrize("gitignore, nested", list(ALL_CASES.values()), ids=list(ALL_CASES))
+def test_matches_git(tmp_path, gitignore, nested):
+    _make_tree(tmp_path, gitignore, nested)
+    expected = _git_visible(tmp_path)
+    scanner = FileScanner(str(tmp_path), matcher=ExclusionMatcher([".git"]), code_only=False)
+    assert {entry.rel_path for entry in scanner.walk()} == expected
+    files = [p for p in PATHS if os.path.isfile(tmp_path / p)]
+    assert {p for p in files if scanner.is_tracked(p)} == expected & set(files)
+
+
+def test_match_reports_unmatched_paths():
+    ignore = GitIgnore(["*.log\n", "!keep.log\n", "out/\n"])
+    assert ignore.match("debug.log", False) is True
+    assert ignore.match("keep.log", False) is False
+    assert ignore.match("main.py", False) is None
+    assert ignore.match("out", False) is None
+    assert ignore.match("out", True) is True
+
+
+def test_from_file_without_rules(tmp_path):
+    path = tmp_path / ".gitignore"
+    path.write_text("# only a comment\n\n", encoding="utf-8")
+    assert GitIgnore.from_file(path) is None
+    assert GitIgnore.from_file(tmp_path / "missing") is None
@@ -0,0 +1,110 @@
+# tests/test_history_log.py
+
+import json
+import pytest
+import history_log
+from history_log import HistoryLog
+
+
+@pytest.fixture
+def log(tmp_path):
+    return HistoryLog(tmp_path / "query_history")
+
+
+def test_append_get_list_count(log):
+    log.append({"id": "a", "text": "first"})
+    log.append({"id": "b", "text": "second"})
+    log.append({"id": "a", "text": "first, revised"})
+    assert log.get("a")["text"] == "first, revised"
+    assert log.get("missing") is None
+    assert [e["id"] for e in log.list()] == ["b", "a"]
+    assert log.count() == 2
+
+
+def test_delete_writes_tombstone(log, monkeypatch):
+    monkeypatch.setattr(history_log, "HISTORY_LOG_COMPACT_RATIO", 1.0)
+    for i in range(3):
+        log.append({"id": str(i)})
+    assert log.delete("1") is True
+    assert log.delete("1") is False
+    assert log.get("1") is None
+    assert [e["id"] for e in log.list()] == ["0", "2"]
+    assert HistoryLog(log.base_path).count() == 2  # Tombstone survives a reload
+
+
+def test_delete_compacts_past_ratio(log):
+    for i in range(4):
+        log.append({"id": str(i), "text": "x" * 100})
+    for i in range(3):
+        log.delete(str(i))
+    segments = log.segments()
+    assert segments == [1]
+    with open(log._segment_path(1), "rb") as f:
+        assert [json.loads(line)["id"] for line in f] == ["3"]
+    assert log.get("3")["text"] == "x" * 100
+
+
+def test_compact_replaces_content(log):
+    log.append({"id": "a"})
+    log.append({"id": "b"})
+    log.compact([{"id": "c"}])
+    assert [e["id"] for e in log.list()] == ["c"]
+    assert log.get("a") is None
+
+
+def test_rotation_splits_segments(log, monkeypatch):
+    monkeypatch.setattr(history_log, "HISTORY_LOG_MAX_SEGMENT_BYTES", 100)
+    for i in range(10):
+        log.append({"id": str(i), "text": "y" * 40})
+    assert len(log.segments()) > 1
+    reloaded = HistoryLog(log.base_path)
+    assert [reloaded.get(str(i))["id"] for i in range(10)] == [str(i) for i in range(10)]
+    log.compact()
+    assert len(log.segments()) > 1
+    assert [e["id"] for e in log.list()] == [str(i) for i in range(10)]
+
+
+def test_recovers_records_missing_from_index(log):
+    log.append({"id": "a"})
+    with open(log._segment_path(1), "ab") as f:  # Crash after the record, before its index line
+        f.write(b'{"id": "b"}\n')
+        f.write(b'{"id": "c", "tr')  # and a torn record after it
+    reloaded = HistoryLog(log.base_path)
+    assert reloaded.get("b") == {"id": "b"}
+    assert reloaded.get("c") is None
+    assert reloaded.count() == 2
+
+
+def test_ignores_torn_index_line(log):
+    log.append({"id": "a"})
+    with open(log.index_path, "a", encoding="utf-8") as f:
+        f.write("b\t1\t")
+    reloaded = HistoryLog(log.base_path)
+    assert reloaded.count() == 1
+    assert reloaded.get("a") == {"id": "a"}
+
+
+def test_rebuilds_missing_index(log):
+    log.append({"id": "a"})
+    log.append({"id": "b"})
+    log.delete("a")
+    log.index_path.unlink()
+    reloaded = HistoryLog(log.base_path)
+    assert reloaded.get("a") is None
+    assert reloaded.get("b") == {"id": "b"}
+
+
+def test_sees_compaction_by_another_instance(log, monkeypatch):
+    monkeypatch.setattr(history_log, "HISTORY_LOG_COMPACT_RATIO", 1.0)
+    other = HistoryLog(log.base_path)  # Stands in for a second process
+    for i in range(3):
+        log.append({"id": str(i)})
+    log.delete("0")
+    assert other.count() == 2
+    log.compact()
+    for i in range(3, 8):  # New index ends up at least as large as the one 'other' read
+        log.append({"id": str(i)})
+    assert log.index_path.stat().st_size >= other._index_pos
+    assert other.get("0") is None
+    assert [other.get(str(i))["id"] for i in range(1, 8)] == [str(i) for i in range(1, 8)]
+    assert other.count() == 7
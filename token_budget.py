@@ -0,0 +1,101 @@
+# token_budget.py
+
+from utils import estimate_tokens
+from constants import MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, TOKEN_ESTIMATE_SAFETY_FACTOR, \
+    PROMPT_BUDGET_MAX_REPORTED
+
+try:
+    import tiktoken  # Optional: exact counts for OpenAI-family models
+except ImportError:
+    tiktoken = None
+
+_encodings = {}
+
+
+def _encoding_for(model_name):
+    if tiktoken is None or not model_name:
+        return None
+    if model_name not in _encodings:
+        try:
+            _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+        except Exception:
+            _encodings[model_name] = None  # Not an OpenAI model name: use the estimate
+    return _encodings[model_name]
+
+
+def count_tokens(text, model_name=None):
+    """
+    Tokens in text for model_name: exact via tiktoken for models it knows, otherwise
+    estimate_tokens() scaled by TOKEN_ESTIMATE_SAFETY_FACTOR (code tokenizes denser than
+    4 characters per token).
+    """
+    if not text:
+        return 0
+    encoding = _encoding_for(model_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(estimate_tokens(text) * TOKEN_ESTIMATE_SAFETY_FACTOR) + 1
+
+
+def context_window(model_name):
+    """Context window (tokens) of a model, from the longest matching prefix in MODEL_CONTEXT_WINDOWS."""
+    name = (model_name or "").lower()
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if name.startswith(prefix)]
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+class PromptBudget:
+    """
+    Tracks the estimated size of a prompt while it is assembled. reserve() counts mandatory
+    text. add() takes an optional section only while the optional sections stay within 'limit'
+    tokens and the whole prompt within 'hard_limit' (the model's prompt limit; None if unknown);
+    required sections only need to fit under hard_limit. Sections that do not fit are recorded
+    as dropped, so they should be offered most relevant first.
+    """
+
+    def __init__(self, limit, hard_limit=None, model_name=None):
+        self.limit = limit
+        self.hard_limit = hard_limit
+        self.model_name = model_name
+        self.used = 0  # Whole prompt
+        self.optional_used = 0  # Sections taken by add()
+        self.dropped = []
+
+    def count(self, text):
+        return count_tokens(text, self.model_name)
+
+    def reserve(self, text):
+        self.used += self.count(text)
+
+    def fits(self, tokens, required=False):
+        if self.hard_limit is not None and self.used + tokens > self.hard_limit:
+            return False
+        return required or self.limit is None or self.optional_used + tokens <= self.limit
+
+    def add(self, text, label=None, required=False):
+        """Counts text in and returns True if it fits; otherwise records label as dropped."""
+        tokens = self.count(text)
+        if not self.fits(tokens, required):
+            if label is not None:
+                self.dropped.append(label)
+            return False
+        self.used += tokens
+        self.optional_used += tokens
+        return True
+
+    @property
+    def over_limit(self):
+        return self.hard_limit is not None and self.used > self.hard_limit
+
+    def report(self):
+        """Summary for the query/modification history."""
+        return {
+            "estimated_tokens": self.used,
+            "context_tokens": self.optional_used,
+            "context_limit": self.limit,
+            "model_limit": self.hard_limit,
+            "model": self.model_name,
+            "over_limit": self.over_limit,
+            "dropped": self.dropped[:PROMPT_BUDGET_MAX_REPORTED],
+            "dropped_count": len(self.dropped),
+        }
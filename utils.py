@@ -8,6 +8,10 @@ def safe_filename(name):
     """Convert a file path into a safe filename by replacing directory separators."""
     return name.replace('/', '_').replace('\\', '_')
 
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token) used for prompt budgeting."""
+    return len(text) // 4 + 1 if text else 0
+
 def format_time(timestamp):
     return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
 def serialize_data(obj):
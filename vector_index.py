@@ -0,0 +1,323 @@
+# vector_index.py
+
+import math
+import array
+import hashlib
+import threading
+from pathlib import Path
+from utils import load_json, save_json
+from bm25_index import tokenize
+from constants import VECTOR_EMBEDDING_BACKEND, VECTOR_OLLAMA_MODEL, VECTOR_OLLAMA_HOST, VECTOR_HASH_DIM, \
+    VECTOR_MAX_TEXT_CHARS, VECTOR_IVF_MIN_ROWS, VECTOR_IVF_NPROBE
+
+try:
+    import numpy as np  # Optional: vectorized search and the IVF/int8 mode
+except ImportError:
+    np = None
+
+try:
+    import requests  # Optional: only the Ollama embedding backend needs it
+except ImportError:
+    requests = None
+
+
+# --- Embedding backends ---
+class HashingEmbedder:
+    """
+    Service-free embeddings: terms (and adjacent-term pairs) are hashed into a fixed number of
+    signed buckets and the vector is L2-normalized. Lexical, but tolerant of word order and
+    identifier splitting, and always available.
+    """
+
+    def __init__(self, dim=VECTOR_HASH_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dim
+            terms = tokenize(text)
+            for feature in terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]:
+                index, sign = self._bucket(feature)
+                vector[index] += sign
+            vectors.append(_normalized(vector))
+        return vectors
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama server (/api/embed, falling back to the older /api/embeddings)."""
+
+    def __init__(self, model=VECTOR_OLLAMA_MODEL, host=VECTOR_OLLAMA_HOST, timeout=60):
+        self.model = model
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.name = f"ollama:{model}"
+        self.session = requests.Session() if requests is not None else None
+
+    def available(self):
+        if self.session is None:
+            return False
+        try:
+            response = self.session.get(f"{self.host}/api/tags", timeout=2)
+            return response.ok and any(m.get("name", "").split(":")[0] == self.model.split(":")[0]
+                                       for m in response.json().get("models", []))
+        except Exception:
+            return False
+
+    def embed(self, texts):
+        response = self.session.post(f"{self.host}/api/embed", json={"model": self.model, "input": list(texts)},
+                                     timeout=self.timeout)
+        if response.status_code == 404:  # Ollama before 0.3: one prompt per call
+            return [_normalized(self._embed_one(text)) for text in texts]
+        response.raise_for_status()
+        return [_normalized(vector) for vector in response.json()["embeddings"]]
+
+    def _embed_one(self, text):
+        response = self.session.post(f"{self.host}/api/embeddings", json={"model": self.model, "prompt": text},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """The process-wide embedder for VECTOR_EMBEDDING_BACKEND ("auto": Ollama if it serves the model, else hashing)."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            if VECTOR_EMBEDDING_BACKEND in ("auto", "ollama"):
+                ollama = OllamaEmbedder()
+                if ollama.available():
+                    _embedder = ollama
+                elif VECTOR_EMBEDDING_BACKEND == "ollama":
+                    print(f"Vector index: Ollama model {VECTOR_OLLAMA_MODEL} unavailable, using hashing embeddings.")
+            if _embedder is None:
+                _embedder = HashingEmbedder()
+            print(f"Vector index: using {_embedder.name} embeddings.")
+        return _embedder
+
+
+def _normalized(vector):
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+# --- Index ---
+class VectorIndex:
+    """
+    Embeddings of a project's file summaries (path, concise and detailed summary per file).
+    Metadata goes to vector_index.json, vectors to vector_index.f32: float32 rows held in memory
+    as one packed array. update() re-embeds only entries whose summaries changed and writes just
+    their rows: new vectors go to free or appended rows, and the rows they replace are freed once
+    the metadata points away from them, so an interrupted update never leaves a row that disagrees
+    with the metadata. The file is compacted when more than half of it is free. Switching
+    embedder rebuilds everything.
+
+    search() is an exact cosine scan: NumPy when installed, plain Python otherwise. With NumPy
+    and at least VECTOR_IVF_MIN_ROWS files it switches to an IVF mode: rows are int8-quantized
+    and clustered with k-means, and only the VECTOR_IVF_NPROBE nearest clusters are scanned.
+    """
+
+    def __init__(self, output_dir, embedder=None):
+        self.meta_path = Path(output_dir) / "vector_index.json"
+        self.vectors_path = Path(output_dir) / "vector_index.f32"
+        self._embedder = embedder
+        self._lock = threading.RLock()
+        self._entries = None  # rel_path -> {"key", "row"}
+        self._vectors = array.array("f")  # Packed rows of _dim floats
+        self._dim = 0
+        self._free = []  # Rows no entry points to
+        self._embedder_name = None  # Backend the stored vectors came from
+        self._version = None
+        self._matrix = None  # (NumPy matrix of the live rows, their rel_paths), built lazily
+        self._ivf = None  # (centroids, lists, codes) built lazily for the IVF mode
+
+    @property
+    def embedder(self):
+        return self._embedder or get_embedder()
+
+    # --- Persistence ---
+    def _load(self):
+        if self._entries is not None:
+            return
+        meta = load_json(self.meta_path) or {}
+        self._entries, self._vectors, self._free = {}, array.array("f"), []
+        self._embedder_name = meta.get("embedder")
+        self._dim = meta.get("dim") or 0
+        if not self._embedder_name or not self._dim or not self.vectors_path.exists():
+            return  # Nothing stored yet: everything is embedded
+        try:
+            with open(self.vectors_path, "rb") as f:
+                self._vectors.frombytes(f.read())
+        except OSError:
+            return
+        rows = len(self._vectors) // self._dim
+        del self._vectors[rows * self._dim:]  # Torn trailing row
+        self._entries = {rel: entry for rel, entry in meta.get("entries", {}).items() if entry.get("row", rows) < rows}
+        used = {entry["row"] for entry in self._entries.values()}
+        self._free = [row for row in range(rows) if row not in used]
+        version = meta.get("version")
+        self._version = tuple(version) if isinstance(version, list) else None
+
+    def _reset(self, embedder_name):
+        self._entries, self._vectors, self._free = {}, array.array("f"), []
+        self._embedder_name, self._dim, self._version = embedder_name, 0, None
+        self.vectors_path.unlink(missing_ok=True)
+
+    def _row(self, row):
+        return self._vectors[row * self._dim:(row + 1) * self._dim]
+
+    def _write_rows(self, rows):
+        """Writes the given rows of _vectors in place (the file grows as needed)."""
+        mode = "r+b" if self.vectors_path.exists() else "w+b"
+        with open(self.vectors_path, mode) as f:
+            for row in sorted(rows):
+                f.seek(row * self._dim * self._vectors.itemsize)
+                self._row(row).tofile(f)
+
+    def _save_meta(self):
+        save_json({"embedder": self._embedder_name, "dim": self._dim,
+                   "version": list(self._version) if self._version else None, "entries": self._entries},
+                  self.meta_path)
+        self._matrix = self._ivf = None
+
+    def _compact(self):
+        """Rewrites the vector file with the live rows only, in path order."""
+        live = sorted(self._entries)
+        vectors = array.array("f")
+        for row, rel in enumerate(live):
+            vectors.extend(self._row(self._entries[rel]["row"]))
+            self._entries[rel]["row"] = row
+        self._vectors, self._free = vectors, []
+        tmp_path = self.vectors_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            vectors.tofile(f)
+        tmp_path.replace(self.vectors_path)
+        self._save_meta()
+
+    # --- Building ---
+    @staticmethod
+    def _document(rel, data):
+        text = f"{rel}\n{data.get('concise_summary', '')}\n{data.get('detailed_summary', '')}"
+        return text[:VECTOR_MAX_TEXT_CHARS]
+
+    def update(self, combined, version=None):
+        """Embeds new or changed entries of a combined summary and drops removed ones."""
+        with self._lock:
+            self._load()
+            self._matrix = self._ivf = None  # Drops the NumPy view of _vectors, which blocks resizing it
+            if self._embedder_name != self.embedder.name:
+                if self._entries:
+                    print(f"Vector index: embedder changed to {self.embedder.name}, re-embedding everything.")
+                self._reset(self.embedder.name)
+            files = combined.get("files", {}) if isinstance(combined, dict) else {}
+            released = [self._entries.pop(rel)["row"] for rel in [rel for rel in self._entries if rel not in files]]
+            removed = len(released)
+            pending = {}
+            for rel, data in files.items():
+                data = data if isinstance(data, dict) else {}
+                text = self._document(rel, data)
+                key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                if self._entries.get(rel, {}).get("key") != key:
+                    pending[rel] = (key, text)
+            if pending:
+                rels = sorted(pending)
+                vectors = []
+                for start in range(0, len(rels), 64):  # Batched embedding requests
+                    vectors.extend(self.embedder.embed([pending[rel][1] for rel in rels[start:start + 64]]))
+                self._dim = self._dim or len(vectors[0])
+                written = []
+                for rel, vector in zip(rels, vectors):
+                    if self._free:
+                        row = self._free.pop(0)
+                        self._vectors[row * self._dim:(row + 1) * self._dim] = array.array("f", vector)
+                    else:
+                        row = len(self._vectors) // self._dim
+                        self._vectors.extend(vector)
+                    if rel in self._entries:
+                        released.append(self._entries[rel]["row"])  # Freed once the metadata no longer uses it
+                    self._entries[rel] = {"key": pending[rel][0], "row": row}
+                    written.append(row)
+                self._write_rows(written)
+                print(f"Vector index: embedded {len(pending)} file summary(ies), removed {removed}.")
+            if pending or released or version != self._version:
+                self._version = version
+                self._save_meta()
+                self._free.extend(released)
+                if len(self._free) * 2 > len(self._vectors) // max(self._dim, 1):
+                    self._compact()
+            return self
+
+    def ensure(self, combined, version):
+        """Updates the index if it was built from another version of the combined summary or by another embedder."""
+        with self._lock:
+            self._load()
+            if version is None or version != self._version or self._embedder_name != self.embedder.name:
+                self.update(combined, version)
+            return self
+
+    # --- Searching ---
+    def search(self, query, limit=None):
+        """Returns [(rel_path, cosine similarity)] of the files nearest to the query (similarity > 0), best first."""
+        with self._lock:
+            self._load()
+            if not self._entries or self._embedder_name != self.embedder.name:
+                return []
+            rels = sorted(self._entries, key=lambda rel: self._entries[rel]["row"])
+            query_vector = self.embedder.embed([query])[0]
+            limit = min(limit or len(rels), len(rels))
+            if np is None:
+                scored = [(rel, sum(a * b for a, b in zip(self._row(self._entries[rel]["row"]), query_vector)))
+                          for rel in rels]
+                return [item for item in sorted(scored, key=lambda item: -item[1])[:limit] if item[1] > 0]
+            if self._matrix is None:
+                packed = np.frombuffer(self._vectors, dtype=np.float32).reshape(-1, self._dim)
+                rows = [self._entries[rel]["row"] for rel in rels]
+                # Without free rows the packed buffer is used as is; otherwise the live rows are gathered
+                matrix = packed if len(rows) == len(packed) else packed[rows]
+                self._matrix = (matrix, rels)
+            matrix, matrix_rels = self._matrix
+            q = np.asarray(query_vector, dtype=np.float32)
+            if len(matrix_rels) >= VECTOR_IVF_MIN_ROWS:
+                rows, scores = self._search_ivf(q, limit)
+            else:
+                scores = matrix @ q
+                rows = np.argsort(-scores)[:limit]
+                scores = scores[rows]
+            return [(matrix_rels[int(row)], float(score)) for row, score in zip(rows, scores) if score > 0]
+
+    def _build_ivf(self):
+        matrix = self._matrix[0]
+        n_lists = max(1, int(math.sqrt(len(matrix))))
+        rng = np.random.default_rng(0)
+        centroids = matrix[rng.choice(len(matrix), n_lists, replace=False)]
+        for _ in range(10):  # Spherical k-means
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = matrix[assignment == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        lists = [np.flatnonzero(assignment == c) for c in range(n_lists)]
+        codes = np.clip(np.round(matrix * 127), -127, 127).astype(np.int8)  # Unit vectors: components in [-1, 1]
+        self._ivf = (centroids, lists, codes)
+
+    def _search_ivf(self, q, limit):
+        if self._ivf is None:
+            self._build_ivf()
+        centroids, lists, codes = self._ivf
+        probe = np.argsort(-(centroids @ q))[:VECTOR_IVF_NPROBE]
+        rows = np.concatenate([lists[c] for c in probe])
+        scores = (codes[rows].astype(np.float32) @ q) / 127.0
+        order = np.argsort(-scores)[:limit]
+        return rows[order], scores[order]